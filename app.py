@@ -1,393 +1,339 @@
-import datetime
 import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request, session, redirect, url_for, Response, flash
+from flask import Flask, render_template, request, session, redirect, url_for, Response, flash, stream_with_context, jsonify, g
 import secrets
-import uuid
-from cachelib import SimpleCache
-import traceback # For printing full tracebacks
-
+from instrumentation import configure_logging, observe_request, metrics_payload, setup_multiprocess_dir # Logging, stage timing, /metrics
+# Metrics of every web worker and parse-job process are pooled in one directory; unless configured, a new empty
+# one per app instance, so no samples of an earlier run are counted
+setup_multiprocess_dir()
+from result_cache import DiskFrameCache, CONTENT_HASH_CHUNK, new_content_hash, content_key # Arrow files on disk, shared by all workers
+from compressed_input import detect_compression # gzip/zstd/bz2/zip uploads are parsed as they decompress
+from parse_jobs import JobStore, run_parse_job, JOB_DONE, JOB_EMPTY, JOB_FAILED, JOB_FINISHED_STATES # Background parsing
+from sql_output import SQL_FORMATS, SQL_FORMAT_INSERT, DEFAULT_BATCH_ROWS, iter_sql # SQL/COPY output
+from pg_loader import load_dataframe # Direct COPY into Postgres (DATABASE_URL)
+from result_views import (VIEW_FILTERED, VIEW_DISPLAY, VIEW_SQL, VIEW_SUMMARY, DEFAULT_RESULTS_QUERY, InvalidQueryError,
+                          column_text, get_view) # Cached filtered/display/SQL/summary views
+from hotspots import STAGE_TOTAL_COLUMN, summary_json # Hotspot rollups for /summary
+from columnar_export import EXPORT_FORMATS, EXPORT_MIMETYPES, EXPORT_ROW_GROUP_ROWS, iter_export # Parquet/Arrow/CSV downloads
+from table_schema import TABLE_NAME, TABLE_SCHEMA
+
+configure_logging() # LOG_LEVEL=DEBUG for the parser's detail
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # --- Configuration ---
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024 # 50 Megabytes
-app.secret_key = secrets.token_hex(16)
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024 # 50 Megabytes (of compressed bytes for gzip/zstd/bz2/zip uploads)
+MAX_DECOMPRESSED_BYTES = int(os.environ.get('MAX_DECOMPRESSED_BYTES', 2 * 1024 * 1024 * 1024)) # Guards against zip bombs
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16) # Set SECRET_KEY when running several workers
 
 # --- Cache Setup ---
-cache = SimpleCache()
-CACHE_TIMEOUT = 3600 # 1 hour
-
-# --- VALID_COLUMNS definition (ensure it matches original script's intent) ---
-VALID_COLUMNS = {
-    # Copied directly from original script for consistency
-    'batch_queue_id', 'wait_milliseconds', 'source_table_name', 'total_batches_created',
-    'partition_pruned_batches', 'last_successful_merge_time', 'total_batches_ignored',
-    'max_integration_time_in_ms', 'avg_in_mem_compaction_time_in_ms',
-    'avg_batch_size_in_bytes', 'no_of_updates', 'no_of_inserts', 'total_events_merged',
-    'no_of_ddls', 'no_of_deletes', 'no_of_pkupdates', 'avg_event_count_per_batch',
-    'min_integration_time_in_ms', 'mapped_source_table', 'total_batches_queued',
-    'avg_compaction_time_in_ms', 'avg_waiting_time_in_queue_in_ms',
-    'avg_integration_time_in_ms', 'total_batches_uploaded', 'avg_merge_time_in_ms',
-    # Note: Original script prefixes keys *within* the loop, so VALID_COLUMNS
-    # should contain the *prefixed* keys expected from last_batch_info block
-    'last_batch_no_of_updates', 'last_batch_event_count', 'last_batch_no_of_inserts',
-    'last_batch_max_record_size', 'last_batch_total_events_merged', 'last_batch_no_of_ddls',
-    'last_batch_sequence_number', 'last_batch_size_in_bytes', 'last_batch_compaction_time_in_ms',
-    'last_batch_stage_resources_management_time_in_ms', 'last_batch_upload_time_in_ms',
-    'last_batch_merge_time_in_ms', 'last_batch_in_memory_compaction_time_in_ms',
-    'last_batch_pk_update_time_in_ms', 'last_batch_ddl_execution_time_in_ms',
-    'last_batch_total_integration_time_in_ms', 'last_batch_no_of_deletes',
-    'last_batch_no_of_pkupdates', 'last_batch_accumulation_time_in_ms',
-    # Add other possible prefixed keys if the original logic could generate them
-    'last_batch_avg_stage_resources_management_time_in_ms', # From previous flask attempt
-    'last_batch_avg_upload_time_in_ms', # From previous flask attempt
-    'last_batch_batch_event_count', # From previous flask attempt
-    'last_batch_max_record_size_in_batch',# From previous flask attempt
-    'last_batch_batch_sequence_number',# From previous flask attempt
-    'last_batch_batch_size_in_bytes',# From previous flask attempt
-    'last_batch_batch_accumulation_time_in_ms', # From previous flask attempt
-    'last_batch_avg_compaction_time_in_ms', # From previous flask attempt
-    'last_batch_avg_merge_time_in_ms', # From previous flask attempt
-    # IMPORTANT: Also include the marker keys if the original logic stored them
-    'last_batch_last_batch_info',
-    'last_batch_integration_task_time'
-}
-
-
-# --- Parser Function adjusted to closely match original logic ---
-def parse_log_stream(log_stream):
+CACHE_TIMEOUT = 3600 # 1 hour since last use
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'mon_result_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)) # LRU eviction above 2GB on disk
+CACHE_MEMORY_ENTRIES = 3 # Converted frames kept per process: the filtered, display and SQL views of one result
+cache = DiskFrameCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES, default_timeout=CACHE_TIMEOUT, memory_entries=CACHE_MEMORY_ENTRIES)
+
+# --- Content-addressed parse results ---
+# Identical input maps to the same cache key, so re-uploads skip parsing. Bump the version
+# whenever the parser's output changes; the DDL columns are part of the namespace too.
+PARSE_CACHE_VERSION = 2
+PARSE_CACHE_NAMESPACE = f"mon-parse-v{PARSE_CACHE_VERSION}|{TABLE_NAME}|{sorted(TABLE_SCHEMA.items())}".encode('utf-8')
+
+# --- Background parse jobs ---
+# /process spools the input to disk and hands it to a process pool, so parsing never holds
+# a web worker. Large inputs are additionally split across PARSE_WORKERS processes.
+PARALLEL_PARSE_MIN_BYTES = 16 * 1024 * 1024 # Inputs at least this big are parsed across a process pool
+PARSE_WORKERS = os.cpu_count() or 1
+JOB_WORKERS = int(os.environ.get('PARSE_JOB_WORKERS', 2)) # Parse jobs running at once (per web worker)
+JOBS_DIR = os.path.join(CACHE_DIR, 'jobs')
+jobs = JobStore(JOBS_DIR, max_age=CACHE_TIMEOUT)
+_job_executor = None
+_job_executor_lock = threading.Lock()
+
+def get_job_executor():
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is None:
+            _job_executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        return _job_executor
+
+def discard_job_executor(executor):
     """
-    Parses log data line-by-line from stream, closely matching original script's logic.
-    Returns a Pandas DataFrame.
+    Drops a pool broken by a dead worker process (e.g. killed for memory), so the next job
+    gets a new one. A pool that was already replaced is left alone.
     """
-    data_list = []
-    current_table_data = None
-    # Flags managed similar to original script
-    insideLastBatch = False
-    insideIntegrationTime = False # Note: Original script didn't seem to use this flag effectively after setting
-    line_number = 0
-    decode_errors = 0
-
-    print("DEBUG: Starting stream parsing (Revised Logic)...")
-
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is executor:
+            _job_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def submit_parse_job(job_id, spool_path, workers):
+    """Runs run_parse_job() for a created job on the job pool, on a new pool if the current one broke."""
+    args = (run_parse_job, JOBS_DIR, (cache.directory, cache.max_bytes, CACHE_TIMEOUT),
+            job_id, spool_path, workers, MAX_DECOMPRESSED_BYTES)
+    executor = get_job_executor()
     try:
-        for line_bytes in log_stream:
-            line_number += 1
-            try:
-                # Decode with fallback (same as before)
-                line = line_bytes.decode('utf-8').strip()
-            except UnicodeDecodeError:
-                try:
-                    line = line_bytes.decode('latin-1').strip()
-                except UnicodeDecodeError:
-                    if decode_errors < 5: print(f"Warning: Skipping line {line_number} due to undecodable bytes.")
-                    decode_errors += 1; continue
-
-            if not line: continue
-
-            # --- Use original script's startswith logic ---
-            # IMPORTANT: Replace the literal string here with the exact one from your ORIGINAL
-            # working script if it differs subtly (e.g., number of spaces)
-            # Using the one provided in the prompt:
-            original_header_start = '│                                             │   "'
-            original_kv_start = '│                                             │'
-
-            # Check for the start of a new table's data (matching original)
-            # Ensure we don't match the kv_start by checking for the extra '   "'
-            if line.startswith(original_header_start) and line.endswith('│'):
-                print(f"DEBUG: Line {line_number}: Matched Header") # DEBUG
-                # If we were processing a previous table, add its data to the list
-                if current_table_data:
-                    data_list.append(current_table_data)
-
-                # Start new table data
-                try:
-                    current_table_name = line.split('"')[1]
-                    current_table_data = {'source_table_name': current_table_name}
-                    # Reset flags for the new table
-                    insideLastBatch = False
-                    insideIntegrationTime = False # Resetting here seems logical, though original didn't explicitly
-                except IndexError:
-                    print(f"Warning: Line {line_number}: Could not extract table name from header: {line}")
-                    current_table_data = None # Invalidate current table if header parse fails
-                continue # Move to next line after processing header
-
-            # Extract key-value pairs from the lines (matching original)
-            elif line.startswith(original_kv_start) and line.endswith('│') and current_table_data is not None:
-                 # Check if it's potentially a header line misidentified (contains '"' near start)
-                if '   "' in line[len(original_kv_start):len(original_kv_start)+5]: # Basic check
-                     print(f"DEBUG: Line {line_number}: Skipped KV match, looks like header: {line}") # DEBUG
-                     continue
-
-                print(f"DEBUG: Line {line_number}: Matched Key-Value candidate") # DEBUG
-
-                # Original script's check `line.split(":") is not None` is always true if split succeeds
-                # The core check is the try/except around the split itself.
-                try:
-                    key_part, value_part = line.split(':', 1)  # Split only at the first colon
-                except ValueError:
-                    # Original script's handling of lines without a colon
-                    print(f"DEBUG: Line {line_number}: Skipping line without colon (ValueError): {line}") # DEBUG
-                    if insideIntegrationTime: # Original reset logic
-                        insideIntegrationTime = False
-                    elif insideLastBatch:
-                        insideLastBatch = False
-                    continue  # Move to the next line
-
-                # --- Process Key (matching original) ---
-                try:
-                    key = key_part.split('"')[1].strip().replace(" ", "_").replace('-', '_').lower()
-                except IndexError:
-                     print(f"Warning: Line {line_number}: Could not extract key from: {key_part}")
-                     continue # Skip if key extraction fails
-
-                # --- Process Value (matching original) ---
-                value = value_part.strip().replace(',', '').replace("│", "").replace('"', "").strip()
-
-                # --- State Management & Prefixing (matching original) ---
-                # Check flags *before* prefixing, based on the *unprefixed* key
-                is_last_batch_marker = "last_batch_info" == key # Use exact key match
-                is_integration_time_marker = "integration_task_time" == key # Use exact key match
-
-                if is_last_batch_marker:
-                    insideLastBatch = True
-                    # Original script didn't reset insideIntegrationTime here, seems correct?
-
-                if is_integration_time_marker:
-                     # Original script just set this flag, didn't seem conditional on insideLastBatch
-                     insideIntegrationTime = True
-
-                # Apply prefix *if* inside the block (original logic)
-                if insideLastBatch:
-                     # Add prefix, including to the marker keys themselves if stored
-                     key_to_store = "last_batch_" + key
-                else:
-                     key_to_store = key
-
-                # --- Value Conversion & Storage (matching original) ---
-                # Original script stored the marker keys with '{', let's skip storing '{' explicitly
-                if value != "{":
-                    processed_value = value # Start with the cleaned string value
-                    try:
-                        # 1. Try converting to integer (original order)
-                        processed_value = int(value)
-                    except ValueError:
-                        try:
-                            # 2. Try converting to datetime (original order)
-                            # Ensure value is a string for fromisoformat
-                            dt_value_str = str(value)
-                            if dt_value_str.endswith('Z'): dt_value_str = dt_value_str[:-1] + '+00:00'
-                            processed_value = datetime.datetime.fromisoformat(dt_value_str)
-                        except (ValueError, TypeError):
-                            # If both int and datetime fail, keep the cleaned string
-                            pass # processed_value remains the string 'value'
-
-                    # Store the processed key and value
-                    current_table_data[key_to_store] = processed_value
-                    print(f"DEBUG: Line {line_number}: Stored key='{key_to_store}', value='{processed_value}' (type: {type(processed_value)})") # DEBUG
-                else:
-                     # Handle the '{' value - original stored it, maybe we should too?
-                     # Or just use it as a marker and don't store? Let's skip storing '{'.
-                     print(f"DEBUG: Line {line_number}: Encountered '{{' for key='{key_to_store}', skipping storage of value.") # DEBUG
-                     # Optionally store a placeholder if needed: current_table_data[key_to_store] = None
-
-            # --- End of core parsing logic ---
-
-    except Exception as e:
-        print(f"ERROR: Exception during stream parsing near line {line_number}: {e}")
-        traceback.print_exc()
-        raise e # Re-raise to be caught by route handler
-    finally:
-        # Add the very last table's data if it exists
-        if current_table_data:
-            print("DEBUG: Appending last table data.") # DEBUG
-            data_list.append(current_table_data)
-        print(f"DEBUG: Finished stream parsing. Total lines read: {line_number}, Decode errors: {decode_errors}")
-
-    if not data_list:
-        print("DEBUG: No data extracted into list.")
-        return pd.DataFrame()
-
-    df = pd.DataFrame(data_list)
-    print(f"DEBUG: Created DataFrame with {len(df)} rows and columns: {df.columns.tolist()}")
-
-    # --- Type Conversion after DataFrame creation (keep previous robust logic) ---
-    # (This part can remain as it was, it's generally good practice)
-    for col in df.columns:
-         if df[col].dtype == 'object':
-            try:
-                converted_dt = pd.to_datetime(df[col], errors='coerce')
-                if not converted_dt.isna().all():
-                    df[col] = converted_dt
-                else:
-                     converted_num = pd.to_numeric(df[col], errors='coerce')
-                     if not converted_num.isna().all():
-                          # Check if converting to int makes sense (no decimals)
-                          if (converted_num == converted_num.round()).all():
-                              df[col] = converted_num.astype(pd.Int64Dtype()) # Use nullable Int
-                          else:
-                               df[col] = converted_num # Keep as float
-            except Exception as conversion_err:
-                 print(f"DEBUG: Error converting column {col} type post-creation: {conversion_err}")
-                 pass
-
-    print(f"DEBUG: DataFrame final dtypes:\n{df.dtypes}") # DEBUG
-    return df
-
-
-# --- SQL Generation Function (REVISED to match original script's logic) ---
-def generate_sql_inserts(df):
+        future = executor.submit(*args)
+    except BrokenProcessPool:
+        logger.warning("Parse job pool is broken; starting a new one")
+        discard_job_executor(executor)
+        executor = get_job_executor()
+        future = executor.submit(*args)
+    future.add_done_callback(lambda done: parse_job_finished(done, executor, job_id, spool_path))
+    return future
+
+def parse_job_finished(future, executor, job_id, spool_path):
     """
-    Generates PostgreSQL INSERT statements from a Pandas DataFrame,
-    mimicking the original script's formatting logic BUT skipping rows
-    where 'total_batches_created' is NaN/None.
-    WARNING: Still uses original script's potentially unsafe value formatting.
+    Marks a job failed if its process never got to record an outcome: the worker died and
+    broke the pool (which is then replaced), or run_parse_job() itself raised.
     """
-    if df is None or df.empty:
-        return "-- No data to generate INSERT statements for."
-
-    # TRUNCATE statement first
-    insert_statements = ["TRUNCATE TABLE public.process_queue_wait_times;"]
-
-    valid_columns = VALID_COLUMNS
-    valid_df_columns = [col for col in df.columns if col in valid_columns]
-
-    if not valid_df_columns:
-         print(f"WARN: No columns in DataFrame matched VALID_COLUMNS. DataFrame columns: {df.columns.tolist()}") # DEBUG
-         return "-- No valid columns found in the parsed data matching VALID_COLUMNS."
-
-    filtered_df = df[valid_df_columns]
-    print(f"DEBUG: Columns considered for SQL generation: {valid_df_columns}") # DEBUG
-
-    # Define the specific column to check for NaN
-    nan_check_column = 'total_batches_created'
-    rows_skipped = 0
-
-    # Iterate through each row of the filtered DataFrame
-    for index, row in filtered_df.iterrows():
-
-        # --- ADDED: Check for NaN in the specific column ---
-        # Check if the column exists in this row's index (it should) and if the value is NaN/None
-        if nan_check_column in row.index and pd.isna(row[nan_check_column]):
-            rows_skipped += 1
-            print(f"DEBUG: Skipping SQL for row index {index} because '{nan_check_column}' is NaN/None.") # DEBUG
-            continue # Skip the rest of the loop for this row
-        # --- End NaN Check ---
-
-        # --- If the row is kept, proceed with mimicking Original Script's Logic ---
-        row_data = row # Use the full row Series
-        columns = ', '.join(row_data.index) # No quotes on columns
-        values_list = []
-        for value in row_data.values:
-            if isinstance(value, str):
-                # Original logic: No quote escaping
-                values_list.append(f"'{value}'")
-            else:
-                # Original logic: Use str() for everything else (None->'None', NaN->'nan', etc.)
-                values_list.append(str(value))
-
-        values = ', '.join(values_list)
-        insert_statement = f"INSERT INTO public.process_queue_wait_times ({columns}) VALUES ({values});"
-        insert_statements.append(insert_statement)
-        # --- End Mimic Original Logic ---F
-
-    if rows_skipped > 0:
-        print(f"DEBUG: Skipped generating SQL for {rows_skipped} rows due to NaN in '{nan_check_column}'.")
-        # Optionally add a comment to the SQL output
-        insert_statements.append(f"-- Note: Skipped {rows_skipped} rows where '{nan_check_column}' was missing.")
+    if future.cancelled():
+        error = "The parse job was cancelled."
+    else:
+        e = future.exception()
+        if e is None:
+            return
+        if isinstance(e, BrokenProcessPool):
+            logger.error("Parse job %s: the worker process died; replacing the job pool", job_id)
+            discard_job_executor(executor)
+            error = "The parse worker process died (e.g. it ran out of memory). Please try again."
+        else:
+            logger.error("Parse job %s failed: %s", job_id, e)
+            error = str(e)
+    job = jobs.get(job_id)
+    if job is None or job['status'] not in JOB_FINISHED_STATES:
+        jobs.update(job_id, status=JOB_FAILED, error=error, finished=time.time())
+    try:
+        os.remove(spool_path) # The job removes it, unless its process died first
+    except OSError:
+        pass
 
-    return "\n".join(insert_statements)
+def spool_upload(file):
+    """
+    Copies an uploaded file to a temporary file, hashing it in the same pass.
+    Returns (cache key, spool path, size); the caller removes the file (or hands it to a job).
+    """
+    log_stream = file.stream
+    log_stream.seek(0)
+    hasher = new_content_hash(PARSE_CACHE_NAMESPACE)
+    upload_size = 0
+    with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as spool_file:
+        while True:
+            chunk = log_stream.read(CONTENT_HASH_CHUNK)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            spool_file.write(chunk)
+            upload_size += len(chunk)
+    return content_key(hasher), spool_file.name, upload_size
+
+def spool_bytes(data):
+    """Same as spool_upload() for in-memory input (pasted text)."""
+    hasher = new_content_hash(PARSE_CACHE_NAMESPACE)
+    hasher.update(data)
+    with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as spool_file:
+        spool_file.write(data)
+    return content_key(hasher), spool_file.name, len(data)
+
+def start_parse_job(source_description, cache_key, spool_path, size):
+    """Queues a background parse of spool_path (the job removes it) and returns the job id."""
+    compression = detect_compression(spool_path) # Compressed input is parsed as one stream
+    workers = PARSE_WORKERS if PARSE_WORKERS >= 2 and size >= PARALLEL_PARSE_MIN_BYTES and not compression else 1
+    if compression:
+        source_description = f"{source_description} ({compression})"
+    job_id = jobs.create(source_description, size, cache_key)
+    submit_parse_job(job_id, spool_path, workers)
+    logger.info("Queued parse job %s for %s (%d bytes, %d workers)", job_id, source_description, size, workers)
+    return job_id
 
 # --- Flask Routes (No changes needed from previous) ---
 @app.route('/', methods=['GET'])
 def index():
-    old_key = session.pop('parsed_data_key', None)
-    if old_key: cache.delete(old_key)
+    # Parsed results are shared by content hash, so leave them to the cache's LRU/timeout
+    session.pop('parsed_data_key', None)
+    session.pop('results_query', None)
     return render_template('index.html')
 
 @app.route('/process', methods=['POST'])
 def process_logs():
-    log_stream = None; source_description = ""
+    log_stream = None; file = None; source_description = ""
     if 'log_file' in request.files and request.files['log_file'].filename != '':
-        file = request.files['log_file']; print(f"DEBUG: Processing uploaded file: {file.filename}")
+        file = request.files['log_file']; logger.debug("Processing uploaded file: %s", file.filename)
         source_description = f"uploaded file '{file.filename}'"; log_stream = file.stream
         if not hasattr(log_stream, 'read'):
              flash(f"Error: Could not get a readable stream from uploaded file '{file.filename}'.", "error")
-             print(f"ERROR: Uploaded file object for {file.filename} lacks read method.")
+             logger.error("Uploaded file object for %s lacks read method.", file.filename)
              return redirect(url_for('index'))
     elif 'log_text' in request.form and request.form['log_text'].strip():
-        log_content = request.form['log_text']; print("DEBUG: Processing pasted text.")
-        source_description = "pasted text"; log_stream = io.BytesIO(log_content.encode('utf-8'))
+        log_content = request.form['log_text']; logger.debug("Processing pasted text.")
+        log_bytes = log_content.encode('utf-8')
+        source_description = "pasted text"; log_stream = io.BytesIO(log_bytes)
     else:
         flash("No input provided. Please paste log content or upload a file.", "warning")
-        print("DEBUG: No valid file or text input detected.")
+        logger.debug("No valid file or text input detected.")
         return redirect(url_for('index'))
     if log_stream:
+        spool_path = None
         try:
-            print(f"DEBUG: Calling parse_log_stream for {source_description}")
-            parsed_df = parse_log_stream(log_stream)
-            print(f"DEBUG: Parsing returned DataFrame with {len(parsed_df)} rows.")
-            if parsed_df.empty:
-                 flash(f"Parsing completed, but no valid table data was found in {source_description}. Please check the log format.", "warning")
-                 print(f"DEBUG: Parsing successful but resulted in empty DataFrame for {source_description}")
-                 return redirect(url_for('index'))
-            cache_key = str(uuid.uuid4())
-            cache.set(cache_key, parsed_df, timeout=CACHE_TIMEOUT)
-            session['parsed_data_key'] = cache_key
-            print(f"DEBUG: Stored DataFrame in cache with key {cache_key}")
-            flash(f"Successfully parsed {source_description}. Found {len(parsed_df)} records.", "success")
-            return redirect(url_for('results'))
+            # Content-addressed key: the same bytes always map to the same cached result
+            if file is not None:
+                cache_key, spool_path, size = spool_upload(file)
+            else:
+                cache_key, spool_path, size = spool_bytes(log_bytes)
+            parsed_df = get_view(cache, cache_key, VIEW_SQL) # Same rows as the raw frame, without decoding extra_fields
+            if parsed_df is not None:
+                cache.count('content_hits')
+                session['parsed_data_key'] = cache_key
+                logger.info("Content cache hit for %s (key %s), skipping parse", source_description, cache_key)
+                flash(f"Loaded {source_description} from cache (identical input parsed before). Found {len(parsed_df)} records.", "success")
+                if wants_json():
+                    return jsonify(status=JOB_DONE, cache_hit=True, results_url=url_for('results'))
+                return redirect(url_for('results'))
+            cache.count('content_misses')
+
+            job_id = start_parse_job(source_description, cache_key, spool_path, size)
+            spool_path = None # Owned by the job now
+            if wants_json():
+                return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id),
+                               progress_url=url_for('job_progress', job_id=job_id)), 202
+            return redirect(url_for('job_progress', job_id=job_id))
         except Exception as e:
             flash(f"An error occurred while processing {source_description}. Please check logs for details.", "error")
-            print(f"ERROR: Exception during processing of {source_description}: {e}")
-            traceback.print_exc()
+            logger.exception("Exception during processing of %s", source_description)
             return redirect(url_for('index'))
         finally:
+             if spool_path is not None:
+                  os.remove(spool_path)
              if hasattr(log_stream, 'close') and callable(log_stream.close):
-                  try: log_stream.close(); print("DEBUG: Input stream closed.")
-                  except Exception as close_err: print(f"Warning: Could not close stream: {close_err}")
+                  try: log_stream.close(); logger.debug("Input stream closed.")
+                  except Exception as close_err: logger.warning("Could not close stream: %s", close_err)
     else:
         flash("Failed to obtain input stream.", "error"); return redirect(url_for('index'))
 
+def wants_json():
+    """True for API clients (Accept: application/json) rather than the HTML form."""
+    return request.accept_mimetypes.best == 'application/json'
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a parse job: state, bytes consumed, lines, tables found and elapsed seconds."""
+    job = jobs.get(job_id) if job_id.isalnum() else None
+    if job is None: return jsonify(error=f"Unknown job {job_id}"), 404
+    job['results_url'] = url_for('job_open', job_id=job_id) if job['status'] in JOB_FINISHED_STATES else None
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/progress', methods=['GET'])
+def job_progress(job_id):
+    """Progress page; polls /jobs/<id> and moves on to the results when the job finishes."""
+    job = jobs.get(job_id) if job_id.isalnum() else None
+    if job is None:
+        flash("Parse job not found. It may have expired; please submit logs again.", "warning")
+        return redirect(url_for('index'))
+    return render_template('progress.html', job=job)
+
+@app.route('/jobs/<job_id>/open', methods=['GET'])
+def job_open(job_id):
+    """Attaches a finished job's result to the session and shows it."""
+    job = jobs.get(job_id) if job_id.isalnum() else None
+    if job is None:
+        flash("Parse job not found. It may have expired; please submit logs again.", "warning")
+        return redirect(url_for('index'))
+    if job['status'] == JOB_DONE:
+        session['parsed_data_key'] = job['cache_key']
+        flash(f"Successfully parsed {job['source']}. Found {job['records']} records.", "success")
+        return redirect(url_for('results'))
+    if job['status'] == JOB_EMPTY:
+        flash(f"Parsing completed, but no valid table data was found in {job['source']}. Please check the log format.", "warning")
+        return redirect(url_for('index'))
+    if job['status'] == JOB_FAILED:
+        flash(f"An error occurred while processing {job['source']}: {job['error']}", "error")
+        return redirect(url_for('index'))
+    return redirect(url_for('job_progress', job_id=job_id))
+
+# --- Results table (DataTables server-side processing) ---
+# Filtering, display text and the SQL projection are cached views of the parsed frame (result_views.py)
+
+def results_query():
+    """The results filter chosen on the results page (a pandas expression), or the default."""
+    return session.get('results_query', DEFAULT_RESULTS_QUERY)
+
+def search_results(display, search_value, searchable_columns):
+    """Rows of the display view where any searchable column contains search_value (case-insensitive substring)."""
+    matches = np.zeros(len(display), dtype=bool)
+    for col in searchable_columns:
+        values = display[col]
+        text = values if values.dtype == object else column_text(values) # Display text is ready for all but numbers
+        matches |= text.str.contains(search_value, case=False, regex=False, na=False).to_numpy(dtype=bool)
+    return matches
+
+def sort_results(df, order):
+    """Sorts by [(column, ascending), ...], missing values last."""
+    if not order:
+        return df
+    columns = [col for col, _ in order]
+    ascending = [asc for _, asc in order]
+    try:
+        return df.sort_values(columns, ascending=ascending, na_position='last', kind='stable')
+    except TypeError: # Mixed types (e.g. extra_fields dicts): fall back to their text
+        return df.sort_values(columns, ascending=ascending, na_position='last', kind='stable',
+                              key=lambda values: values if pd.api.types.is_numeric_dtype(values.dtype) else values.astype(str))
+
+def parse_datatables_args(args, columns):
+    """
+    Reads the DataTables server-side request (draw, start, length, search[value],
+    order[i][column]/[dir], columns[i][searchable]).
+    """
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 10, type=int)
+    search_value = args.get('search[value]', '').strip()
+    searchable = [col for i, col in enumerate(columns) if args.get(f'columns[{i}][searchable]', 'true') != 'false']
+    order = []
+    i = 0
+    while f'order[{i}][column]' in args:
+        col_index = args.get(f'order[{i}][column]', type=int)
+        if col_index is not None and 0 <= col_index < len(columns):
+            order.append((columns[col_index], args.get(f'order[{i}][dir]', 'asc') != 'desc'))
+        i += 1
+    return draw, start, length, search_value, searchable, order
+
 @app.route('/results', methods=['GET'])
 def results():
     """
-    Retrieves data from cache, filters it, and prepares data for display
-    with specified default visible columns.
+    Renders the results page shell (headers and default visible columns).
+    Rows are fetched page by page from /results/data.
     """
     cache_key = session.get('parsed_data_key')
     if not cache_key:
         flash("No parsed data key found in session. Please submit logs first.", "info")
         return redirect(url_for('index'))
 
+    if 'filter' in request.args: # Filter form: a pandas expression, e.g. total_batches_queued > 100
+        query = request.args.get('filter', '').strip()
+        try:
+            get_view(cache, cache_key, VIEW_FILTERED, query) # Validates it and caches the view
+            session['results_query'] = query
+        except InvalidQueryError as e:
+            flash(f"Filter not applied: {e}", "error")
+        return redirect(url_for('results'))
+
     try:
-        df = cache.get(cache_key)
+        df = get_view(cache, cache_key, VIEW_FILTERED, results_query())
         if df is None:
             flash("Parsed data has expired or was not found in cache. Please submit logs again.", "warning")
             session.pop('parsed_data_key', None)
             return redirect(url_for('index'))
-
-        print(f"DEBUG: DataFrame shape before filtering: {df.shape}")
-
-        # --- Filtering Step (remains the same) ---
-        filter_column = 'total_batches_created'
-        if filter_column in df.columns:
-            original_rows = len(df)
-            rows_to_keep = df[filter_column].notna()
-            df_filtered = df[rows_to_keep].copy()
-            filtered_rows = len(df_filtered)
-            rows_removed = original_rows - filtered_rows
-            print(f"DEBUG: Filtering on '{filter_column}'. Removed {rows_removed} rows with missing values.")
-            # Don't flash here, maybe flash only if all removed?
-            # if rows_removed > 0:
-            #     flash(f"Filtered out {rows_removed} records with missing '{filter_column}'.", "info")
-            df = df_filtered
-        else:
-            print(f"DEBUG: Filter column '{filter_column}' not found, skipping filter.")
-            # flash(f"Warning: Column '{filter_column}' not found, cannot filter by it.", "warning")
-        # --- End Filtering Step ---
-
-        print(f"DEBUG: DataFrame shape after filtering: {df.shape}")
+        logger.debug("Filtered view shape: %s", df.shape)
 
         # Define the columns that should be VISIBLE BY DEFAULT
         # ** IMPORTANT: Verify these names EXACTLY match columns in your DataFrame **
@@ -405,45 +351,178 @@ def results():
         if df.empty:
              flash("No data remaining after filtering.", "warning")
              header_info = []
-             data_for_table = []
              actual_default_columns = [] # Pass empty list if no data
         else:
              # Check which requested default columns actually exist in the df
              actual_default_columns = [col for col in default_visible_columns if col in df.columns]
              if len(actual_default_columns) < len(default_visible_columns):
                   missing_defaults = set(default_visible_columns) - set(actual_default_columns)
-                  print(f"WARN: Some requested default columns not found in DataFrame: {missing_defaults}")
+                  logger.warning("Some requested default columns not found in DataFrame: %s", missing_defaults)
                   flash(f"Warning: Some default columns were not found: {', '.join(missing_defaults)}", "warning")
 
              # Prepare header info (needed for dropdowns and potentially colvis text)
              header_info = [{'name': header, 'index': i} for i, header in enumerate(df.columns)]
-             # Prepare data for table body
-             data_for_table = df.applymap(lambda x: None if pd.isna(x) else x).values.tolist()
 
-        # Pass header_info, data, and the list of *actual* default column names
+        # Pass header_info and the list of *actual* default column names; rows come from /results/data
         return render_template('results.html',
                                header_info=header_info,
-                               data=data_for_table,
-                               default_columns=actual_default_columns) # Pass the validated list
+                               default_columns=actual_default_columns, # Pass the validated list
+                               results_query=results_query(), default_query=DEFAULT_RESULTS_QUERY)
 
     except Exception as e:
         flash(f"Error loading results: {e}", "error")
-        print("ERROR loading results:")
-        traceback.print_exc()
+        logger.exception("Error loading results")
         return redirect(url_for('index'))
 
 
+@app.route('/results/data', methods=['GET'])
+def results_data():
+    """
+    DataTables server-side endpoint: pages, searches and sorts the cached frame
+    and returns only the requested page as {draw, recordsTotal, recordsFiltered, data}.
+    """
+    draw = request.args.get('draw', 0, type=int)
+    cache_key = session.get('parsed_data_key')
+    try:
+        df = get_view(cache, cache_key, VIEW_FILTERED, results_query()) if cache_key else None
+        display = get_view(cache, cache_key, VIEW_DISPLAY, results_query()) if df is not None else None
+        if display is None:
+            return jsonify(draw=draw, recordsTotal=0, recordsFiltered=0, data=[],
+                           error="Parsed data has expired or was not found in cache. Please submit logs again.")
+        columns = list(df.columns)
+        draw, start, length, search_value, searchable, order = parse_datatables_args(request.args, columns)
+        records_total = len(df)
+        if search_value:
+            df = df[search_results(display, search_value, searchable)]
+        df = sort_results(df, order) # On the typed values; the page's text comes from the display view
+        rows = df.index[start:] if length < 0 else df.index[start:start + length]
+        # pandas serializes the page (NaN/NA -> null) without a Python call per cell
+        body = (f'{{"draw": {draw}, "recordsTotal": {records_total}, "recordsFiltered": {len(df)}, '
+                f'"data": {display.loc[rows].to_json(orient="values")}}}')
+        return Response(body, mimetype='application/json')
+    except Exception as e:
+        logger.exception("Error serving results page")
+        return jsonify(draw=draw, recordsTotal=0, recordsFiltered=0, data=[], error=f"Error loading results: {e}")
+
+
+@app.route('/summary', methods=['GET'])
+def summary():
+    """Hotspot summary of the filtered rows: worst tables per metric, percentiles, breakdowns, stage shares."""
+    cache_key = session.get('parsed_data_key')
+    if not cache_key:
+        flash("No parsed data key found in session. Please submit logs first.", "info")
+        return redirect(url_for('index'))
+    try:
+        frame = get_view(cache, cache_key, VIEW_SUMMARY, results_query())
+    except InvalidQueryError as e: # A filter saved before the data was evicted and re-parsed
+        flash(f"Filter not applied: {e}", "error")
+        return redirect(url_for('results'))
+    if frame is None:
+        flash("Parsed data has expired or was not found in cache. Please submit logs again.", "warning")
+        session.pop('parsed_data_key', None)
+        return redirect(url_for('index'))
+    return render_template('summary.html', summary=json.loads(summary_json(frame)), results_query=results_query(),
+                           stage_total_column=STAGE_TOTAL_COLUMN)
+
+@app.route('/summary/data', methods=['GET'])
+def summary_data():
+    """The hotspot summary as JSON, served as cached (computed once per result and filter)."""
+    cache_key = session.get('parsed_data_key')
+    if not cache_key: return jsonify(error="No parsed data key found in session."), 404
+    try:
+        frame = get_view(cache, cache_key, VIEW_SUMMARY, results_query())
+    except InvalidQueryError as e:
+        return jsonify(error=str(e)), 400
+    if frame is None: return jsonify(error="Parsed data has expired or was not found in cache."), 404
+    return Response(summary_json(frame), mimetype='application/json')
+
+
 @app.route('/get_sql', methods=['GET'])
 def get_sql():
+    """
+    Streams the load script for the cached data. Query parameters:
+    format: one of SQL_FORMATS (default 'insert'), batch_size: rows per multi-row INSERT,
+    delete_missing: 1 to have the 'merge' script delete tables missing from this output.
+    """
     cache_key = session.get('parsed_data_key')
     if not cache_key: return Response("-- No parsed data key found in session.", mimetype='text/plain', status=404)
+    sql_format = request.args.get('format', SQL_FORMAT_INSERT)
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_ROWS, type=int)
+    delete_missing = request.args.get('delete_missing') == '1'
+    if sql_format not in SQL_FORMATS or batch_size < 1:
+        return Response(f"-- Unsupported format '{sql_format}' or batch size {batch_size}. Formats: {', '.join(SQL_FORMATS)}", mimetype='text/plain', status=400)
     try:
-        df = cache.get(cache_key)
+        df = get_view(cache, cache_key, VIEW_SQL)
         if df is None: return Response("-- Parsed data has expired or was not found in cache.", mimetype='text/plain', status=404)
-        sql_statements = generate_sql_inserts(df)
-        return Response(sql_statements, mimetype='text/plain')
+        # Stream the script block by block (chunked transfer) instead of building one big string
+        return Response(stream_with_context(iter_sql(df, sql_format, batch_size, delete_missing)), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename=process_queue_wait_times_{sql_format}.sql'})
     except Exception as e:
-        print(f"Error generating SQL: {e}"); traceback.print_exc(); return Response(f"-- Error generating SQL: {e}", mimetype='text/plain', status=500)
+        logger.exception("Error generating SQL"); return Response(f"-- Error generating SQL: {e}", mimetype='text/plain', status=500)
+
+@app.route('/export/<export_format>', methods=['GET'])
+def export_results(export_format):
+    """
+    Streams the cached, filtered data as a typed columnar file (one of EXPORT_FORMATS),
+    one row group per chunk. Query parameter row_group_rows: rows per row group.
+    """
+    cache_key = session.get('parsed_data_key')
+    if not cache_key: return Response("No parsed data key found in session.", mimetype='text/plain', status=404)
+    row_group_rows = request.args.get('row_group_rows', EXPORT_ROW_GROUP_ROWS, type=int)
+    if export_format not in EXPORT_FORMATS or row_group_rows < 1:
+        return Response(f"Unsupported export format '{export_format}' or row group size {row_group_rows}. Formats: {', '.join(EXPORT_FORMATS)}", mimetype='text/plain', status=400)
+    try:
+        df = get_view(cache, cache_key, VIEW_FILTERED, results_query()) # Exactly the rows the results page shows
+        if df is None: return Response("Parsed data has expired or was not found in cache.", mimetype='text/plain', status=404)
+        return Response(stream_with_context(iter_export(df, export_format, row_group_rows, filter_rows=False)), mimetype=EXPORT_MIMETYPES[export_format],
+                        headers={'Content-Disposition': f'attachment; filename=process_queue_wait_times.{export_format}'})
+    except Exception as e:
+        logger.exception("Error exporting results"); return Response(f"Error exporting results: {e}", mimetype='text/plain', status=500)
+
+@app.route('/load', methods=['POST'])
+def load_to_postgres():
+    """
+    Loads the cached data straight into Postgres (DATABASE_URL) and reports the load rate as JSON.
+    Form fields: mode 'replace' (default: TRUNCATE + COPY) or 'merge' (upsert changed rows, with
+    inserted/updated/unchanged/deleted counts), delete_missing: 1 to delete tables missing when merging.
+    """
+    cache_key = session.get('parsed_data_key')
+    if not cache_key: return jsonify(error="No parsed data key found in session."), 404
+    mode = request.form.get('mode', 'replace')
+    if mode not in ('replace', 'merge'): return jsonify(error=f"Unsupported load mode '{mode}'."), 400
+    df = get_view(cache, cache_key, VIEW_SQL)
+    if df is None: return jsonify(error="Parsed data has expired or was not found in cache."), 404
+    try:
+        return jsonify(load_dataframe(df, merge=mode == 'merge', delete_missing=request.form.get('delete_missing') == '1'))
+    except (RuntimeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        logger.exception("Error loading into Postgres"); return jsonify(error=f"Error loading into Postgres: {e}"), 500
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters and disk usage of the result cache (shared by all workers)."""
+    return jsonify(cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage timing histograms, parse counters and request latency."""
+    try:
+        body, content_type = metrics_payload()
+    except RuntimeError as e:
+        return Response(f"# {e}\n", mimetype='text/plain', status=501)
+    return Response(body, content_type=content_type)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe_request(request.endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
@@ -0,0 +1,152 @@
+import glob
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from log_parser import STREAM_BATCH_ROWS, ColumnarLogParser, TypedColumnBuilder, parse_log_file, iter_record_batches
+from compressed_input import open_log_input
+from table_schema import SOURCE_FILE_COLUMN, NODE_COLUMN, TAG_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# --- Multi-file ingestion (e.g. a directory of dumps from every node of a cluster) ---
+# Files are parsed concurrently, one per worker process, and merged in input order, so the
+# output is the same whatever the worker count. Each record is tagged with its file and node.
+_GLOB_CHARS = re.compile(r'[*?\[]')
+_COMPRESSED_SUFFIXES = ('.gz', '.zst', '.bz2', '.zip')
+MB = 1024 * 1024
+
+
+def expand_inputs(patterns):
+    """
+    Expands paths and glob patterns ('dumps/*/mon_*.txt', '**' for subdirectories) into a list
+    of files: each pattern's matches sorted, duplicates dropped. A pattern matching nothing is an error.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if _GLOB_CHARS.search(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+            if not matches:
+                raise FileNotFoundError(f"No files match {pattern}")
+        else:
+            matches = [pattern]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def node_name(path, node_pattern=None):
+    """
+    The node a dump came from: the 'node' group (or the first group, or the whole match) of
+    node_pattern searched in the path (with '/' separators), else the file name without extensions.
+    """
+    if node_pattern:
+        match = re.search(node_pattern, path.replace(os.sep, '/'))
+        if match:
+            if 'node' in match.re.groupindex:
+                return match.group('node')
+            return match.group(1) if match.re.groups else match.group(0)
+        logger.warning("Node pattern %r does not match %s; using the file name", node_pattern, path)
+    name = os.path.basename(path)
+    if name.endswith(_COMPRESSED_SUFFIXES):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[0]
+
+
+def _parse_input(path):
+    """Worker: parses a whole file (plain or compressed) into a TypedColumnBuilder. Returns (builder, stats)."""
+    started = time.perf_counter()
+    builder = TypedColumnBuilder()
+    parser = ColumnarLogParser(builder)
+    with open_log_input(path) as log_stream:
+        parser.feed(log_stream)
+    parser.finish()
+    return builder, {'path': path, 'bytes': os.path.getsize(path), 'lines': parser.line_number,
+                     'tables': builder.row_count, 'seconds': time.perf_counter() - started}
+
+
+def parse_inputs(paths, workers=1, node_pattern=None, tag=True):
+    """
+    Parses several mon output files into one DataFrame, records in input order.
+    A single file is split across the workers (see parse_log_file()); several files are
+    parsed one per worker. With tag=True, SOURCE_FILE_COLUMN and NODE_COLUMN say where each
+    record came from. Returns (DataFrame, per-file stats: path, bytes, lines, tables, seconds).
+    """
+    if len(paths) == 1:
+        path = paths[0]
+        started = time.perf_counter()
+        totals = [0, 0]
+
+        def progress(_, lines, tables):
+            totals[:] = lines, tables
+
+        df = parse_log_file(path, workers=workers, progress=progress)
+        stats = [{'path': path, 'bytes': os.path.getsize(path), 'lines': totals[0], 'tables': len(df),
+                  'seconds': time.perf_counter() - started}]
+    else:
+        workers = min(workers or os.cpu_count() or 1, len(paths))
+        logger.info("Parsing %d files with %d workers", len(paths), workers)
+        if workers == 1:
+            results = [_parse_input(path) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # map() hands the results back in input order, however the files finish
+                results = list(pool.map(_parse_input, paths))
+        stats = [file_stats for _, file_stats in results]
+        builder = results[0][0]
+        for other, _ in results[1:]:
+            builder.merge(other)
+        df = builder.to_dataframe()
+    if tag and not df.empty:
+        row_counts = [file_stats['tables'] for file_stats in stats]
+        df[SOURCE_FILE_COLUMN] = np.array([file_stats['path'] for file_stats in stats], dtype=object).repeat(row_counts)
+        df[NODE_COLUMN] = np.array([node_name(file_stats['path'], node_pattern) for file_stats in stats],
+                                   dtype=object).repeat(row_counts)
+    return df, stats
+
+
+def iter_input_batches(paths, batch_rows=STREAM_BATCH_ROWS, node_pattern=None, tag=True, stats=None):
+    """
+    Streaming counterpart of parse_inputs(): yields the records of the files, one after the
+    other, as DataFrame batches of about batch_rows records (log_parser.iter_record_batches()),
+    tagged like parse_inputs() does. Without tag, the tag columns are left out of every batch.
+    Per-file stats are appended to the stats list, if given, as each file finishes.
+    """
+    for path in paths:
+        started = time.perf_counter()
+        totals = [0, 0]
+
+        def progress(_, lines, tables):
+            totals[:] = lines, tables
+
+        node = node_name(path, node_pattern) if tag else None
+        with open_log_input(path) as log_stream:
+            for batch in iter_record_batches(log_stream, batch_rows, progress):
+                if tag:
+                    batch[SOURCE_FILE_COLUMN] = path
+                    batch[NODE_COLUMN] = node
+                else:
+                    batch = batch.drop(columns=TAG_COLUMNS, errors='ignore')
+                yield batch
+        if stats is not None:
+            stats.append({'path': path, 'bytes': os.path.getsize(path), 'lines': totals[0], 'tables': totals[1],
+                          'seconds': time.perf_counter() - started})
+
+
+def format_summary(stats, seconds):
+    """Per-file throughput table, then the totals over the wall-clock time of the whole run."""
+    width = max([len('file')] + [len(file_stats['path']) for file_stats in stats])
+    lines = [f"{'file':<{width}}  {'MB':>9}  {'lines':>10}  {'tables':>8}  {'seconds':>8}  {'MB/s':>8}"]
+    for file_stats in stats:
+        size_mb = file_stats['bytes'] / MB
+        lines.append(f"{file_stats['path']:<{width}}  {size_mb:9.1f}  {file_stats['lines']:10d}  {file_stats['tables']:8d}  "
+                     f"{file_stats['seconds']:8.2f}  {size_mb / max(file_stats['seconds'], 1e-9):8.1f}")
+    total_mb = sum(file_stats['bytes'] for file_stats in stats) / MB
+    lines.append(f"{f'total ({len(stats)} files)':<{width}}  {total_mb:9.1f}  {sum(s['lines'] for s in stats):10d}  "
+                 f"{sum(s['tables'] for s in stats):8d}  {seconds:8.2f}  {total_mb / max(seconds, 1e-9):8.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,335 @@
+import argparse
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from log_parser import (parse_log_stream, parse_log_stream_reference, parse_log_records, parse_log_file, build_dataframe,
+                        iter_record_batches, STREAM_BATCH_ROWS)
+from mon_generator import MonOutputGenerator
+from sql_output import SQL_FORMATS, SQL_FORMAT_COPY_TEXT, iter_sql
+from columnar_export import EXPORT_FORMATS, iter_export
+from hotspots import hotspot_summary
+from instrumentation import configure_logging
+
+try:
+    import resource
+except ImportError: # Windows: no peak RSS
+    resource = None
+
+# --- Benchmarks for parsing, SQL generation and the web flow ---
+# Results go to a JSON file per run, so runs can be compared across commits with --compare.
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmark_results') # Next to this script, wherever it is run from
+DEFAULT_TABLES = 5000
+DEFAULT_REPEAT = 3
+JOB_POLL_SECONDS = 0.05
+STREAM_RSS_LIMIT_MB = 512 # What --stream must stay under, however large the dump
+BENCHMARK_LOG_LEVEL = 'WARNING' # Keep the parser's logging out of the timings
+# parse_log_stream() must be 10x faster than the parser it replaced, which ran about 2.2x slower than the
+# per-line reference kept in log_parser; the ratio is measured against the reference, which still ships
+PARSE_SPEEDUP_TARGET = 4.5
+MB = 1024 * 1024
+
+
+def best_of(repeat, func, *args):
+    """Runs func repeat times; returns (fastest seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def max_rss_mb():
+    """Peak RSS of this process in MB (None where unavailable)."""
+    # Linux: VmHWM starts over at exec, unlike ru_maxrss, which a spawned child inherits from its parent
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB elsewhere
+
+
+def fresh_process():
+    """
+    A one-process pool started with spawn (a new interpreter), logging like this process: each
+    line once, in the same format, instead of through logging's unformatted last-resort handler.
+    """
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=configure_logging, initargs=(BENCHMARK_LOG_LEVEL,))
+
+
+def _parse_peak_rss(path):
+    """Runs in a fresh process: peak RSS before and after parsing path."""
+    baseline = max_rss_mb()
+    with open(path, 'rb') as log_stream:
+        rows = len(parse_log_stream(log_stream))
+    return baseline, max_rss_mb(), rows
+
+
+def _stream_peak_rss(path, batch_rows):
+    """Runs in a fresh process: peak RSS before and after streaming path to COPY text (discarded)."""
+    baseline = max_rss_mb()
+    started = time.perf_counter()
+    rows = [0]
+
+    def batches():
+        with open(path, 'rb') as log_stream:
+            for batch in iter_record_batches(log_stream, batch_rows):
+                rows[0] += len(batch)
+                yield batch
+
+    with open(os.devnull, 'w', encoding='utf-8') as sink:
+        for chunk in iter_sql(batches(), SQL_FORMAT_COPY_TEXT):
+            sink.write(chunk)
+    return baseline, max_rss_mb(), rows[0], time.perf_counter() - started
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=REPO_DIR).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True, cwd=REPO_DIR).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+# --- Individual benchmarks ---
+def bench_parse(data, repeat, target=PARSE_SPEEDUP_TARGET):
+    """
+    parse_log_stream() end to end, its speedup over the per-line reference parser (to the same
+    DataFrame), then the record path's two halves: the state machine and the typed DataFrame build.
+    """
+    size_mb = len(data) / MB
+    seconds, df = best_of(repeat, lambda: parse_log_stream(io.BytesIO(data)))
+    reference_seconds, _ = best_of(repeat, lambda: build_dataframe(parse_log_stream_reference(io.BytesIO(data))))
+    records_seconds, records = best_of(repeat, parse_log_records, [data])
+    build_seconds, _ = best_of(repeat, build_dataframe, records)
+    return df, {
+        'parse_stream': {'seconds': seconds, 'mb_per_second': size_mb / seconds, 'rows': len(df),
+                         'speedup_vs_reference': reference_seconds / seconds, 'target_speedup': target},
+        'parse_reference': {'seconds': reference_seconds, 'mb_per_second': size_mb / reference_seconds},
+        'parse_records': {'seconds': records_seconds, 'mb_per_second': size_mb / records_seconds},
+        'build_dataframe': {'seconds': build_seconds, 'rows_per_second': len(records) / build_seconds},
+    }
+
+
+def bench_parse_parallel(path, size_mb, workers, repeat):
+    seconds, df = best_of(repeat, parse_log_file, path, workers)
+    return {'parse_file_parallel': {'seconds': seconds, 'mb_per_second': size_mb / seconds,
+                                    'workers': workers, 'rows': len(df)}}
+
+
+def bench_peak_rss(path):
+    """Peak RSS of parsing the file in a fresh process (so earlier benchmarks don't count)."""
+    if max_rss_mb() is None:
+        return {}
+    with fresh_process() as pool:
+        baseline, peak, rows = pool.submit(_parse_peak_rss, path).result()
+    return {'parse_peak_rss': {'baseline_mb': baseline, 'peak_mb': peak, 'parse_mb': peak - baseline, 'rows': rows}}
+
+
+def bench_stream_rss(path, size_mb, batch_rows=STREAM_BATCH_ROWS, limit_mb=STREAM_RSS_LIMIT_MB):
+    """
+    The bounded-memory path (main.py --stream) on a dump much larger than the other benchmarks':
+    parse in batches and write COPY text, in a fresh process. Peak RSS must stay under limit_mb.
+    """
+    with fresh_process() as pool:
+        baseline, peak, rows, seconds = pool.submit(_stream_peak_rss, path, batch_rows).result()
+    return {'stream_peak_rss': {'seconds': seconds, 'mb_per_second': size_mb / seconds, 'rows': rows,
+                                'batch_rows': batch_rows, 'baseline_mb': baseline, 'peak_mb': peak, 'limit_mb': limit_mb}}
+
+
+def bench_sql(df, repeat):
+    results = {}
+    for sql_format in SQL_FORMATS:
+        seconds, script = best_of(repeat, lambda: "".join(iter_sql(df, sql_format)))
+        results[f'sql_{sql_format}'] = {'seconds': seconds, 'output_mb': len(script) / MB,
+                                        'rows_per_second': len(df) / seconds}
+    return results
+
+
+def bench_export(df, repeat):
+    """Columnar export per format: write time, size, and the time to read it back into pandas."""
+    readers = {'parquet': pd.read_parquet, 'arrow': pd.read_feather, 'csv': pd.read_csv}
+    results = {}
+    for export_format in EXPORT_FORMATS:
+        seconds, data = best_of(repeat, lambda: b"".join(iter_export(df, export_format)))
+        read_seconds, _ = best_of(repeat, lambda: readers[export_format](io.BytesIO(data)))
+        results[f'export_{export_format}'] = {'seconds': seconds, 'output_mb': len(data) / MB,
+                                              'read_seconds': read_seconds}
+    return results
+
+
+def bench_summary(df, repeat):
+    """Hotspot rollups (top-N, percentiles, breakdowns, stage shares), computed once per result."""
+    seconds, _ = best_of(repeat, hotspot_summary, df)
+    return {'summary': {'seconds': seconds, 'rows_per_second': len(df) / seconds}}
+
+
+def bench_flask(data, repeat):
+    """
+    Latency of /process -> (parse job) -> /results -> /results/data -> /get_sql through the
+    Flask test client, with a cold result cache and again for a re-upload (cache hit).
+    """
+    os.environ.setdefault('RESULT_CACHE_DIR', tempfile.mkdtemp(prefix='mon_bench_cache_'))
+    import app as web_app
+    client = web_app.app.test_client()
+    json_headers = {'Accept': 'application/json'}
+
+    def request(method, url, **kwargs):
+        started = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        response.get_data() # Drain streamed responses
+        return response, time.perf_counter() - started
+
+    def run(cold):
+        if cold:
+            web_app.cache.clear()
+        timings = {}
+        started = time.perf_counter()
+        response, timings['process'] = request('post', '/process', headers=json_headers,
+                                               data={'log_file': (io.BytesIO(data), 'bench.txt')})
+        if response.status_code == 202:
+            status_url = response.get_json()['status_url']
+            while True:
+                job = client.get(status_url).get_json()
+                if job['status'] in web_app.JOB_FINISHED_STATES:
+                    break
+                time.sleep(JOB_POLL_SECONDS)
+            if job['status'] != web_app.JOB_DONE:
+                raise RuntimeError(f"Parse job ended as {job['status']}: {job['error']}")
+            timings['parse_job'] = job['elapsed']
+            _, timings['job_open'] = request('get', job['results_url'])
+        _, timings['results'] = request('get', '/results')
+        _, timings['results_data'] = request('get', '/results/data?draw=1&start=0&length=25')
+        _, timings['get_sql'] = request('get', '/get_sql?format=copy_text')
+        timings['seconds'] = time.perf_counter() - started
+        return timings
+
+    results = {}
+    for name, cold in (('flask_cold', True), ('flask_cached', False)):
+        runs = [run(cold) for _ in range(repeat)]
+        results[name] = min(runs, key=lambda timings: timings['seconds'])
+    return results
+
+
+def compare(results, baseline_path):
+    """Prints seconds per benchmark next to a previous run's."""
+    with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} ({(baseline['meta'].get('commit') or '?')[:10]}):")
+    for name, metrics in results.items():
+        before = baseline['results'].get(name, {}).get('seconds')
+        if before:
+            print(f"  {name:<24} {before:9.3f}s -> {metrics['seconds']:9.3f}s  ({metrics['seconds'] / before:5.2f}x)")
+
+
+# usage: python benchmark.py [--tables N] [--repeat N] [--workers N] [--skip-flask] [--output PATH] [--compare PATH]
+#        (exits 1 when parse_stream misses --parse-target, its speedup over the reference parser)
+#        python benchmark.py --stream-tables 700000 [--rss-limit-mb 512]  (a ~5 GB dump; exits 1 over the limit)
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Benchmark parsing, SQL generation and the web flow on synthetic mon output.")
+    arg_parser.add_argument('--tables', type=int, default=DEFAULT_TABLES, help="tables in the generated mon output")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per benchmark (the fastest counts)")
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processes for the parallel parse")
+    arg_parser.add_argument('--skip-flask', action='store_true', help="skip the Flask test-client benchmark")
+    arg_parser.add_argument('--stream-tables', type=int, default=0,
+                            help="also stream a separate dump of this many tables (about 7.5 KB each) and check its peak RSS")
+    arg_parser.add_argument('--rss-limit-mb', type=float, default=STREAM_RSS_LIMIT_MB,
+                            help="peak RSS the streamed dump must stay under")
+    arg_parser.add_argument('--parse-target', type=float, default=PARSE_SPEEDUP_TARGET,
+                            help="speedup over the reference parser that parse_stream must reach")
+    arg_parser.add_argument('--output', help=f"results file (default: {RESULTS_DIR}/<commit>-<time>.json)")
+    arg_parser.add_argument('--compare', metavar='PATH', help="previous results file to compare with")
+    args = arg_parser.parse_args()
+    configure_logging(BENCHMARK_LOG_LEVEL)
+
+    commit, dirty = git_revision()
+    generator = MonOutputGenerator(args.tables, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='mon_bench_') as work_dir:
+        input_path = os.path.join(work_dir, 'mon_output.txt')
+        with open(input_path, 'wb') as input_file:
+            input_bytes = generator.write(input_file)
+        with open(input_path, 'rb') as input_file:
+            data = input_file.read()
+        size_mb = input_bytes / MB
+        print(f"Generated {args.tables} tables ({size_mb:.1f} MB), seed {args.seed}", file=sys.stderr)
+
+        results = {}
+        df, parse_results = bench_parse(data, args.repeat, args.parse_target)
+        results.update(parse_results)
+        if args.workers > 1:
+            results.update(bench_parse_parallel(input_path, size_mb, args.workers, args.repeat))
+        results.update(bench_peak_rss(input_path))
+        results.update(bench_sql(df, args.repeat))
+        results.update(bench_export(df, args.repeat))
+        results.update(bench_summary(df, args.repeat))
+        if not args.skip_flask:
+            results.update(bench_flask(data, args.repeat))
+        del data, df
+        if args.stream_tables and max_rss_mb() is not None:
+            stream_path = os.path.join(work_dir, 'mon_stream.txt')
+            with open(stream_path, 'wb') as stream_file:
+                stream_mb = MonOutputGenerator(args.stream_tables, seed=args.seed).write(stream_file) / MB
+            print(f"Generated {args.stream_tables} tables ({stream_mb:.1f} MB) to stream", file=sys.stderr)
+            results.update(bench_stream_rss(stream_path, stream_mb, limit_mb=args.rss_limit_mb))
+
+    report = {
+        'meta': {
+            'commit': commit, 'dirty': dirty, 'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        },
+        'params': {'tables': args.tables, 'seed': args.seed, 'repeat': args.repeat, 'workers': args.workers,
+                   'input_mb': size_mb, 'stream_tables': args.stream_tables},
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{(commit or 'unknown')[:10]}{'-dirty' if dirty else ''}-{stamp}.json")
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    for name, metrics in results.items():
+        details = ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in metrics.items() if key != 'seconds')
+        seconds = metrics.get('seconds')
+        print(f"{name:<24} {f'{seconds:.3f}s' if seconds is not None else '':>10}  {details}")
+    print(f"Saved {output}")
+    if args.compare:
+        compare(results, args.compare)
+    failed = False
+    parse = results['parse_stream']
+    if parse['speedup_vs_reference'] < parse['target_speedup']:
+        print(f"parse_stream is {parse['speedup_vs_reference']:.2f}x the reference parser, "
+              f"under the {parse['target_speedup']:.2f}x target", file=sys.stderr)
+        failed = True
+    stream = results.get('stream_peak_rss')
+    if stream and stream['peak_mb'] > stream['limit_mb']:
+        print(f"Streaming peak RSS {stream['peak_mb']:.0f} MB is over the {stream['limit_mb']:.0f} MB limit", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
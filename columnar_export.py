@@ -0,0 +1,168 @@
+import json
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from table_schema import TABLE_SCHEMA, TAG_COLUMNS
+from log_parser import EXTRA_FIELDS_COLUMN, INTERNED_COLUMNS
+from sql_output import FILTER_COLUMN, split_frames
+from instrumentation import STAGE_EXPORT, timed_chunks
+
+logger = logging.getLogger(__name__)
+
+# --- Columnar export (Parquet, Arrow IPC, CSV; streamed one row group at a time) ---
+EXPORT_PARQUET = 'parquet'
+EXPORT_ARROW = 'arrow'
+EXPORT_CSV = 'csv'
+EXPORT_FORMATS = (EXPORT_PARQUET, EXPORT_ARROW, EXPORT_CSV)
+EXPORT_MIMETYPES = {
+    EXPORT_PARQUET: 'application/vnd.apache.parquet',
+    EXPORT_ARROW: 'application/vnd.apache.arrow.file',
+    EXPORT_CSV: 'text/csv',
+}
+EXPORT_ROW_GROUP_ROWS = 65536 # Rows per Parquet row group / Arrow record batch / CSV chunk
+PARQUET_COMPRESSION = 'zstd'
+ARROW_COMPRESSION = 'zstd' # Record batch buffers; readers decompress transparently
+# Few distinct values repeated on many rows: stored once per row group, read back as categoricals
+DICTIONARY_COLUMNS = set(INTERNED_COLUMNS) | set(TAG_COLUMNS)
+
+
+class _ChunkSink:
+    """Write-only file object that collects what a writer wrote, to be handed out with drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_table(df, filter_rows=True):
+    """
+    The rows of df that have FILTER_COLUMN (all rows with filter_rows=False) as an Arrow table:
+    table columns in DDL order, then extra_fields as JSON text. Timestamps keep their
+    timestamp type (UTC), integers stay nullable int64 and DICTIONARY_COLUMNS are dictionary-encoded.
+    """
+    if filter_rows and FILTER_COLUMN in df.columns:
+        df = df[df[FILTER_COLUMN].notna()]
+    columns = [col for col in TABLE_SCHEMA if col in df.columns]
+    if EXTRA_FIELDS_COLUMN in df.columns:
+        columns.append(EXTRA_FIELDS_COLUMN)
+    df = df[columns].reset_index(drop=True)
+    for col in columns:
+        if col in DICTIONARY_COLUMNS:
+            df[col] = df[col].astype('category')
+    if EXTRA_FIELDS_COLUMN in df.columns:
+        df[EXTRA_FIELDS_COLUMN] = [None if fields is None else json.dumps(fields, default=str)
+                                   for fields in df[EXTRA_FIELDS_COLUMN].tolist()]
+    # The pandas metadata lets read_parquet()/read_feather() restore Int64 and categorical dtypes
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def batch_schema(table, dictionaries=True):
+    """
+    The schema every streamed batch is cast to, from the first batch's table: dictionaries
+    indexed by int32 (pandas picks int8 for a few categories), or decoded to text with
+    dictionaries=False, and all-missing columns as text.
+    """
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()) if dictionaries else pa.string())
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+def iter_parquet(tables, schema, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION) as writer:
+        for table in tables:
+            for start in range(0, table.num_rows, row_group_rows):
+                writer.write_table(table.slice(start, row_group_rows), row_group_size=row_group_rows)
+                yield sink.drain()
+    yield sink.drain() # Footer
+
+
+def iter_arrow(tables, schema, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+    sink = _ChunkSink()
+    # The IPC file format (Feather v2): pyarrow.feather.read_table / pandas.read_feather read it back
+    options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+    with pa.ipc.new_file(sink, schema, options=options) as writer:
+        for table in tables:
+            for batch in table.to_batches(max_chunksize=row_group_rows):
+                writer.write_batch(batch)
+                yield sink.drain()
+    yield sink.drain() # Footer
+
+
+def iter_csv(tables, schema, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+    # CSV has no dictionary type; decoded, the values are written as plain text
+    schema = pa.schema([pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type)
+                        else field for field in schema])
+    sink = _ChunkSink()
+    with pa_csv.CSVWriter(sink, schema) as writer:
+        for table in tables:
+            for batch in table.cast(schema).to_batches(max_chunksize=row_group_rows):
+                writer.write_batch(batch)
+                yield sink.drain()
+    yield sink.drain()
+
+
+EXPORT_WRITERS = {EXPORT_PARQUET: iter_parquet, EXPORT_ARROW: iter_arrow, EXPORT_CSV: iter_csv}
+
+
+def export_tables(df, filter_rows=True, dictionaries=True):
+    """
+    (schema, tables) to write for df, or for an iterable of DataFrame batches (streaming, see
+    log_parser.iter_record_batches()): each batch is converted as it is written, cast to the
+    first one's batch_schema().
+    """
+    first, frames = split_frames(df)
+    if first is None or isinstance(df, pd.DataFrame):
+        table = export_table(pd.DataFrame() if first is None else first, filter_rows)
+        return table.schema, [table]
+    frames = iter(frames)
+    first_table = export_table(next(frames), filter_rows)
+    schema = batch_schema(first_table, dictionaries)
+
+    def tables():
+        yield first_table.cast(schema)
+        for frame in frames:
+            yield export_table(frame, filter_rows).cast(schema)
+
+    return schema, tables()
+
+
+def iter_export(df, export_format, row_group_rows=EXPORT_ROW_GROUP_ROWS, filter_rows=True):
+    """
+    Yields df (or each of its batches) in one of EXPORT_FORMATS as bytes, one row group per
+    chunk (timed as the export stage). Streamed to Arrow, DICTIONARY_COLUMNS are plain text.
+    """
+    writer = EXPORT_WRITERS.get(export_format)
+    if writer is None:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of: {', '.join(EXPORT_FORMATS)}")
+    # An Arrow IPC file has one dictionary per column, but each batch brings its own
+    schema, tables = export_tables(df, filter_rows, dictionaries=export_format != EXPORT_ARROW)
+    return timed_chunks(STAGE_EXPORT, (chunk for chunk in writer(tables, schema, row_group_rows) if chunk))
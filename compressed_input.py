@@ -0,0 +1,155 @@
+import bz2
+import gzip
+import io
+import logging
+import zipfile
+
+try:
+    import zstandard
+except ImportError: # Only needed for .zst captures
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# --- Compressed inputs (detected by magic bytes, decompressed as a stream) ---
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_BZ2 = 'bz2'
+COMPRESSION_ZIP = 'zip'
+MAGIC_BYTES = [
+    (b'\x1f\x8b', COMPRESSION_GZIP),
+    (b'\x28\xb5\x2f\xfd', COMPRESSION_ZSTD),
+    (b'BZh', COMPRESSION_BZ2),
+    (b'PK\x03\x04', COMPRESSION_ZIP),
+    (b'PK\x05\x06', COMPRESSION_ZIP), # Empty archive
+]
+MAGIC_LENGTH = 4
+ZIP_MEMBERS_ALL = 'all' # Parse every file in a zip, one after the other
+ZIP_MEMBERS_FIRST = 'first'
+READ_BYTES = 1 << 20
+
+
+class DecompressedSizeError(ValueError):
+    """The input inflated past the allowed size (e.g. a zip bomb)."""
+
+
+def detect_compression(source):
+    """
+    Returns the COMPRESSION_* name for a path, a seekable binary stream (position kept)
+    or a bytes prefix, or None for plain text.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        header = bytes(source[:MAGIC_LENGTH])
+    elif hasattr(source, 'read'):
+        position = source.tell()
+        header = source.read(MAGIC_LENGTH)
+        source.seek(position)
+    else:
+        with open(source, 'rb') as source_file:
+            header = source_file.read(MAGIC_LENGTH)
+    for magic, compression in MAGIC_BYTES:
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+class _ZipMembersReader(io.RawIOBase):
+    """Reads the files of a zip archive back to back, with a newline between them if missing."""
+
+    def __init__(self, archive, members):
+        self.archive = archive
+        self.members = list(members)
+        self.current = None
+        self.last_byte = b'\n'
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                if not self.members:
+                    return 0
+                self.current = self.archive.open(self.members.pop(0))
+                if self.last_byte != b'\n': # Never join the last line of one file to the next file
+                    buffer[0:1] = b'\n'
+                    self.last_byte = b'\n'
+                    return 1
+            data = self.current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                self.last_byte = data[-1:]
+                return len(data)
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+        self.archive.close()
+        super().close()
+
+
+class _CappedReader(io.RawIOBase):
+    """Passes decompressed bytes through, failing once more than max_bytes came out."""
+
+    def __init__(self, stream, max_bytes, raw_file, closing):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.raw_file = raw_file
+        self.closing = closing # Everything to close with this reader, innermost first
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise DecompressedSizeError(
+                f"Input decompresses to more than {self.max_bytes} bytes; refusing to read further.")
+        buffer[:len(data)] = data
+        return len(data)
+
+    def compressed_position(self):
+        """Compressed bytes consumed so far (for progress against the compressed size)."""
+        return self.raw_file.tell()
+
+    def close(self):
+        if not self.closed:
+            for stream in self.closing:
+                stream.close()
+        super().close()
+
+
+def open_log_input(source, max_bytes=None, zip_members=ZIP_MEMBERS_ALL):
+    """
+    Opens a path or seekable binary stream for parsing. Plain input comes back as is (a
+    file opened from a path); gzip, zstd, bz2 and zip input comes back as a buffered stream
+    that decompresses as it is read, never inflating the whole file in memory.
+    max_bytes caps the decompressed size (DecompressedSizeError past it).
+    The caller closes the result; a stream passed in is closed along with it.
+    """
+    raw_file = open(source, 'rb') if not hasattr(source, 'read') else source
+    compression = detect_compression(raw_file)
+    if compression is None:
+        return raw_file
+    if compression == COMPRESSION_GZIP:
+        stream = gzip.GzipFile(fileobj=raw_file, mode='rb')
+    elif compression == COMPRESSION_BZ2:
+        stream = bz2.BZ2File(raw_file, mode='rb')
+    elif compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raw_file.close()
+            raise RuntimeError("Reading zstd input requires the zstandard package (pip install zstandard).")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw_file, read_size=READ_BYTES, read_across_frames=True)
+    else:
+        archive = zipfile.ZipFile(raw_file)
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if zip_members == ZIP_MEMBERS_FIRST:
+            members = members[:1]
+        logger.info("Reading %d member(s) of zip archive: %s", len(members), [info.filename for info in members])
+        stream = _ZipMembersReader(archive, members)
+    logger.info("Decompressing %s input as it is parsed", compression)
+    return io.BufferedReader(_CappedReader(stream, max_bytes, raw_file, [stream, raw_file]), READ_BYTES)
@@ -0,0 +1,11 @@
+-- Opt-in migration for merge loading (main.py --merge, the 'merge' format):
+-- one row per source table and node, so INSERT ... ON CONFLICT can update rows
+-- in place. A NULL node (loads made with --no-tags) counts as one more node.
+-- Not part of dw_stats_table.sql: with the key, a TRUNCATE load of a dump
+-- that lists a table twice (e.g. a capture of several snapshots) fails, so
+-- apply it only to tables that are loaded with --merge. Safe to re-run.
+ALTER TABLE public.process_queue_wait_times ADD COLUMN IF NOT EXISTS node VARCHAR(255);
+-- Replaces the earlier key on source_table_name alone, which kept one node's row per table
+ALTER TABLE public.process_queue_wait_times DROP CONSTRAINT IF EXISTS process_queue_wait_times_source_table_name_key;
+CREATE UNIQUE INDEX IF NOT EXISTS process_queue_wait_times_merge_key
+    ON public.process_queue_wait_times (source_table_name, (COALESCE(node, '')));
@@ -49,5 +49,7 @@ CREATE TABLE public.process_queue_wait_times (
     last_batch_max_record_size_in_batch INT, -- Added
     last_batch_batch_sequence_number INT, -- Added
     last_batch_batch_size_in_bytes INT, -- Added
-    last_batch_batch_accumulation_time_in_ms INT -- Added
-);
\ No newline at end of file
+    last_batch_batch_accumulation_time_in_ms INT, -- Added
+    source_file VARCHAR(1024), -- Added: file the record was parsed from (main.py)
+    node VARCHAR(255) -- Added: cluster node of that file (main.py)
+);
@@ -0,0 +1,5 @@
+-- Migration for tables created before the source_file/node columns were added to
+-- dw_stats_table.sql. main.py tags every record with both unless --no-tags is passed,
+-- so its INSERT/COPY output names them. Safe to re-run.
+ALTER TABLE public.process_queue_wait_times ADD COLUMN IF NOT EXISTS source_file VARCHAR(1024);
+ALTER TABLE public.process_queue_wait_times ADD COLUMN IF NOT EXISTS node VARCHAR(255);
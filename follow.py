@@ -0,0 +1,239 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from log_parser import BLOCK_SIZE, MonLogParser, build_dataframe
+from compressed_input import detect_compression
+from sql_output import SQL_BLOCK_ROWS, FILTER_COLUMN, table_columns, quote_sql_string, copy_statement, iter_copy_rows
+from table_schema import TABLE_NAME
+
+logger = logging.getLogger(__name__)
+
+# --- Incremental (follow) parsing of a growing mon capture ---
+# A checkpoint remembers how far into the file we got and the parser state at that point,
+# so each cycle only reads the bytes appended since the last one.
+CHECKPOINT_VERSION = 1
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+TABLE_KEY_COLUMN = 'source_table_name'
+FOLLOW_INTERVAL_SECONDS = 5.0 # How often --follow checks the file for new output
+_DATETIME_TAG = '$datetime' # JSON encoding of datetime values in the open table
+# The bottom edge of a mon box ('╰───...'): no more lines for the table still open
+_BOX_BOTTOM_RE = re.compile(rb'^[ \t]*\xe2\x95\xb0[^\n]*\n', re.MULTILINE)
+
+
+def default_checkpoint_path(path):
+    return path + CHECKPOINT_SUFFIX
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and _DATETIME_TAG in value:
+        return datetime.datetime.fromisoformat(value[_DATETIME_TAG])
+    return value
+
+
+def split_at_box_bottoms(block):
+    """Splits a block of whole lines after each box-bottom line. Yields (piece, ends_with_box_bottom)."""
+    start = 0
+    for match in _BOX_BOTTOM_RE.finditer(block):
+        yield block[start:match.end()], True
+        start = match.end()
+    if start < len(block):
+        yield block[start:], False
+
+
+def record_fingerprint(record):
+    """Short digest of a table record, used to tell whether a table changed since it was last emitted."""
+    return hashlib.blake2b(repr(sorted(record.items())).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class LogFollower:
+    """
+    Parses only what was appended to `path` since the last checkpoint.
+
+    poll() resumes the parser at the saved byte offset and state, reads up to the last
+    complete line, and returns the tables whose record changed since they were last
+    emitted (latest record per source_table_name). Only finished tables count: those
+    followed by the next table's header or by the bottom line of their box. The table
+    still open at the end of the file waits in the checkpoint until one of them arrives.
+    commit() saves the new checkpoint once the caller has written or loaded the result.
+
+    A file that shrank or was replaced (rotation) is read again from the start; tables
+    identical to what was already emitted are still left out.
+    """
+
+    def __init__(self, path, checkpoint_path=None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(path)
+        self.checkpoint = self._load_checkpoint()
+        self._pending = None
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except FileNotFoundError:
+            checkpoint = None
+        except ValueError as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", self.checkpoint_path, e)
+            checkpoint = None
+        if checkpoint is not None and checkpoint.get('version') != CHECKPOINT_VERSION:
+            logger.warning("Checkpoint %s is from another version; starting over.", self.checkpoint_path)
+            checkpoint = None
+        return checkpoint or {'version': CHECKPOINT_VERSION, 'file_id': None, 'offset': 0,
+                              'parser': None, 'fingerprints': {}}
+
+    def has_new_data(self):
+        """Cheap check (one stat) for output appended, or the file replaced, since the checkpoint."""
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return [info.st_dev, info.st_ino] != self.checkpoint['file_id'] or info.st_size != self.checkpoint['offset']
+
+    def poll(self):
+        """
+        Parses the new output. Returns a DataFrame of the changed tables (empty if none).
+        Call commit() after the result has been written to advance the checkpoint.
+        """
+        checkpoint = self.checkpoint
+        parser = MonLogParser()
+        open_table_closed = False # The parser only ends a table at the next header
+        with open(self.path, 'rb') as log_file:
+            if detect_compression(log_file):
+                raise ValueError(f"{self.path} is compressed; follow mode needs the plain capture it appends to.")
+            info = os.fstat(log_file.fileno())
+            file_id = [info.st_dev, info.st_ino]
+            offset = checkpoint['offset']
+            if file_id != checkpoint['file_id'] or info.st_size < offset:
+                if checkpoint['file_id'] is not None:
+                    logger.warning("%s was truncated or replaced; reading it from the start.", self.path)
+                offset = 0
+            elif checkpoint['parser']:
+                saved = dict(checkpoint['parser'])
+                current = saved.get('current_table')
+                if current is not None:
+                    saved['current_table'] = {key: _decode_value(value) for key, value in current.items()}
+                parser.set_state(saved)
+                open_table_closed = checkpoint.get('open_table_closed', False)
+
+            # Only whole lines are consumed; a partly written last line waits for the next cycle
+            start = offset
+            log_file.seek(offset)
+            remainder = b''
+            while True:
+                chunk = log_file.read(BLOCK_SIZE)
+                if not chunk:
+                    break
+                chunk = remainder + chunk
+                cut = chunk.rfind(b'\n') + 1
+                if cut:
+                    for piece, box_bottom in split_at_box_bottoms(chunk[:cut]):
+                        open_table = parser.current_table_data
+                        parser.feed_block(piece)
+                        if parser.current_table_data is not open_table: # A header started another table
+                            open_table_closed = False
+                        if box_bottom:
+                            open_table_closed = parser.current_table_data is not None
+                    offset += cut
+                remainder = chunk[cut:]
+
+        latest = {}
+        for record in parser.records:
+            latest[record[TABLE_KEY_COLUMN]] = record
+        if parser.current_table_data and open_table_closed:
+            latest[parser.current_table_data[TABLE_KEY_COLUMN]] = parser.current_table_data
+        fingerprints = dict(checkpoint['fingerprints'])
+        changed = []
+        for table_name, record in latest.items():
+            fingerprint = record_fingerprint(record)
+            if fingerprints.get(table_name) != fingerprint:
+                fingerprints[table_name] = fingerprint
+                changed.append(record)
+
+        state = parser.get_state()
+        if state['current_table'] is not None:
+            state['current_table'] = {key: _encode_value(value) for key, value in state['current_table'].items()}
+        self._pending = {'version': CHECKPOINT_VERSION, 'file_id': file_id, 'offset': offset,
+                         'parser': state, 'open_table_closed': open_table_closed, 'fingerprints': fingerprints}
+        logger.info("%s: read %d new bytes, %d finished tables, %d changed",
+                    self.path, offset - start, len(parser.records), len(changed))
+        return build_dataframe(changed)
+
+    def commit(self):
+        """Saves the checkpoint reached by the last poll() (write-then-rename)."""
+        if self._pending is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.tmp-', suffix='.json',
+                                         delete=False, encoding='utf-8') as tmp_file:
+            json.dump(self._pending, tmp_file)
+        os.replace(tmp_file.name, self.checkpoint_path)
+        self.checkpoint, self._pending = self._pending, None
+
+
+# --- Output of changed tables ---
+def replaced_table_names(df):
+    """The source tables whose rows a load of df writes: rows without FILTER_COLUMN are skipped."""
+    if df is None or df.empty or FILTER_COLUMN not in df.columns:
+        return []
+    return df.loc[df[FILTER_COLUMN].notna(), TABLE_KEY_COLUMN].tolist()
+
+
+def replace_tables_sql(table_names, table=TABLE_NAME):
+    """DELETE of the previous rows of the given source tables (None if there are none)."""
+    if not table_names:
+        return None
+    names = ", ".join(quote_sql_string(name) for name in table_names)
+    return f"DELETE FROM {table} WHERE {TABLE_KEY_COLUMN} IN ({names});"
+
+
+def iter_changed_sql(df, csv=False, block_size=SQL_BLOCK_ROWS):
+    """
+    Yields a script that replaces the rows of the changed tables in df in one transaction:
+    DELETE of their previous rows, then COPY ... FROM STDIN. Other tables are left alone, and
+    so are tables whose new row is skipped for a missing FILTER_COLUMN.
+    """
+    if df is None or df.empty:
+        yield "-- No changed tables.\n"
+        return
+    columns = table_columns(df)
+    yield "BEGIN;\n"
+    delete = replace_tables_sql(replaced_table_names(df))
+    if delete:
+        yield f"{delete}\n"
+    yield f"{copy_statement(columns, csv)};\n"
+    rows_skipped = 0
+    for data, _, skipped in iter_copy_rows(df, columns, csv, block_size):
+        rows_skipped += skipped
+        if data:
+            yield data
+    yield "\\.\nCOMMIT;\n"
+    if rows_skipped:
+        yield f"-- Note: Skipped {rows_skipped} rows where '{FILTER_COLUMN}' was missing.\n"
+
+
+def follow_log(path, emit, checkpoint_path=None, follow=False, interval=FOLLOW_INTERVAL_SECONDS):
+    """
+    Runs one incremental cycle (or, with follow=True, one per change until interrupted),
+    handing each DataFrame of changed tables to emit(df) before saving the checkpoint.
+    """
+    follower = LogFollower(path, checkpoint_path)
+    while True:
+        if follower.has_new_data():
+            changed = follower.poll()
+            if not changed.empty:
+                emit(changed)
+            follower.commit()
+        if not follow:
+            return
+        time.sleep(interval)
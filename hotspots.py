@@ -0,0 +1,192 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+from instrumentation import STAGE_SUMMARY, span
+
+logger = logging.getLogger(__name__)
+
+# --- Hotspot rollups (which tables are lagging), computed once per parsed result ---
+TABLE_COLUMN = 'source_table_name'
+MAPPED_COLUMN = 'mapped_source_table'
+MERGE_TIME_COLUMN = 'last_successful_merge_time'
+STALENESS_METRIC = 'merge_staleness_seconds' # Derived: time since the table's last successful merge
+# Worst first: a higher value is a worse table. Missing columns are left out of the summary.
+HOTSPOT_METRICS = {
+    'avg_waiting_time_in_queue_in_ms': 'ms',
+    'max_integration_time_in_ms': 'ms',
+    'last_batch_merge_time_in_ms': 'ms',
+    STALENESS_METRIC: 's',
+}
+HOTSPOT_TOP_N = 20 # Tables per metric, and mapped source tables in the breakdown
+PERCENTILES = (50, 95, 99)
+# Parts of the last batch's total integration time
+STAGE_TOTAL_COLUMN = 'last_batch_total_integration_time_in_ms'
+STAGE_COLUMNS = {
+    'compaction': 'last_batch_compaction_time_in_ms',
+    'upload': 'last_batch_upload_time_in_ms',
+    'merge': 'last_batch_merge_time_in_ms',
+    'ddl': 'last_batch_ddl_execution_time_in_ms',
+}
+SUMMARY_COLUMN = 'summary' # The summary is cached as its JSON text in a one-cell frame
+# Every column hotspot_summary() reads, so it can be computed from a projection of a cached view
+SUMMARY_INPUT_COLUMNS = list(dict.fromkeys([TABLE_COLUMN, MAPPED_COLUMN, MERGE_TIME_COLUMN, STAGE_TOTAL_COLUMN,
+                                             *(metric for metric in HOTSPOT_METRICS if metric != STALENESS_METRIC),
+                                             *STAGE_COLUMNS.values()]))
+
+
+def _number(value):
+    """JSON-friendly number: None for NaN, int for whole numbers."""
+    if value is None or not np.isfinite(value):
+        return None
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 6)
+
+
+def _text(value):
+    return None if value is None or (not isinstance(value, str) and pd.isna(value)) else str(value)
+
+
+def metric_values(df, reference_time=None):
+    """
+    {metric: float64 array (NaN where missing)} for the HOTSPOT_METRICS present in df.
+    Staleness is measured back from reference_time (default: the newest merge in df, as a
+    dump carries no capture time), so the summary doesn't change as it sits in the cache.
+    Returns (values, reference_time).
+    """
+    values = {}
+    for metric in HOTSPOT_METRICS:
+        if metric in df.columns:
+            values[metric] = df[metric].to_numpy(dtype='float64', na_value=np.nan)
+    if MERGE_TIME_COLUMN in df.columns and pd.api.types.is_datetime64_any_dtype(df[MERGE_TIME_COLUMN].dtype):
+        merge_time = df[MERGE_TIME_COLUMN]
+        if getattr(merge_time.dtype, 'tz', None) is not None:
+            merge_time = merge_time.dt.tz_convert('UTC').dt.tz_localize(None)
+        if reference_time is None:
+            reference_time = merge_time.max()
+        if not pd.isna(reference_time):
+            values[STALENESS_METRIC] = ((reference_time - merge_time).dt.total_seconds()).to_numpy(dtype='float64', na_value=np.nan)
+    return values, reference_time
+
+
+def top_rows(values, n=HOTSPOT_TOP_N):
+    """
+    Positions of the n largest values, largest first, without sorting the whole column:
+    argpartition finds the cut-off, only the rows above it are sorted. Missing values never
+    rank; ties keep input order (also at the cut-off, so the result is deterministic).
+    """
+    rows = np.flatnonzero(~np.isnan(values))
+    if n <= 0 or not len(rows):
+        return rows[:0]
+    if len(rows) > n:
+        cutoff = values[rows[np.argpartition(-values[rows], n - 1)[n - 1]]]
+        above = rows[values[rows] > cutoff]
+        rows = np.concatenate([above, rows[values[rows] == cutoff][:n - len(above)]])
+    return rows[np.lexsort((rows, -values[rows]))]
+
+
+def percentile_summary(values):
+    """count, mean, p50/p95/p99 and max of the non-missing values."""
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return {'count': 0, 'mean': None, **{f'p{q}': None for q in PERCENTILES}, 'max': None}
+    quantiles = np.percentile(present, PERCENTILES)
+    return {'count': int(len(present)), 'mean': _number(present.mean()),
+            **{f'p{q}': _number(value) for q, value in zip(PERCENTILES, quantiles)},
+            'max': _number(present.max())}
+
+
+def mapped_breakdown(df, values, n=HOTSPOT_TOP_N):
+    """
+    Per mapped_source_table: table count plus mean and max of each metric, the n groups with
+    the worst max of the first metric first. Returns (total groups, rows).
+    """
+    if MAPPED_COLUMN not in df.columns or not values:
+        return 0, []
+    codes, groups = pd.factorize(df[MAPPED_COLUMN], sort=False)
+    present = codes >= 0
+    codes = codes[present]
+    frame = pd.DataFrame({metric: column[present] for metric, column in values.items()})
+    grouped = frame.groupby(codes, sort=False)
+    means, maxes = grouped.mean(), grouped.max()
+    tables = np.bincount(codes, minlength=len(groups))
+    first = next(iter(values))
+    order = top_rows(maxes[first].reindex(range(len(groups))).to_numpy(dtype='float64', na_value=np.nan), n)
+    if len(order) < min(n, len(groups)): # Groups without any value for the first metric go last
+        order = np.concatenate([order, np.setdiff1d(np.arange(len(groups)), order)[:n - len(order)]])
+    rows = []
+    for code in order:
+        row = {MAPPED_COLUMN: _text(groups[code]), 'tables': int(tables[code])}
+        for metric in values:
+            row[f'{metric}_mean'] = _number(means[metric].get(code, np.nan))
+            row[f'{metric}_max'] = _number(maxes[metric].get(code, np.nan))
+        rows.append(row)
+    return len(groups), rows
+
+
+def stage_shares(df):
+    """
+    Compaction, upload, merge and DDL time as fractions of the last batch's total integration
+    time: over all tables (time-weighted) and the p50/p95 of the per-table fractions.
+    Only tables with a positive total count; 'other' is what the four stages don't cover
+    (0 if they add up to more, as stages of a batch can overlap).
+    """
+    if STAGE_TOTAL_COLUMN not in df.columns:
+        return {'tables': 0, 'stages': [], 'other': None}
+    total = df[STAGE_TOTAL_COLUMN].to_numpy(dtype='float64', na_value=np.nan)
+    valid = total > 0 # NaN compares False
+    total = total[valid]
+    stages = []
+    covered = 0.0
+    for stage, column in STAGE_COLUMNS.items():
+        if column not in df.columns:
+            continue
+        part = np.nan_to_num(df[column].to_numpy(dtype='float64', na_value=np.nan)[valid])
+        share = part.sum() / total.sum() if len(total) else np.nan
+        covered += 0.0 if np.isnan(share) else share
+        per_table = part / total
+        p50, p95 = np.percentile(per_table, (50, 95)) if len(per_table) else (np.nan, np.nan)
+        stages.append({'stage': stage, 'column': column, 'share': _number(share),
+                       'p50': _number(p50), 'p95': _number(p95)})
+    return {'tables': int(len(total)), 'stages': stages, 'other': _number(max(0.0, 1.0 - covered)) if len(total) else None}
+
+
+def hotspot_summary(df, n=HOTSPOT_TOP_N):
+    """
+    The hotspot rollups of df as a JSON-friendly dict: per metric the top n tables and its
+    percentiles, the breakdown by mapped_source_table, and the last batch's stage shares.
+    Vectorized throughout (one pass per metric): about 60ms for 100k tables, once per result.
+    """
+    with span(STAGE_SUMMARY):
+        values, reference_time = metric_values(df)
+        tables = df[TABLE_COLUMN].to_numpy(dtype=object) if TABLE_COLUMN in df.columns else None
+        mapped = df[MAPPED_COLUMN].to_numpy(dtype=object) if MAPPED_COLUMN in df.columns else None
+        metrics = {}
+        for metric, column in values.items():
+            top = []
+            for row in top_rows(column, n):
+                top.append({TABLE_COLUMN: None if tables is None else _text(tables[row]),
+                            MAPPED_COLUMN: None if mapped is None else _text(mapped[row]),
+                            'value': _number(column[row])})
+            metrics[metric] = {'unit': HOTSPOT_METRICS[metric], **percentile_summary(column), 'top': top}
+        groups, breakdown = mapped_breakdown(df, values, n)
+        summary = {
+            'tables': int(len(df)),
+            'top_n': n,
+            'reference_time': None if reference_time is None or pd.isna(reference_time) else reference_time.isoformat() + 'Z',
+            'metrics': metrics,
+            'by_mapped_source_table': {'groups': groups, 'rows': breakdown},
+            'stage_shares': stage_shares(df),
+        }
+    logger.debug("Hotspot summary of %d tables: %d metrics, %d mapped groups", len(df), len(metrics), groups)
+    return summary
+
+
+def summary_frame(df, n=HOTSPOT_TOP_N):
+    """hotspot_summary() as its JSON text in a one-cell frame, the form it is cached in."""
+    return pd.DataFrame({SUMMARY_COLUMN: [json.dumps(hotspot_summary(df, n))]})
+
+
+def summary_json(frame):
+    """The JSON text cached by summary_frame()."""
+    return frame[SUMMARY_COLUMN].iat[0]
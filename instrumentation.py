@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Logging ---
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(process)d]: %(message)s'
+DEFAULT_LOG_LEVEL = 'INFO'
+
+
+def configure_logging(level=None):
+    """Sets up the root logger (stderr) unless the host (e.g. gunicorn) already did. Level from LOG_LEVEL."""
+    level = (level or os.environ.get('LOG_LEVEL') or DEFAULT_LOG_LEVEL).upper()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+# --- Stage timing (Prometheus-style metrics) ---
+# Each stage is timed per block or per call, never per line, so the overhead stays flat.
+STAGE_DECODE = 'decode' # Reading (and decompressing) input blocks
+STAGE_CLASSIFY = 'classify' # Regex classification of a block's lines
+STAGE_CONVERT = 'convert' # State machine, value conversion and typed column appends
+STAGE_TYPE_INFERENCE = 'type_inference' # Column buffers -> typed arrays (Int64, datetime64, strings)
+STAGE_BUILD_DATAFRAME = 'build_dataframe'
+STAGE_FILTER = 'filter'
+STAGE_SQL_FORMAT = 'sql_format'
+STAGE_EXPORT = 'export' # Parquet/Arrow/CSV export
+STAGE_SUMMARY = 'summary' # Hotspot rollups (top-N, percentiles, breakdowns)
+STAGE_DB_LOAD = 'db_load'
+STAGE_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRICS_DIR_VARIABLE = 'PROMETHEUS_MULTIPROC_DIR'
+
+# With PROMETHEUS_MULTIPROC_DIR set when the metrics are created, every process (web workers,
+# parse jobs, parallel parse workers) writes its samples there and /metrics adds them up.
+# prometheus_client picks its mode when it is imported, so it is imported with the metrics,
+# on first use, and setup_multiprocess_dir() can run any time before that.
+prometheus_client = prometheus_multiprocess = None
+METRICS_DIR = None
+STAGE_SECONDS = PARSED_BYTES = PARSED_LINES = PARSED_TABLES = REQUEST_SECONDS = None
+_metrics_created = False
+_metrics_lock = threading.Lock()
+
+
+def _remove_metrics_dir(path, owner_pid):
+    if os.getpid() == owner_pid: # Forked workers (e.g. gunicorn --preload) share the directory but don't remove it
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def setup_multiprocess_dir():
+    """
+    Unless PROMETHEUS_MULTIPROC_DIR is set, points it at a new empty directory (removed when this
+    process exits), so the processes of one app instance pool their samples and none of an
+    earlier run's are counted. Must run before the first metric is recorded (else this process's
+    samples stay its own). Returns the directory, or None when that was too late.
+    """
+    if _metrics_created:
+        logger.warning("Metrics were recorded before setup_multiprocess_dir(); they are not pooled across processes")
+        return None
+    directory = os.environ.get(METRICS_DIR_VARIABLE)
+    if not directory:
+        directory = tempfile.mkdtemp(prefix='mon_metrics_')
+        os.environ[METRICS_DIR_VARIABLE] = directory # Inherited by the worker processes
+        atexit.register(_remove_metrics_dir, directory, os.getpid())
+    return directory
+
+
+def _create_metrics():
+    """Imports prometheus_client and creates the metrics, once; without prometheus_client they stay None."""
+    global prometheus_client, prometheus_multiprocess, METRICS_DIR, _metrics_created
+    global STAGE_SECONDS, PARSED_BYTES, PARSED_LINES, PARSED_TABLES, REQUEST_SECONDS
+    with _metrics_lock:
+        if _metrics_created:
+            return
+        _metrics_created = True
+        try:
+            import prometheus_client
+            from prometheus_client import multiprocess as prometheus_multiprocess
+        except ImportError: # Only needed for the /metrics endpoint
+            return
+        METRICS_DIR = os.environ.get(METRICS_DIR_VARIABLE)
+        if METRICS_DIR:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+        STAGE_SECONDS = prometheus_client.Histogram(
+            'mon_stage_seconds', 'Time spent per processing stage (one sample per block or call)', ['stage'],
+            buckets=STAGE_SECONDS_BUCKETS)
+        PARSED_BYTES = prometheus_client.Counter('mon_parsed_bytes', 'Bytes of mon output parsed')
+        PARSED_LINES = prometheus_client.Counter('mon_parsed_lines', 'Lines of mon output parsed')
+        PARSED_TABLES = prometheus_client.Counter('mon_parsed_tables', 'Table records built from mon output')
+        REQUEST_SECONDS = prometheus_client.Histogram(
+            'mon_http_request_seconds', 'Web request latency', ['endpoint', 'method', 'status'],
+            buckets=REQUEST_SECONDS_BUCKETS)
+
+
+def observe_stage(stage, seconds):
+    """Records one timed sample of a stage."""
+    if not _metrics_created:
+        _create_metrics()
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s took %.6fs", stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one sample of `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def timed_chunks(stage, chunks):
+    """
+    Passes the chunks of a generator through, timing only the work done producing them (not
+    the consumer's), and records the total as one sample of `stage` when it is exhausted or closed.
+    """
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                spent += time.perf_counter() - started
+                return
+            spent += time.perf_counter() - started
+            yield chunk
+    finally:
+        observe_stage(stage, spent)
+
+
+def count_parsed(bytes_read=0, lines=0, tables=0):
+    if not _metrics_created:
+        _create_metrics()
+    if PARSED_BYTES is None:
+        return
+    if bytes_read:
+        PARSED_BYTES.inc(bytes_read)
+    if lines:
+        PARSED_LINES.inc(lines)
+    if tables:
+        PARSED_TABLES.inc(tables)
+
+
+def observe_request(endpoint, method, status, seconds):
+    if not _metrics_created:
+        _create_metrics()
+    if REQUEST_SECONDS is not None:
+        REQUEST_SECONDS.labels(endpoint or 'unknown', method, str(status)).observe(seconds)
+
+
+def metrics_payload():
+    """(body, content type) in the Prometheus text format, pooled across processes when METRICS_DIR is set."""
+    if not _metrics_created:
+        _create_metrics()
+    if prometheus_client is None:
+        raise RuntimeError("Metrics require prometheus_client (pip install prometheus_client).")
+    if METRICS_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        prometheus_multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
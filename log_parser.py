@@ -0,0 +1,1600 @@
+import array
+import datetime
+import itertools
+import logging
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from table_schema import TABLE_SCHEMA
+from compressed_input import detect_compression, open_log_input
+from instrumentation import (STAGE_DECODE, STAGE_CLASSIFY, STAGE_CONVERT, STAGE_TYPE_INFERENCE,
+                             STAGE_BUILD_DATAFRAME, observe_stage, count_parsed, span)
+
+logger = logging.getLogger(__name__)
+
+# --- Box-drawing layout of the `mon` output ---
+# Every line we care about starts with the (empty) first column of the box.
+# A table header adds '   "' right after it, key/value lines are indented further.
+KV_START = '│                                             │'
+BOX_EDGE = '│'
+
+# --- Parser states ---
+# The two bits mirror the original script's insideLastBatch / insideIntegrationTime flags.
+STATE_TABLE = 0                    # top-level key/value lines of a table
+STATE_LAST_BATCH = 1               # inside the "Last batch info" block (keys get prefixed)
+STATE_INTEGRATION_TIME = 2         # inside an "Integration Task Time" block
+STATE_LAST_BATCH_INTEGRATION_TIME = STATE_LAST_BATCH | STATE_INTEGRATION_TIME
+
+# A line without a colon (a closing brace) leaves the innermost open block
+CLOSE_BLOCK = {
+    STATE_TABLE: STATE_TABLE,
+    STATE_LAST_BATCH: STATE_TABLE,
+    STATE_INTEGRATION_TIME: STATE_TABLE,
+    STATE_LAST_BATCH_INTEGRATION_TIME: STATE_LAST_BATCH,
+}
+
+LAST_BATCH_MARKER = 'last_batch_info'
+INTEGRATION_TIME_MARKER = 'integration_task_time'
+LAST_BATCH_PREFIX = 'last_batch_'
+BLOCK_MARKERS = {
+    LAST_BATCH_MARKER: STATE_LAST_BATCH,
+    INTEGRATION_TIME_MARKER: STATE_INTEGRATION_TIME,
+}
+
+# --- Line classification on raw bytes ---
+# One regex pass per block yields a tuple per line. The common shapes are matched completely:
+#   '│ ... │   "table name": {                │'  -> (quoted table name)
+#   '│ ... │     "Some Key": 1234,              │'  -> (raw key, digits)
+#   '│ ... │     "Some Key": "some text",      │'  -> (raw key, raw ASCII value)
+#   '│ ... │     },                            │'  -> (closing text)
+# anything else comes back as the raw line and goes through the exact per-line logic.
+# Key/value shapes need at least five spaces of indentation, so they can be neither headers
+# nor the original's "misplaced header" lines; closing lines contain no quote at all.
+BLOCK_SIZE = 1 << 20
+_KV = re.escape(KV_START.encode('utf-8'))
+_EDGE = re.escape(BOX_EDGE.encode('utf-8'))
+_BLOCK_RE = re.compile(
+    rb'\n(?:' + _KV + rb'(?:'
+    + rb'   ("[^"\n]*")[ -~]*' + _EDGE
+    + rb'| {5,}"([^"\n:]+)":(?: *([0-9]+),? *' + _EDGE + rb'|([ -~]*)' + _EDGE + rb')'
+    + rb'|([ !#-9;-~]*' + _EDGE + rb')'
+    + rb')[ \r]*$|([^\n]*))',
+    re.MULTILINE)
+
+
+def iter_blocks(log_stream, block_size=BLOCK_SIZE):
+    """Yields blocks of whole lines (bytes) from a binary stream or an iterable of byte lines."""
+    if hasattr(log_stream, 'read'):
+        remainder = b''
+        while True:
+            started = time.perf_counter()
+            chunk = log_stream.read(block_size)
+            observe_stage(STAGE_DECODE, time.perf_counter() - started)
+            if not chunk:
+                break
+            cut = chunk.rfind(b'\n') + 1
+            if cut == 0:
+                remainder += chunk
+                continue
+            yield remainder + memoryview(chunk)[:cut] # One copy, not a slice and then a join
+            remainder = chunk[cut:]
+        if remainder:
+            yield remainder
+    else:
+        lines = []
+        size = 0
+        for line_bytes in log_stream:
+            if not line_bytes.endswith(b'\n'):
+                line_bytes += b'\n' # Keep line boundaries when joining
+            lines.append(line_bytes)
+            size += len(line_bytes)
+            if size >= block_size:
+                yield b''.join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield b''.join(lines)
+
+
+def iter_block_ranges(log_stream, block_size=BLOCK_SIZE):
+    """
+    Like iter_blocks(), but yields (buffer, start, stop) with whole lines in buffer[start:stop],
+    so each read of a binary stream is parsed where it is instead of copied into a block: the
+    line that spans two reads comes on its own before the rest of the second.
+    """
+    if not hasattr(log_stream, 'read'):
+        for block in iter_blocks(log_stream, block_size):
+            yield block, 0, len(block)
+        return
+    remainder = b''
+    while True:
+        started = time.perf_counter()
+        chunk = log_stream.read(block_size)
+        observe_stage(STAGE_DECODE, time.perf_counter() - started)
+        if not chunk:
+            break
+        cut = chunk.rfind(b'\n') + 1
+        if cut == 0:
+            remainder += chunk
+            continue
+        head = 0
+        if remainder:
+            head = chunk.find(b'\n') + 1
+            line = remainder + chunk[:head]
+            yield line, 0, len(line)
+        if head < cut:
+            yield chunk, head, cut
+        remainder = chunk[cut:]
+    if remainder:
+        yield remainder, 0, len(remainder)
+
+
+def convert_value(value):
+    """Converts a cleaned value string: int first, then ISO datetime, else keep the string."""
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            return value
+
+
+def normalize_key(raw_key):
+    """'Avg Batch-Size' -> 'avg_batch_size'"""
+    return raw_key.strip().replace(" ", "_").replace('-', '_').lower()
+
+
+class MonLogParser:
+    """
+    Single-pass state machine over the `mon` box-drawing layout.
+    Produces exactly the same table records as parse_log_stream_reference(),
+    with one classification per line and no per-line console output.
+    """
+    block_size = BLOCK_SIZE
+
+    def __init__(self, sink=None):
+        # Finished tables go to sink (e.g. TypedColumnBuilder.append_record) or into self.records
+        self.records = []
+        self.emit = sink if sink is not None else self.records.append
+        self.current_table_data = None
+        self.state = STATE_TABLE
+        self.line_number = 0
+        self.key_errors = 0
+        # Raw key bytes -> (key, prefixed key, marker state bits); the same few dozen keys
+        # repeat for every table, so each is decoded and normalized once.
+        self._key_cache = {}
+
+    @property
+    def insideLastBatch(self):
+        return bool(self.state & STATE_LAST_BATCH)
+
+    @property
+    def insideIntegrationTime(self):
+        return bool(self.state & STATE_INTEGRATION_TIME)
+
+    def _lookup_key(self, raw_key):
+        try:
+            key = normalize_key(raw_key.decode('utf-8'))
+        except UnicodeDecodeError:
+            entry = None
+        else:
+            entry = (key, LAST_BATCH_PREFIX + key, BLOCK_MARKERS.get(key, 0))
+        self._key_cache[raw_key] = entry
+        return entry
+
+    def feed(self, log_stream):
+        """Consumes a binary stream (or iterable of byte lines), updating the parser state."""
+        for block in iter_blocks(log_stream, self.block_size):
+            self.feed_block(block)
+        return self
+
+    def feed_block(self, block):
+        """Consumes one block of whole lines."""
+        lines = block.count(b'\n')
+        self.line_number += lines
+        count_parsed(len(block), lines)
+        return self._parse_block(block)
+
+    def _parse_block(self, block):
+        """The state machine over a block's lines (feed_block() without the line and byte counts)."""
+        # Hoist everything the loop touches into locals
+        emit = self.emit
+        current = self.current_table_data
+        state = self.state
+        key_cache = self._key_cache
+        lookup_key = self._lookup_key
+        feed_line = self._feed_line
+        close_block = CLOSE_BLOCK
+        last_batch = STATE_LAST_BATCH
+
+        started = time.perf_counter()
+        classified_lines = _BLOCK_RE.findall(b'\n' + block)
+        classified = time.perf_counter()
+        observe_stage(STAGE_CLASSIFY, classified - started)
+
+        for header, raw_key, digits, text, closing, line_bytes in classified_lines:
+            if digits:
+                # --- Plain integer key/value line ---
+                if current is None:
+                    continue
+                entry = key_cache.get(raw_key) or lookup_key(raw_key)
+                if entry is None:
+                    continue
+                key, prefixed_key, marker = entry
+                if marker:
+                    state |= marker
+                current[prefixed_key if state & last_batch else key] = int(digits)
+
+            elif raw_key:
+                # --- Any other ASCII key/value line (markers, timestamps, names) ---
+                if current is None:
+                    continue
+                entry = key_cache.get(raw_key) or lookup_key(raw_key)
+                if entry is None:
+                    continue
+                key, prefixed_key, marker = entry
+                if marker:
+                    state |= marker
+                value = text.replace(b',', b'').replace(b'"', b'').strip()
+                if value == b'{':
+                    continue
+                # Both int() and fromisoformat() need a leading digit (or sign) to succeed
+                if value[:1].isdigit() or value[:1] in b'+-':
+                    current[prefixed_key if state & last_batch else key] = convert_value(value.decode('ascii'))
+                else:
+                    current[prefixed_key if state & last_batch else key] = value.decode('ascii')
+
+            elif header:
+                # --- Header: a new table starts ---
+                try:
+                    table_name = header[1:-1].decode('utf-8')
+                except UnicodeDecodeError:
+                    continue
+                if current:
+                    emit(current)
+                current = {'source_table_name': table_name}
+                state = STATE_TABLE
+
+            elif closing:
+                # --- Closing line (no colon) leaves the innermost block ---
+                if current is not None:
+                    state = close_block[state]
+
+            elif line_bytes:
+                self.current_table_data = current
+                self.state = state
+                feed_line(line_bytes)
+                current = self.current_table_data
+                state = self.state
+
+        self.current_table_data = current
+        self.state = state
+        observe_stage(STAGE_CONVERT, time.perf_counter() - classified)
+        return self
+
+    def _feed_line(self, line_bytes):
+        """Exact per-line logic for everything that is not a plain integer line."""
+        try:
+            line = line_bytes.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            # The original falls back to latin-1, which can never produce a box line
+            return
+        if not line.startswith(KV_START) or not line.endswith(BOX_EDGE):
+            return
+        marker = line[len(KV_START):len(KV_START) + 5]
+
+        # --- Header: '│ ... │   "table name" ...│' starts a new table ---
+        if marker.startswith('   "'):
+            if self.current_table_data:
+                self.emit(self.current_table_data)
+            self.current_table_data = {'source_table_name': line.split('"', 2)[1]}
+            self.state = STATE_TABLE
+            return
+
+        current = self.current_table_data
+        # Four-space indented quote: the original treats it as a misplaced header
+        if current is None or marker[1:] == '   "':
+            return
+
+        # --- Closing line (no colon) leaves the innermost block ---
+        key_part, colon, value_part = line.partition(':')
+        if not colon:
+            self.state = CLOSE_BLOCK[self.state]
+            return
+
+        pieces = key_part.split('"', 2)
+        if len(pieces) < 2:
+            if self.key_errors < 5: logger.warning("Could not extract key from: %s", key_part)
+            self.key_errors += 1
+            return
+        key = normalize_key(pieces[1])
+        self.state |= BLOCK_MARKERS.get(key, 0)
+        if self.state & STATE_LAST_BATCH:
+            key = LAST_BATCH_PREFIX + key
+
+        value = value_part.strip().replace(',', '').replace(BOX_EDGE, '').replace('"', '').strip()
+        if value != '{':
+            current[key] = convert_value(value)
+
+    def get_state(self):
+        """The state needed to resume parsing after the last fed line: open table, block flags, line count."""
+        current = self.current_table_data
+        return {'current_table': dict(current) if current is not None else None,
+                'state': self.state, 'line_number': self.line_number}
+
+    def set_state(self, saved):
+        """Restores a get_state() result, e.g. to continue a growing file from a checkpoint."""
+        current = saved.get('current_table')
+        self.current_table_data = dict(current) if current is not None else None
+        self.state = saved.get('state', STATE_TABLE)
+        self.line_number = saved.get('line_number', 0)
+        return self
+
+    def finish(self):
+        """Flushes the table in progress and returns all records (empty when using a sink)."""
+        if self.current_table_data:
+            self.emit(self.current_table_data)
+            self.current_table_data = None
+        return self.records
+
+
+def parse_log_records(log_stream):
+    """Parses a stream of byte lines into a list of per-table dicts."""
+    parser = MonLogParser()
+    parser.feed(log_stream)
+    records = parser.finish()
+    logger.debug("Finished stream parsing. Total lines read: %d, Tables: %d", parser.line_number, len(records))
+    return records
+
+
+# --- Typed column builder ---
+# Values go straight from the parser into per-column buffers typed by the DDL, so there is no
+# object-column DataFrame and no post-hoc to_datetime/to_numeric inference pass.
+EXTRA_FIELDS_COLUMN = 'extra_fields'
+INTERNED_COLUMNS = {'source_table_name', 'mapped_source_table'}
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_ONE_US = datetime.timedelta(microseconds=1)
+_NAT = np.iinfo(np.int64).min
+
+
+class IntColumn:
+    """int64 values with a null mask (INT columns)."""
+
+    def __init__(self):
+        self.values = array.array('q')
+        self.mask = bytearray() # 1 = missing
+
+    def pad(self, rows):
+        missing = rows - len(self.values)
+        if missing > 0:
+            self.values.frombytes(bytes(8 * missing))
+            self.mask.extend(b'\x01' * missing)
+
+    def append(self, row, value):
+        if type(value) is not int:
+            return False
+        if len(self.values) < row:
+            self.pad(row)
+        try:
+            self.values.append(value)
+        except OverflowError:
+            return False
+        self.mask.append(0)
+        return True
+
+    def put(self, row, value):
+        """Like append(), but also fills in a row that is already there (TypedColumnBuilder.append_rows())."""
+        if row >= len(self.values):
+            return self.append(row, value)
+        if type(value) is not int:
+            return False
+        try:
+            self.values[row] = value
+        except OverflowError:
+            return False
+        self.mask[row] = 0
+        return True
+
+    def extend(self, other, rows, other_rows):
+        self.pad(rows)
+        other.pad(other_rows)
+        self.values.extend(other.values)
+        self.mask.extend(other.mask)
+
+    def extend_values(self, rows, values, missing):
+        """Appends a block of rows after the first `rows`: int64 values and their missing flags (uint8)."""
+        self.pad(rows)
+        self.values.frombytes(values.tobytes())
+        self.mask.extend(missing)
+
+    def to_array(self, rows):
+        self.pad(rows)
+        # Views over the buffers, no copy
+        return pd.arrays.IntegerArray(np.frombuffer(self.values, dtype=np.int64),
+                                      np.frombuffer(self.mask, dtype=np.bool_))
+
+
+class TimestampColumn(IntColumn):
+    """datetime64[us] values (TIMESTAMP columns); offset-aware values are stored as UTC."""
+
+    def __init__(self):
+        super().__init__()
+        self.tz_aware = False
+
+    def pad(self, rows):
+        missing = rows - len(self.values)
+        if missing > 0:
+            self.values.extend(array.array('q', [_NAT]) * missing)
+
+    def append(self, row, value):
+        if not isinstance(value, datetime.datetime):
+            return False
+        if len(self.values) < row:
+            self.pad(row)
+        if value.tzinfo is not None:
+            self.tz_aware = True
+            self.values.append((value - _EPOCH_UTC) // _ONE_US)
+        else:
+            self.values.append((value - _EPOCH) // _ONE_US)
+        return True
+
+    def put(self, row, value):
+        if row >= len(self.values) or not isinstance(value, datetime.datetime):
+            return self.append(row, value)
+        if value.tzinfo is not None:
+            self.tz_aware = True
+            self.values[row] = (value - _EPOCH_UTC) // _ONE_US
+        else:
+            self.values[row] = (value - _EPOCH) // _ONE_US
+        return True
+
+    def extend_values(self, rows, values, missing):
+        """Appends a block of rows after the first `rows`: UTC microseconds and their missing flags."""
+        self.pad(rows)
+        self.values.frombytes(np.where(missing, _NAT, values).tobytes())
+        if not missing.all():
+            self.tz_aware = True
+
+    def extend(self, other, rows, other_rows):
+        self.pad(rows)
+        other.pad(other_rows)
+        self.values.extend(other.values)
+        self.tz_aware = self.tz_aware or other.tz_aware
+
+    def to_array(self, rows):
+        self.pad(rows)
+        values = pd.Series(np.frombuffer(self.values, dtype=np.int64).view('datetime64[us]'), copy=False)
+        return values.dt.tz_localize('UTC') if self.tz_aware else values
+
+
+class StringColumn:
+    """Python strings (VARCHAR columns); repeated names share one interned object."""
+
+    def __init__(self, intern=False):
+        self.values = []
+        self.intern = intern
+
+    def pad(self, rows):
+        missing = rows - len(self.values)
+        if missing > 0:
+            self.values.extend([None] * missing)
+
+    def append(self, row, value):
+        if type(value) is int:
+            value = str(value) # e.g. a purely numeric table name
+        elif type(value) is not str:
+            return False
+        if len(self.values) < row:
+            self.pad(row)
+        self.values.append(sys.intern(value) if self.intern else value)
+        return True
+
+    put = append # String columns are filled in bulk only by extend_values(), so rows here arrive in order
+
+    def extend_values(self, rows, values):
+        """Appends a block of rows after the first `rows`: strings, None where missing."""
+        self.pad(rows)
+        if self.intern:
+            values = [None if value is None else sys.intern(value) for value in values]
+        self.values.extend(values)
+
+    def extend(self, other, rows, other_rows):
+        self.pad(rows)
+        other.pad(other_rows)
+        if self.intern:
+            # Interning does not survive pickling between processes
+            self.values.extend([None if value is None else sys.intern(value) for value in other.values])
+        else:
+            self.values.extend(other.values)
+
+    def to_array(self, rows):
+        self.pad(rows)
+        return np.array(self.values, dtype=object)
+
+
+COLUMN_TYPES = {
+    'INT': IntColumn,
+    'INTEGER': IntColumn,
+    'BIGINT': IntColumn,
+    'TIMESTAMP': TimestampColumn,
+    'VARCHAR': StringColumn,
+    'TEXT': StringColumn,
+}
+
+
+class TypedColumnBuilder:
+    """
+    Collects table records into typed columns driven by the table schema (dw_stats_table.sql).
+    Keys outside the schema, and values that do not fit the declared type, are kept per row
+    in a sparse EXTRA_FIELDS_COLUMN.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = TABLE_SCHEMA if schema is None else schema
+        self.row_count = 0
+        self.extra_fields = {} # row -> {key: value}
+        self._columns = {}
+
+    def _new_column(self, key):
+        sql_type = self.schema.get(key)
+        column_type = COLUMN_TYPES.get(sql_type)
+        if column_type is None:
+            if sql_type is not None:
+                logger.warning("Unsupported SQL type %s for column %s; keeping it in %s.", sql_type, key, EXTRA_FIELDS_COLUMN)
+            column = None
+        elif column_type is StringColumn:
+            column = StringColumn(intern=key in INTERNED_COLUMNS)
+        else:
+            column = column_type()
+        self._columns[key] = column
+        return column
+
+    def append_record(self, record):
+        row = self.row_count
+        columns = self._columns
+        for key, value in record.items():
+            column = columns.get(key, False)
+            if column is False:
+                column = self._new_column(key)
+            if column is None or not column.append(row, value):
+                self.extra_fields.setdefault(row, {})[key] = value
+        self.row_count = row + 1
+
+    def column(self, key):
+        """The column that values of key go into (None: they are kept in the extra fields)."""
+        column = self._columns.get(key, False)
+        if column is False:
+            column = self._new_column(key)
+        return column
+
+    def append_rows(self, records, bulk_columns, values, missing):
+        """
+        Appends len(records) rows at once (see ColumnarLogParser): bulk_columns[i] takes values[i]
+        and missing[i], one entry per row, then each record's fields go in as in append_record().
+        """
+        rows = self.row_count
+        for column, column_values, column_missing in zip(bulk_columns, values, missing):
+            column.extend_values(rows, column_values, column_missing)
+        # String fields (e.g. the table names) that all fit go in a column at a time
+        bulk_keys = set()
+        for key in dict.fromkeys(itertools.chain.from_iterable(records)):
+            column = self.column(key)
+            if type(column) is StringColumn:
+                column_values = [record.get(key) for record in records]
+                if all(type(value) is str for value in column_values if value is not None):
+                    column.extend_values(rows, column_values)
+                    bulk_keys.add(key)
+        columns = self._columns
+        for row, record in enumerate(records, rows):
+            if bulk_keys.issuperset(record):
+                continue
+            for key, value in record.items():
+                if key not in bulk_keys:
+                    column = columns[key]
+                    if column is None or not column.put(row, value):
+                        self.extra_fields.setdefault(row, {})[key] = value
+        self.row_count = rows + len(records)
+
+    def merge(self, other):
+        """Appends the rows of another builder (e.g. from a parallel chunk) after our own."""
+        rows = self.row_count
+        for key, other_column in other._columns.items():
+            column = self._columns.get(key, False)
+            if column is False:
+                column = self._new_column(key)
+            if column is not None:
+                column.extend(other_column, rows, other.row_count)
+        for row, fields in other.extra_fields.items():
+            self.extra_fields[rows + row] = fields
+        self.row_count = rows + other.row_count
+
+    def to_dataframe(self, all_columns=False):
+        """
+        Assembles the DataFrame (schema columns in DDL order, then the extra fields).
+        With all_columns=True every schema column and the extra fields are there even if no
+        record had them, and timestamps are UTC, so batches of one input share their dtypes.
+        """
+        rows = self.row_count
+        if not rows:
+            logger.debug("No data extracted into list.")
+            return pd.DataFrame()
+        count_parsed(tables=rows)
+        if all_columns:
+            for name in self.schema:
+                column = self._columns.get(name, False)
+                if column is False:
+                    column = self._new_column(name)
+                if isinstance(column, TimestampColumn):
+                    column.tz_aware = True # Naive values are taken as UTC, as SQL output does
+        with span(STAGE_TYPE_INFERENCE):
+            data = {name: self._columns[name].to_array(rows)
+                    for name in self.schema if self._columns.get(name) is not None}
+            if self.extra_fields or all_columns:
+                extras = np.full(rows, None, dtype=object)
+                for row, fields in self.extra_fields.items():
+                    extras[row] = fields
+                data[EXTRA_FIELDS_COLUMN] = extras
+        with span(STAGE_BUILD_DATAFRAME):
+            df = pd.DataFrame(data, copy=False)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Created DataFrame with %d rows and columns: %s", len(df), df.columns.tolist())
+        return df
+
+
+def build_dataframe(data_list, schema=None):
+    """Builds the typed DataFrame from a list of parsed records."""
+    builder = TypedColumnBuilder(schema)
+    for record in data_list:
+        builder.append_record(record)
+    return builder.to_dataframe()
+
+
+# --- Columnar block parsing (numpy) ---
+# ColumnarLogParser classifies every line of a block at once, on a uint64 view that starts at
+# each byte, so the common shapes never go through a per-line Python loop:
+#   '│ ... │     "Some Key": 1234,          │'  -> key code and value, written straight to a column
+#   '│ ... │     "Some Key": "2024-...Z",   │'  -> key code and UTC microseconds, likewise
+#   '│ ... │   "table name": {              │'  -> new table event
+#   '│ ... │     "Some Key": {              │'  -> block marker event
+#   '│ ... │     },                         │'  -> closing event
+# Only events (tables, markers, closings, other text and every line it can't prove to be one
+# of the shapes) run through a Python loop that tracks the table and block state; the plain
+# lines take theirs from the event before them. The spaces the shapes claim (inside the frame,
+# around the value and up to the right edge) are checked against the block's real count, and
+# lines that don't add up take the exact path, so the records are the same as MonLogParser's.
+_PADDING = bytes(256) # Reads run up to about 140 bytes past the end of a line
+_LINE_OTHER = 0       # anything else: the exact per-line logic
+_LINE_HEADER = 1      # any other header: also the exact logic
+_LINE_IGNORE = 2      # a key that doesn't decode: skipped, as the exact logic does
+_LINE_CLOSE = 3
+_LINE_TABLE = 4
+_LINE_MARKER = 5
+_LINE_INT = 6
+_LINE_TEXT = 7
+_LINE_TIMESTAMP = 8
+COLUMNAR_BLOCK_SIZE = 8 << 20 # Larger blocks spread numpy's per-call overhead over more lines
+_MAX_DIGITS = 15      # Integers that always fit int64
+_SCAN_WORDS = 8       # Keys, text values and runs of spaces up to 64 bytes
+_KV_START_BYTES = KV_START.encode('utf-8')
+_TIMESTAMP_SHAPE = b'0000-00-00T00:00:00.000Z'
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+_U64 = np.uint64
+_LOW7 = _U64(0x7F7F7F7F7F7F7F7F)
+_HIGH = _U64(0x8080808080808080)
+_NIBBLES = _U64(0x0F0F0F0F0F0F0F0F)
+_ALL_BYTES = _U64(0xFFFFFFFFFFFFFFFF)
+_EDGE_MASK = _U64(0xFFFFFF)
+_EDGE_WORD = _U64(int.from_bytes(BOX_EDGE.encode('utf-8'), 'little'))
+_HASH_MULTIPLIER = _U64(0x9E3779B97F4A7C15)
+
+
+def _byte_word(char):
+    return _U64(int.from_bytes(char * 8, 'little'))
+
+
+_SPACES = _byte_word(b' ')
+_QUOTES = _byte_word(b'"')
+_DIGIT_ZEROS = _byte_word(b'0')
+_ABOVE_NINE = _byte_word(b'\x46') # Adding 0x7F - '9' sets the high bit of bytes above '9'
+
+
+def _words(buffer):
+    """Little-endian uint64 starting at every byte of buffer (a view, no copy)."""
+    return np.ndarray((len(buffer) - 7,), '<u8', buffer=buffer, strides=(1,))
+
+
+def _zero_bytes(words):
+    """0x80 in every byte of the words that is zero (exact: no borrows between bytes)."""
+    return ~(((words & _LOW7) + _LOW7) | words) & _HIGH
+
+
+def _non_digits(words):
+    """0x80 in every byte of the words that is not an ASCII digit."""
+    low = words & _LOW7
+    return (words & _HIGH) | (~((low | _HIGH) - _DIGIT_ZEROS) & _HIGH) | ((low + _ABOVE_NINE) & _HIGH)
+
+
+_BYTE_MASKS = np.array([(1 << 8 * count) - 1 for count in range(8)] + [(1 << 64) - 1], np.uint64)
+
+
+def _byte_masks(counts):
+    """Masks of the first counts (0..8) bytes of a word."""
+    return _BYTE_MASKS[counts]
+
+
+def _first_flagged(flags):
+    """Index of the lowest byte with 0x80 set in each word (8 where none is)."""
+    return (np.bitwise_count(~flags & (flags - _U64(1))) >> 3).astype(np.int64) # Trailing zero bits / 8
+
+
+def _find_byte(words, positions, byte_word, equal=True):
+    """
+    Offset of the first byte at or after each position that is (with equal=False: is not)
+    the byte of byte_word, within _SCAN_WORDS words; -1 where there is none.
+    """
+    found = np.full(len(positions), -1, np.int64)
+    pending = np.arange(len(positions))
+    at = positions
+    for word in range(_SCAN_WORDS):
+        flags = _zero_bytes(words[at] ^ byte_word)
+        first = _first_flagged(flags if equal else ~flags & _HIGH)
+        hit = first < 8
+        if hit.all():
+            found[pending] = at + first
+            break
+        found[pending[hit]] = at[hit] + first[hit]
+        miss = ~hit
+        pending, at = pending[miss], at[miss] + 8
+    return found
+
+
+def _scan_keys(words, starts):
+    """
+    Like _find_byte() for the closing quote of the keys at starts, hashing the key bytes on
+    the way. Also returns, for each word read, the keys still pending and their bytes in it
+    (zero from the quote on), which _key_codes() compares.
+    """
+    ends = np.full(len(starts), -1, np.int64)
+    hashes = np.zeros(len(starts), np.uint64)
+    scanned = []
+    pending = np.arange(len(starts))
+    at = starts
+    hashed = np.zeros(len(starts), np.uint64)
+    for word in range(_SCAN_WORDS):
+        scan = words[at]
+        first = _first_flagged(_zero_bytes(scan ^ _QUOTES))
+        scan &= _byte_masks(first)
+        hashed = hashed * _HASH_MULTIPLIER ^ scan
+        scanned.append((pending, scan))
+        hit = first < 8
+        if hit.all():
+            ends[pending] = at + first
+            hashes[pending] = hashed
+            break
+        ends[pending[hit]] = at[hit] + first[hit]
+        hashes[pending[hit]] = hashed[hit]
+        miss = ~hit
+        pending, at, hashed = pending[miss], at[miss] + 8, hashed[miss]
+    return ends, hashes, scanned
+
+
+def _count_spaces(words, starts, ends):
+    """Spaces in each byte range (at most _SCAN_WORDS words long)."""
+    spaces = np.zeros(len(starts), np.int64)
+    for word in range(_SCAN_WORDS):
+        left = np.clip(ends - starts - 8 * word, 0, 8)
+        if not left.any():
+            break
+        spaces += np.bitwise_count(_zero_bytes(words[starts + 8 * word] ^ _SPACES) & _byte_masks(left))
+    return spaces
+
+
+def _digits_value(words, counts):
+    """Value of the first counts (1..8) ASCII digits of each word."""
+    value = (words & _NIBBLES) << ((8 - counts) * 8).astype(np.uint64)
+    value = ((value * _U64(2561)) >> _U64(8)) & _U64(0x00FF00FF00FF00FF)
+    value = ((value * _U64(6553601)) >> _U64(16)) & _U64(0x0000FFFF0000FFFF)
+    return ((value * _U64(42949672960001)) >> _U64(32)).astype(np.int64)
+
+
+def _timestamp_micros(chars, positions):
+    """
+    UTC microseconds of the 'YYYY-MM-DDTHH:MM:SS.fffZ' values at each position, and a mask of
+    those that have this shape and a valid date and time (all that convert_value() accepts).
+    """
+    text = chars[positions[:, None] + np.arange(len(_TIMESTAMP_SHAPE))]
+    shape = np.frombuffer(_TIMESTAMP_SHAPE, np.uint8)
+    is_digit = shape == ord('0')
+    digits = text.astype(np.int64) - ord('0')
+    valid = ((text[:, ~is_digit] == shape[~is_digit]).all(axis=1)
+             & ((digits[:, is_digit] >= 0) & (digits[:, is_digit] <= 9)).all(axis=1))
+    year = digits[:, 0:4] @ [1000, 100, 10, 1]
+    month = digits[:, 5:7] @ [10, 1]
+    day = digits[:, 8:10] @ [10, 1]
+    hour = digits[:, 11:13] @ [10, 1]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = _DAYS_IN_MONTH[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    valid &= ((year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+              & (hour < 24) & (digits[:, 14] < 6) & (digits[:, 17] < 6))
+    # Days since 1970-01-01 of the proleptic Gregorian date, counting years from March
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year - 719468
+    seconds = days * 86400 + hour * 3600 + (digits[:, 14:16] @ [10, 1]) * 60 + digits[:, 17:19] @ [10, 1]
+    return seconds * 1000000 + (digits[:, 20:23] @ [100, 10, 1]) * 1000, valid
+
+
+def _classify_lines(buffer, start, stop):
+    """
+    Classifies the lines of buffer[start:stop] (whole lines, with len(_PADDING) bytes or more
+    after them). Returns per line: start and end ('\\n') offsets, the _LINE_* kind, the key's
+    and the text value's byte ranges, the integer (or UTC microseconds) value, the spaces the
+    shape claims (not counting those inside the key) and the key code (see _key_codes()); then
+    the line of each code's first key.
+    """
+    chars = np.frombuffer(buffer, np.uint8)
+    words = _words(buffer)
+    ends = np.flatnonzero(chars[start:stop] == ord('\n')) + start
+    starts = np.empty_like(ends)
+    starts[:1] = start
+    starts[1:] = ends[:-1] + 1
+    count = len(ends)
+    kinds = np.zeros(count, np.int8)
+    key_starts = np.zeros(count, np.int64)
+    key_ends = np.zeros(count, np.int64)
+    value_starts = np.zeros(count, np.int64)
+    value_ends = np.zeros(count, np.int64)
+    numbers = np.zeros(count, np.int64)
+    claims = np.zeros(count, np.int64)
+    codes = np.full(count, -1, np.int64)
+    tails = np.zeros(count, np.int64) # Where the shape ends (before an optional ',')
+
+    # --- Framed lines: '│' at the start, after the first column and at the end (before a '\r') ---
+    edges = ends - len(BOX_EDGE.encode('utf-8')) - (chars[ends - 1] == ord('\r'))
+    lines = np.flatnonzero((ends - starts >= len(_KV_START_BYTES) + 4) # Shorter lines read the next one's bytes
+                           & (words[starts] & _EDGE_MASK == _EDGE_WORD)
+                           & (words[starts + len(_KV_START_BYTES) - 3] & _EDGE_MASK == _EDGE_WORD)
+                           & (words[edges] & _EDGE_MASK == _EDGE_WORD))
+    content = starts[lines] + len(_KV_START_BYTES)
+    # Every shape is indented by 3 or more: the spaces check covers the first 3 bytes
+    first = _find_byte(words, content + 3, _SPACES, equal=False)
+    leads = np.where(first < 0, 0, chars[first])
+    claims[lines] = len(_KV_START_BYTES) - 6 + first - content
+    closing = leads == ord('}')
+    kinds[lines[closing]] = _LINE_CLOSE
+    tails[lines[closing]] = first[closing] + 1
+
+    # --- Headers: '"table name": {' ---
+    header = (first - content == 3) & (leads == ord('"'))
+    header_lines = lines[header]
+    kinds[header_lines] = _LINE_HEADER
+    name_start = first[header] + 1
+    name_end = _find_byte(words, name_start, _QUOTES)
+    table = ((name_end >= 0) & (name_end < edges[header_lines])
+             & (words[name_end] & _EDGE_MASK == _U64(int.from_bytes(b'": ', 'little')))
+             & (chars[name_end + 3] == ord('{')))
+    header_lines, name_start, name_end = header_lines[table], name_start[table], name_end[table]
+    kinds[header_lines] = _LINE_TABLE
+    value_starts[header_lines] = name_start
+    value_ends[header_lines] = name_end
+    tails[header_lines] = name_end + 4
+    claims[header_lines] += _count_spaces(words, name_start, name_end) + 1
+
+    # --- Key/value lines: '"key":', spaces, then digits, '{' or '"text"' ---
+    kv = (first - content >= 5) & (leads == ord('"'))
+    lines = lines[kv]
+    key_start = first[kv] + 1
+    key_end, key_hashes, scanned = _scan_keys(words, key_start)
+    key_lengths = key_end - key_start
+    kv = (key_end >= 0) & (key_end < edges[lines])
+    kv[kv] = chars[key_end[kv] + 1] == ord(':')
+    keys = np.flatnonzero(kv)
+    lines, key_start, key_end = lines[keys], key_start[keys], key_end[keys]
+    key_starts[lines] = key_start
+    key_ends[lines] = key_end
+    codes[lines], firsts = _key_codes(key_hashes, key_lengths, scanned, keys)
+    firsts = lines[firsts]
+    value_start = _find_byte(words, key_end + 2, _SPACES, equal=False)
+    claims[lines] += value_start - key_end - 2
+    leads = np.where(value_start < 0, 0, chars[value_start])
+
+    marker = leads == ord('{')
+    kinds[lines[marker]] = _LINE_MARKER
+    tails[lines[marker]] = value_start[marker] + 1
+
+    digit = (leads >= ord('0')) & (leads <= ord('9'))
+    at = value_start[digit]
+    digit_words = words[at]
+    digit_count = _first_flagged(_non_digits(digit_words))
+    number = _digits_value(digit_words, np.minimum(digit_count, 8))
+    long = digit_count == 8
+    low_count = _first_flagged(_non_digits(words[at[long] + 8]))
+    digit_count[long] += low_count
+    low = low_count > 0
+    long[long] = low
+    number[long] = number[long] * 10 ** low_count[low] + _digits_value(words[at[long] + 8], low_count[low])
+    fits = digit_count <= _MAX_DIGITS
+    digit_lines = lines[digit][fits]
+    kinds[digit_lines] = _LINE_INT
+    numbers[digit_lines] = number[fits]
+    tails[digit_lines] = (at + digit_count)[fits]
+
+    text = leads == ord('"')
+    text_lines = lines[text]
+    text_start = value_start[text] + 1
+    text_end = _find_byte(words, text_start, _QUOTES)
+    closed = (text_end >= 0) & (text_end < edges[text_lines])
+    text_lines, text_start, text_end = text_lines[closed], text_start[closed], text_end[closed]
+    kinds[text_lines] = _LINE_TEXT
+    value_starts[text_lines] = text_start
+    value_ends[text_lines] = text_end
+    tails[text_lines] = text_end + 1
+    claims[text_lines] += _count_spaces(words, text_start, text_end)
+    timestamp = np.flatnonzero(text_end - text_start == len(_TIMESTAMP_SHAPE))
+    micros, valid = _timestamp_micros(chars, text_start[timestamp])
+    kinds[text_lines[timestamp[valid]]] = _LINE_TIMESTAMP
+    numbers[text_lines[timestamp[valid]]] = micros[valid]
+
+    # --- Every shape ends with an optional ',' and spaces up to the right edge ---
+    shaped = np.flatnonzero(kinds >= _LINE_CLOSE)
+    tail = tails[shaped]
+    tail += chars[tail] == ord(',')
+    edge = edges[shaped]
+    kinds[shaped[(tail > edge) | ((tail < edge) & (chars[tail] != ord(' ')))]] = _LINE_OTHER
+    claims[shaped] += edge - tail
+    return starts, ends, kinds, key_starts, key_ends, value_starts, value_ends, numbers, claims, codes, firsts
+
+
+def _key_codes(hashes, lengths, scanned, keys):
+    """
+    Numbers the distinct keys among those _scan_keys() read (keys: their indices) in order of
+    first appearance. Returns a code per key (-1 on a hash collision: left to the exact logic)
+    and the index (into keys) of each code's first key.
+    """
+    codes = np.full(len(hashes), -1, np.int64)
+    codes[keys] = pd.factorize(hashes[keys] * _HASH_MULTIPLIER ^ lengths[keys].astype(np.uint64))[0]
+    firsts = np.flatnonzero(np.diff(np.maximum.accumulate(codes[keys]), prepend=-1))
+    first_keys = keys[firsts]
+    wrong = lengths != lengths[first_keys][codes]
+    for pending, scan in scanned:
+        # Each code's first key in this word (zero once it has ended; the lengths differ then)
+        found = np.searchsorted(pending, first_keys)
+        inside = found < len(pending)
+        inside[inside] = pending[found[inside]] == first_keys[inside]
+        first_words = np.zeros(len(first_keys), np.uint64)
+        first_words[inside] = scan[found[inside]]
+        wrong[pending] |= scan != first_words[codes[pending]]
+    codes[wrong] = -1
+    return codes[keys], firsts
+
+
+def _find_header_lines(block, start, stop):
+    """Offsets of the first and the last table header line in block[start:stop] (-1 when there is none)."""
+    def is_header_at(line_start):
+        end = block.find(b'\n', line_start, stop)
+        return _is_header_line(block[line_start:end if end >= 0 else stop])
+
+    first = start if block.startswith(_HEADER_LINE_START[1:], start, stop) and is_header_at(start) else -1
+    position = start
+    while first < 0:
+        found = block.find(_HEADER_LINE_START, position, stop)
+        if found < 0:
+            return -1, -1
+        if is_header_at(found + 1):
+            first = found + 1
+        position = found + 1
+    last = first
+    end = stop
+    while True:
+        found = block.rfind(_HEADER_LINE_START, first, end)
+        if found < 0:
+            break
+        if is_header_at(found + 1):
+            last = found + 1
+            break
+        end = found + len(_HEADER_LINE_START) - 1
+    return first, last
+
+
+def _block_states(kinds, markers, state):
+    """
+    The block state after each of a run of events (kinds and the marker bits of their keys),
+    starting from state. Table and other header lines start over, closing lines leave the
+    innermost block (CLOSE_BLOCK) and marked keys open theirs; other lines are taken not to
+    change it, which ColumnarLogParser checks as it goes.
+    """
+    order = np.arange(len(kinds))
+
+    def last(events, initial):
+        """Index of the last of the events so far (initial before the first)."""
+        return np.maximum.accumulate(np.where(events, order, initial))
+
+    reset = (kinds == _LINE_TABLE) | (kinds == _LINE_HEADER)
+    close = kinds == _LINE_CLOSE
+    # A bit is set after an event if the last key that set it comes after the last line that cleared it
+    integration = (last(markers & STATE_INTEGRATION_TIME != 0, -1 if state & STATE_INTEGRATION_TIME else -3)
+                   > last(reset | close, -2))
+    integration_before = np.concatenate(([state & STATE_INTEGRATION_TIME != 0], integration[:-1]))
+    last_batch = (last(markers & STATE_LAST_BATCH != 0, -1 if state & STATE_LAST_BATCH else -3)
+                  > last(reset | (close & ~integration_before), -2)) # CLOSE_BLOCK ends one block at a time
+    return last_batch * STATE_LAST_BATCH | integration * STATE_INTEGRATION_TIME
+
+
+def _discard(record):
+    pass
+
+
+def _text_value(raw_value):
+    """A quoted value converted as the exact logic does ('{' opens a block); None if it isn't UTF-8."""
+    try:
+        value = raw_value.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    value = value.replace(',', '').replace(BOX_EDGE, '').strip()
+    # Both int() and fromisoformat() need a leading digit (or sign) to succeed
+    if value[:1].isdigit() or value[:1] in '+-':
+        return convert_value(value)
+    return value
+
+
+class ColumnarLogParser(MonLogParser):
+    """
+    MonLogParser writing straight into a TypedColumnBuilder, with the whole tables of each block
+    classified and converted by numpy (see above). The lines before a block's first header and
+    from its last header on continue or start a table across blocks and take the exact path.
+    """
+
+    block_size = COLUMNAR_BLOCK_SIZE
+
+    def __init__(self, builder):
+        super().__init__(sink=builder.append_record)
+        self.builder = builder
+
+    def use_builder(self, builder):
+        """Sends the following tables to another builder (e.g. the next streamed batch)."""
+        self.builder = builder
+        self.emit = builder.append_record
+        return self
+
+    def feed(self, log_stream):
+        for buffer, start, stop in iter_block_ranges(log_stream, self.block_size):
+            self.feed_block(buffer, start, stop)
+        return self
+
+    def feed_block(self, block, start=0, stop=None):
+        """Consumes the whole lines in block[start:stop]."""
+        stop = len(block) if stop is None else stop
+        first, last = _find_header_lines(block, start, stop)
+        if last <= first:
+            return super().feed_block(block[start:stop] if start or stop < len(block) else block)
+        if first > start:
+            self._parse_block(block[start:first])
+        if self.current_table_data:
+            self.emit(self.current_table_data)
+        self.current_table_data = None
+        lines = (self._parse_tables(block, first, last) + block.count(b'\n', start, first)
+                 + block.count(b'\n', last, stop))
+        self._parse_block(block[last:stop])
+        self.line_number += lines
+        count_parsed(stop - start, lines)
+        return self
+
+    def _parse_tables(self, block, start, stop):
+        """
+        The columnar pass over the whole tables in block[start:stop] (from a header to right
+        before one). Returns the number of lines.
+        """
+        started = time.perf_counter()
+        buffer = block if len(block) - stop >= len(_PADDING) else block + _PADDING
+        (starts, ends, kinds, key_starts, key_ends, value_starts, value_ends, numbers, claims, codes,
+         firsts) = _classify_lines(buffer, start, stop)
+        keyed = np.flatnonzero(kinds >= _LINE_MARKER)
+        kinds[keyed[codes[keyed] < 0]] = _LINE_OTHER
+
+        # --- Distinct keys: decoded and normalized once each ---
+        key_cache = self._key_cache
+        entries = []
+        markers = np.zeros(len(firsts), np.int8)
+        key_kinds = np.zeros(len(firsts), np.int8) # _LINE_OTHER / _LINE_IGNORE overrides
+        key_spaces = np.zeros(len(firsts), np.int64)
+        for code, line in enumerate(firsts.tolist()):
+            raw_key = block[key_starts[line]:key_ends[line]]
+            entry = key_cache.get(raw_key) or self._lookup_key(raw_key)
+            entries.append(entry)
+            key_spaces[code] = raw_key.count(b' ')
+            if b':' in raw_key: # The exact logic splits at the first colon
+                key_kinds[code] = _LINE_OTHER
+            elif entry is None:
+                key_kinds[code] = _LINE_IGNORE
+            else:
+                key_kinds[code] = -1
+                markers[code] = entry[2]
+        keyed = keyed[codes[keyed] >= 0]
+        claims[keyed] += key_spaces[codes[keyed]]
+        override = key_kinds[codes[keyed]] >= 0
+        kinds[keyed[override]] = key_kinds[codes[keyed[override]]]
+        line_markers = np.zeros(len(kinds), np.int8)
+        line_markers[keyed] = markers[codes[keyed]]
+
+        # --- The spaces the shapes claim must all be there ---
+        shaped = kinds >= _LINE_IGNORE
+        exact = np.flatnonzero(~shaped)
+        spaces = np.frombuffer(buffer, np.uint8)[start:stop] == ord(' ')
+        claimed = int(claims[shaped].sum())
+        for line_start, line_end in zip(starts[exact].tolist(), ends[exact].tolist()):
+            claimed += block.count(b' ', line_start, line_end)
+        if claimed != np.count_nonzero(spaces):
+            counts = np.concatenate(([0], np.cumsum(spaces, dtype=np.int64)))
+            kinds[shaped & (claims != counts[ends - start] - counts[starts - start])] = _LINE_OTHER
+        classified = time.perf_counter()
+        observe_stage(STAGE_CLASSIFY, classified - started)
+
+        # --- Events, in order: the tables and their block state ---
+        events = np.flatnonzero((kinds <= _LINE_HEADER) | (kinds == _LINE_CLOSE) | (kinds == _LINE_TABLE)
+                                | (kinds == _LINE_TEXT) | ((kinds >= _LINE_MARKER) & (line_markers != 0)))
+        event_kinds = kinds[events]
+        event_markers = np.where(event_kinds >= _LINE_MARKER, line_markers[events], 0)
+        initial_state = self.state
+        states = _block_states(event_kinds, event_markers, initial_state).tolist()
+        # Closing and marker lines only change the state: the rest run through Python, in order,
+        # and where one turns out to change it otherwise, the states after it are redone
+        looped = np.flatnonzero((event_kinds != _LINE_CLOSE) & (event_kinds != _LINE_MARKER))
+        looped_lines = events[looped]
+        records = []
+        table_starts = []
+        current = None
+        last_batch = STATE_LAST_BATCH
+        emit = self.emit
+        self.emit = _discard # Finished tables are collected in records
+        for event, kind, code, line_start, line_end, value_start, value_end, number in zip(
+                looped.tolist(), kinds[looped_lines].tolist(), codes[looped_lines].tolist(),
+                starts[looped_lines].tolist(), ends[looped_lines].tolist(), value_starts[looped_lines].tolist(),
+                value_ends[looped_lines].tolist(), numbers[looped_lines].tolist()):
+            state = states[event]
+            if kind == _LINE_TABLE:
+                try:
+                    current = {'source_table_name': block[value_start:value_end].decode('utf-8')}
+                except UnicodeDecodeError:
+                    state = states[event - 1] if event else initial_state # The exact logic skips the line
+                else:
+                    records.append(current)
+                    table_starts.append(line_start)
+            elif kind <= _LINE_HEADER:
+                self.current_table_data = current
+                self.state = states[event - 1] if event else initial_state
+                self._feed_line(block[line_start:line_end])
+                if self.current_table_data is not current:
+                    current = self.current_table_data
+                    records.append(current)
+                    table_starts.append(line_start)
+                state = self.state
+            else:
+                key, prefixed_key, marker = entries[code]
+                if kind >= _LINE_TEXT: # Timestamps here have a marker key: the exact conversion
+                    number = _text_value(block[value_start:value_end])
+                    if number is None: # The exact logic skips the line
+                        if marker:
+                            state = states[event - 1] if event else initial_state
+                        number = '{'
+                if number != '{':
+                    current[prefixed_key if state & last_batch else key] = number
+            if state != states[event]:
+                states[event + 1:] = _block_states(event_kinds[event + 1:], event_markers[event + 1:], state).tolist()
+                states[event] = state
+        self.emit = emit
+        self.current_table_data = None
+        self.state = states[-1] if states else initial_state
+
+        # --- Plain lines: table and block state from the events before them ---
+        plain = np.flatnonzero(((kinds == _LINE_INT) | (kinds == _LINE_TIMESTAMP)) & (line_markers == 0))
+        tables = np.searchsorted(np.array(table_starts), starts[plain], 'right') - 1
+        prefixed = np.array(states, np.int8)[np.searchsorted(events, plain) - 1] & last_batch
+        timestamps = kinds[plain] == _LINE_TIMESTAMP
+        targets = codes[plain] * 4 + prefixed * 2 + timestamps
+        bulk_columns = []
+        column_names = {}
+        target_columns = np.full(len(entries) * 4, -1, np.int64)
+        for target in np.flatnonzero(np.bincount(targets, minlength=len(target_columns))).tolist():
+            name = entries[target // 4][target // 2 % 2]
+            column = self.builder.column(name)
+            if type(column) is (TimestampColumn if target % 2 else IntColumn):
+                if name not in column_names:
+                    column_names[name] = len(bulk_columns)
+                    bulk_columns.append(column)
+                target_columns[target] = column_names[name]
+        targets = target_columns[targets]
+
+        # --- Tables the columns can't take exactly are parsed again on their own ---
+        # (a plain line's column may conflict with a value from an event: only exact lines
+        # and keys that share a name with a column can write one)
+        slow = np.zeros(len(records), bool)
+        slow[tables[targets < 0]] = True
+        valued = events[(kinds[events] >= _LINE_INT) | (kinds[events] == _LINE_TEXT)]
+        written = {name for code in np.unique(codes[valued]).tolist() for name in entries[code][:2]}
+        if written.isdisjoint(column_names):
+            exact = events[kinds[events] <= _LINE_HEADER]
+            checked = np.unique(np.searchsorted(table_starts, starts[exact], 'right') - 1).tolist()
+        else:
+            checked = range(len(records))
+        for table in checked:
+            if not column_names.keys().isdisjoint(records[table]):
+                slow[table] = True
+        table_ends = table_starts[1:] + [stop]
+        for table in np.flatnonzero(slow).tolist():
+            parser = MonLogParser()
+            parser.key_errors = self.key_errors + 5 # Already warned about by the event loop
+            parser._parse_block(block[table_starts[table]:table_ends[table]])
+            records[table] = parser.finish()[0]
+
+        # --- Plain values into a column x table matrix; the last line wins ---
+        keep = ~slow[tables]
+        cells = targets[keep] * len(records) + tables[keep]
+        numbers = numbers[plain][keep]
+        owner = np.full(len(bulk_columns) * len(records), -1, np.int64)
+        order = np.arange(len(cells))
+        owner[cells] = order
+        if (owner[cells] != order).any():
+            np.maximum.at(owner, cells, order)
+        values = np.zeros(len(owner), np.int64)
+        values[cells] = numbers[owner[cells]]
+        missing = np.ones(len(owner), np.uint8)
+        missing[cells] = 0
+        self.builder.append_rows(records, bulk_columns, values.reshape(-1, len(records)),
+                                 missing.reshape(-1, len(records)))
+        observe_stage(STAGE_CONVERT, time.perf_counter() - classified)
+        return len(kinds)
+
+
+def parse_log_stream(log_stream, progress=None):
+    """
+    Parses log data from stream with the MonLogParser state machine, appending each finished
+    table straight into a TypedColumnBuilder. Returns a Pandas DataFrame.
+    progress, if given, is called as progress(bytes read, lines, tables) after every block.
+    """
+    builder = TypedColumnBuilder()
+    parser = ColumnarLogParser(builder)
+    try:
+        if progress is None:
+            parser.feed(log_stream)
+        else:
+            bytes_read = 0
+            for buffer, start, stop in iter_block_ranges(log_stream, parser.block_size):
+                parser.feed_block(buffer, start, stop)
+                bytes_read += stop - start
+                progress(bytes_read, parser.line_number, builder.row_count)
+        parser.finish()
+    except Exception:
+        logger.exception("Exception during stream parsing")
+        raise # Re-raise to be caught by route handler
+    logger.info("Finished stream parsing. Total lines read: %d, Tables: %d", parser.line_number, builder.row_count)
+    return builder.to_dataframe()
+
+
+# --- Streaming (bounded memory for inputs larger than RAM) ---
+STREAM_BATCH_ROWS = 20000 # Records per batch yielded by iter_record_batches()
+
+
+def iter_record_batches(log_stream, batch_rows=STREAM_BATCH_ROWS, progress=None):
+    """
+    Parses log data from stream like parse_log_stream(), but yields the records as typed
+    DataFrames of batch_rows records (plus at most one input block's worth), so memory is
+    bounded by the batch size instead of the input size. Every batch has the same columns
+    and dtypes (see TypedColumnBuilder.to_dataframe(all_columns=True)), so the batches can be
+    written one after another to one output.
+    progress, if given, is called as progress(bytes read, lines, tables) after every block.
+    """
+    builder = TypedColumnBuilder()
+    parser = ColumnarLogParser(builder)
+    bytes_read = 0
+    tables = 0
+    for buffer, start, stop in iter_block_ranges(log_stream, parser.block_size):
+        parser.feed_block(buffer, start, stop)
+        bytes_read += stop - start
+        if progress is not None:
+            progress(bytes_read, parser.line_number, tables + builder.row_count)
+        if builder.row_count >= batch_rows:
+            tables += builder.row_count
+            yield builder.to_dataframe(all_columns=True)
+            builder = TypedColumnBuilder()
+            parser.use_builder(builder)
+    parser.finish() # Emits the last table
+    if progress is not None:
+        progress(bytes_read, parser.line_number, tables + builder.row_count)
+    tables += builder.row_count
+    if builder.row_count:
+        yield builder.to_dataframe(all_columns=True)
+    logger.info("Finished streaming parse. Total lines read: %d, Tables: %d", parser.line_number, tables)
+
+
+# --- Parallel parsing of large files ---
+# Every table starts at a header line and the parser state is reset there, so a file can be
+# cut right before header lines and the pieces parsed independently.
+PARALLEL_CHUNKS_PER_WORKER = 4
+_HEADER_LINE_START = b'\n' + (KV_START + '   "').encode('utf-8')
+
+
+def _is_header_line(line_bytes):
+    try:
+        line = line_bytes.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        return False
+    return line.startswith(KV_START + '   "') and line.endswith(BOX_EDGE)
+
+
+def find_split_points(buffer, parts):
+    """
+    Returns ascending offsets [0, ..., len(buffer)] that cut the buffer into about `parts`
+    pieces, each cut placed at the start of a table header line.
+    """
+    size = len(buffer)
+    points = [0]
+    for part in range(1, parts):
+        position = max(size * part // parts, points[-1])
+        while True:
+            found = buffer.find(_HEADER_LINE_START, position)
+            if found < 0:
+                break
+            line_start = found + 1
+            line_end = buffer.find(b'\n', line_start)
+            if _is_header_line(buffer[line_start:line_end if line_end >= 0 else size]):
+                break
+            position = line_start
+        if found < 0:
+            break
+        if line_start > points[-1]:
+            points.append(line_start)
+    points.append(size)
+    return points
+
+
+def iter_buffer_blocks(buffer, start, end, block_size=BLOCK_SIZE):
+    """Yields blocks of whole lines from buffer[start:end] (e.g. an mmap)."""
+    while start < end:
+        started = time.perf_counter()
+        stop = min(start + block_size, end)
+        if stop < end:
+            cut = buffer.rfind(b'\n', start, stop)
+            stop = cut + 1 if cut >= start else buffer.find(b'\n', stop, end) + 1 or end
+        block = buffer[start:stop]
+        observe_stage(STAGE_DECODE, time.perf_counter() - started)
+        yield block
+        start = stop
+
+
+def _parse_file_range(path, start, end):
+    """Worker: parses bytes [start, end) of a file into a TypedColumnBuilder. Returns (builder, lines)."""
+    builder = TypedColumnBuilder()
+    parser = ColumnarLogParser(builder)
+    with open(path, 'rb') as log_file, mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for block in iter_buffer_blocks(buffer, start, end, parser.block_size):
+            parser.feed_block(block)
+    parser.finish()
+    return builder, parser.line_number
+
+
+def parse_file_ranges(path, ranges, workers=1, progress=None):
+    """
+    Parses each (start, end) byte range of a file (each must start where no table is open:
+    a table header, a snapshot boundary or the start of the file) into its own TypedColumnBuilder, across a process pool when workers > 1.
+    Returns the builders in range order. progress(bytes read, lines, tables) is called as ranges finish.
+    """
+    totals = [0, 0, 0] # bytes, lines, tables of the finished ranges
+
+    def range_done(start, end, result):
+        range_builder, lines = result
+        if progress is not None:
+            totals[0] += end - start
+            totals[1] += lines
+            totals[2] += range_builder.row_count
+            progress(*totals)
+        return range_builder
+
+    if workers == 1 or len(ranges) == 1:
+        return [range_done(start, end, _parse_file_range(path, start, end)) for start, end in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_file_range, path, start, end) for start, end in ranges]
+        if progress is not None:
+            future_ranges = dict(zip(futures, ranges))
+            for future in as_completed(futures):
+                range_done(*future_ranges[future], future.result())
+        return [future.result()[0] for future in futures]
+
+
+def parse_compressed_file(path, progress=None, max_bytes=None):
+    """
+    Parses a gzip/zstd/bz2/zip file as it is decompressed (a single stream, so no parallel split).
+    progress gets the compressed bytes consumed, so it can be compared with the file size.
+    max_bytes caps the decompressed size (compressed_input.DecompressedSizeError past it).
+    """
+    with open_log_input(path, max_bytes=max_bytes) as log_stream:
+        if progress is None:
+            return parse_log_stream(log_stream)
+        compressed_position = log_stream.raw.compressed_position
+        return parse_log_stream(log_stream, lambda _, lines, tables: progress(compressed_position(), lines, tables))
+
+
+def parse_log_file(path, workers=None, progress=None, max_decompressed_bytes=None):
+    """
+    Parses a log file on disk, splitting it at table headers across a process pool.
+    Returns the same DataFrame as parse_log_stream() on the whole file.
+    progress, if given, is called as progress(bytes read, lines, tables) as chunks finish.
+    Compressed files are detected and parsed with parse_compressed_file() instead.
+    """
+    if detect_compression(path):
+        return parse_compressed_file(path, progress, max_decompressed_bytes)
+    workers = workers or os.cpu_count() or 1
+    with open(path, 'rb') as log_file:
+        if os.fstat(log_file.fileno()).st_size == 0:
+            return parse_log_stream(log_file, progress)
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            points = find_split_points(buffer, workers * PARALLEL_CHUNKS_PER_WORKER)
+    ranges = list(zip(points[:-1], points[1:]))
+    logger.info("Parsing %s in %d chunks with %d workers", path, len(ranges), workers)
+    builders = parse_file_ranges(path, ranges, workers, progress)
+    builder = builders[0]
+    for other in builders[1:]:
+        builder.merge(other)
+    logger.info("Finished parallel parsing. Tables: %d", builder.row_count)
+    return builder.to_dataframe()
+
+
+# --- Reference implementation (the original per-line logic, kept for differential checks) ---
+def parse_log_stream_reference(log_stream):
+    """
+    Parses log data line-by-line from stream, closely matching original script's logic.
+    Returns the list of per-table dicts. Slow (logs per line at DEBUG); use parse_log_records().
+    """
+    data_list = []
+    current_table_data = None
+    # Flags managed similar to original script
+    insideLastBatch = False
+    insideIntegrationTime = False # Note: Original script didn't seem to use this flag effectively after setting
+    line_number = 0
+    decode_errors = 0
+    debug = logger.isEnabledFor(logging.DEBUG) # Per-line messages cost nothing unless enabled
+
+    logger.debug("Starting stream parsing (Revised Logic)...")
+
+    try:
+        for line_bytes in log_stream:
+            line_number += 1
+            try:
+                # Decode with fallback (same as before)
+                line = line_bytes.decode('utf-8').strip()
+            except UnicodeDecodeError:
+                try:
+                    line = line_bytes.decode('latin-1').strip()
+                except UnicodeDecodeError:
+                    if decode_errors < 5: logger.warning("Skipping line %d due to undecodable bytes.", line_number)
+                    decode_errors += 1; continue
+
+            if not line: continue
+
+            # --- Use original script's startswith logic ---
+            # IMPORTANT: Replace the literal string here with the exact one from your ORIGINAL
+            # working script if it differs subtly (e.g., number of spaces)
+            # Using the one provided in the prompt:
+            original_header_start = '│                                             │   "'
+            original_kv_start = '│                                             │'
+
+            # Check for the start of a new table's data (matching original)
+            # Ensure we don't match the kv_start by checking for the extra '   "'
+            if line.startswith(original_header_start) and line.endswith('│'):
+                if debug: logger.debug("Line %d: Matched Header", line_number)
+                # If we were processing a previous table, add its data to the list
+                if current_table_data:
+                    data_list.append(current_table_data)
+
+                # Start new table data
+                try:
+                    current_table_name = line.split('"')[1]
+                    current_table_data = {'source_table_name': current_table_name}
+                    # Reset flags for the new table
+                    insideLastBatch = False
+                    insideIntegrationTime = False # Resetting here seems logical, though original didn't explicitly
+                except IndexError:
+                    logger.warning("Line %d: Could not extract table name from header: %s", line_number, line)
+                    current_table_data = None # Invalidate current table if header parse fails
+                continue # Move to next line after processing header
+
+            # Extract key-value pairs from the lines (matching original)
+            elif line.startswith(original_kv_start) and line.endswith('│') and current_table_data is not None:
+                 # Check if it's potentially a header line misidentified (contains '"' near start)
+                if '   "' in line[len(original_kv_start):len(original_kv_start)+5]: # Basic check
+                     if debug: logger.debug("Line %d: Skipped KV match, looks like header: %s", line_number, line)
+                     continue
+
+                if debug: logger.debug("Line %d: Matched Key-Value candidate", line_number)
+
+                # Original script's check `line.split(":") is not None` is always true if split succeeds
+                # The core check is the try/except around the split itself.
+                try:
+                    key_part, value_part = line.split(':', 1)  # Split only at the first colon
+                except ValueError:
+                    # Original script's handling of lines without a colon
+                    if debug: logger.debug("Line %d: Skipping line without colon (ValueError): %s", line_number, line)
+                    if insideIntegrationTime: # Original reset logic
+                        insideIntegrationTime = False
+                    elif insideLastBatch:
+                        insideLastBatch = False
+                    continue  # Move to the next line
+
+                # --- Process Key (matching original) ---
+                try:
+                    key = key_part.split('"')[1].strip().replace(" ", "_").replace('-', '_').lower()
+                except IndexError:
+                     logger.warning("Line %d: Could not extract key from: %s", line_number, key_part)
+                     continue # Skip if key extraction fails
+
+                # --- Process Value (matching original) ---
+                value = value_part.strip().replace(',', '').replace("│", "").replace('"', "").strip()
+
+                # --- State Management & Prefixing (matching original) ---
+                # Check flags *before* prefixing, based on the *unprefixed* key
+                is_last_batch_marker = "last_batch_info" == key # Use exact key match
+                is_integration_time_marker = "integration_task_time" == key # Use exact key match
+
+                if is_last_batch_marker:
+                    insideLastBatch = True
+                    # Original script didn't reset insideIntegrationTime here, seems correct?
+
+                if is_integration_time_marker:
+                     # Original script just set this flag, didn't seem conditional on insideLastBatch
+                     insideIntegrationTime = True
+
+                # Apply prefix *if* inside the block (original logic)
+                if insideLastBatch:
+                     # Add prefix, including to the marker keys themselves if stored
+                     key_to_store = "last_batch_" + key
+                else:
+                     key_to_store = key
+
+                # --- Value Conversion & Storage (matching original) ---
+                # Original script stored the marker keys with '{', let's skip storing '{' explicitly
+                if value != "{":
+                    processed_value = value # Start with the cleaned string value
+                    try:
+                        # 1. Try converting to integer (original order)
+                        processed_value = int(value)
+                    except ValueError:
+                        try:
+                            # 2. Try converting to datetime (original order)
+                            # Ensure value is a string for fromisoformat
+                            dt_value_str = str(value)
+                            if dt_value_str.endswith('Z'): dt_value_str = dt_value_str[:-1] + '+00:00'
+                            processed_value = datetime.datetime.fromisoformat(dt_value_str)
+                        except (ValueError, TypeError):
+                            # If both int and datetime fail, keep the cleaned string
+                            pass # processed_value remains the string 'value'
+
+                    # Store the processed key and value
+                    current_table_data[key_to_store] = processed_value
+                    if debug: logger.debug("Line %d: Stored key='%s', value='%s' (type: %s)", line_number, key_to_store, processed_value, type(processed_value))
+                else:
+                     # Handle the '{' value - original stored it, maybe we should too?
+                     # Or just use it as a marker and don't store? Let's skip storing '{'.
+                     if debug: logger.debug("Line %d: Encountered '{' for key='%s', skipping storage of value.", line_number, key_to_store)
+                     # Optionally store a placeholder if needed: current_table_data[key_to_store] = None
+
+            # --- End of core parsing logic ---
+
+    except Exception:
+        logger.exception("Exception during stream parsing near line %d", line_number)
+        raise # Re-raise to be caught by route handler
+    finally:
+        # Add the very last table's data if it exists
+        if current_table_data:
+            logger.debug("Appending last table data.")
+            data_list.append(current_table_data)
+        logger.debug("Finished stream parsing. Total lines read: %d, Decode errors: %d", line_number, decode_errors)
+
+    return data_list
@@ -1,80 +1,87 @@
-import datetime
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+from sql_output import SQL_FORMATS, SQL_FORMAT_INSERT, SQL_FORMAT_COPY_TEXT, SQL_FORMAT_COPY_CSV, SQL_FORMAT_MERGE, DEFAULT_BATCH_ROWS, FILTER_COLUMN, iter_sql
+from table_schema import SOURCE_FILE_COLUMN, TAG_COLUMNS
+from pg_loader import load_dataframe
+from follow import FOLLOW_INTERVAL_SECONDS, follow_log, iter_changed_sql, replace_tables_sql, replaced_table_names
+from snapshots import HISTORY_STAGE_TABLE, HISTORY_TABLE_NAME, build_history, history_columns, history_table_ddl, \
+    history_insert_sql, iter_history_sql
+from instrumentation import configure_logging
+from log_parser import STREAM_BATCH_ROWS
+from batch_ingest import expand_inputs, parse_inputs, iter_input_batches, format_summary
+from columnar_export import EXPORT_FORMATS, EXPORT_ROW_GROUP_ROWS, iter_export
 
 # This app takes a mon output and parses it to table insert for a data warehouse stats table
 
-def generate_insert_statements(file_path):
+def parse_files(file_paths, workers=1, node_pattern=None, tag=True):
+    """Parses the files (several at once across the workers) and reports per-file throughput on stderr."""
+    started = time.perf_counter()
+    df, stats = parse_inputs(file_paths, workers=workers, node_pattern=node_pattern, tag=tag)
+    print(format_summary(stats, time.perf_counter() - started), file=sys.stderr)
+    return df
+
+
+def iter_parsed_batches(file_paths, batch_rows=STREAM_BATCH_ROWS, node_pattern=None, tag=True):
+    """Streams the files as record batches (memory bounded by batch_rows), reporting per-file throughput on stderr at the end."""
+    started = time.perf_counter()
+    stats = []
+    yield from iter_input_batches(file_paths, batch_rows, node_pattern, tag, stats)
+    print(format_summary(stats, time.perf_counter() - started), file=sys.stderr)
+
+
+def parse_input(file_paths, workers=1, node_pattern=None, tag=True, batch_rows=None):
+    """The parsed files: one DataFrame, or with batch_rows an iterator of batches (single process)."""
+    if batch_rows:
+        return iter_parsed_batches(file_paths, batch_rows, node_pattern, tag)
+    return parse_files(file_paths, workers, node_pattern, tag)
+
+
+def generate_insert_statements(file_paths, workers=1, sql_format=SQL_FORMAT_INSERT, batch_size=DEFAULT_BATCH_ROWS,
+                               node_pattern=None, tag=True, delete_missing=False, batch_rows=None):
     """
-  Reads a file line by line, extracts data, and generates INSERT statements.
+  Reads the files, extracts data with the shared log_parser, and generates INSERT statements,
+  one merged script with the records in file order.
 
   Args:
-    file_path: Path to the file containing the data.
+    file_paths: Paths of the files containing the data.
+    workers: Number of processes to parse with (files in parallel, or a single file split at table headers).
+    sql_format: 'insert' for this script's statements, or a bulk format from sql_output
+      ('multi_insert', 'copy_text', 'copy_csv', 'merge').
+    batch_size: Rows per statement for 'multi_insert'.
+    node_pattern: Regex picking the node name out of each path (see batch_ingest.node_name).
+    tag: Add the source_file and node columns.
+    delete_missing: With 'merge', also delete the tables missing from the files.
+    batch_rows: Stream the files in batches of this many records instead of parsing them whole
+      (bulk formats only).
   """
 
-    # Initialize variables to store extracted data
+    # Parser diagnostics are logged to stderr, so stdout stays pure SQL
+    df = parse_input(file_paths, workers, node_pattern, tag, batch_rows)
+
+    if sql_format != SQL_FORMAT_INSERT:
+        for chunk in iter_sql(df, sql_format, batch_size, delete_missing):
+            sys.stdout.write(chunk)
+        sys.stdout.write("\n")
+        return
+
+    # Initialize variables to store extracted data (the last record of a table in each file wins)
     data = {}
-    current_table = None
-
-    insideLastBatch = False
-    insideIntegrationTime = False
-
-    with open(file_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-
-            #print(line)
-            # Check for the start of a new table's data
-            if line.startswith('│                                             │   "') and line.endswith('│'):
-                current_table = line.split('"')[1]
-                data[current_table] = {}
-                data[current_table]['source_table_name'] = current_table
-            # Extract key-value pairs from the lines
-            elif line.startswith('│                                             │') and line.endswith('│'):
-                if current_table is not None and line.split(":") is not None:
-                    try:
-                        key, value = line.split(':', 1)  # Split only at the first colon
-                    except ValueError:
-                        #print(f"Warning: Skipping line without a colon: {line}")
-                        if insideIntegrationTime:
-                            insideIntegrationTime = False
-                        elif insideLastBatch:
-                            insideLastBatch = False
-                        continue  # Move to the next line
-
-                    key = key.split('"')[1].strip().replace(" ", "_").replace('-', '_').lower()
-                    value = value.strip().replace(',', '').replace("│", "").replace('"', "").strip()
-
-                    # Add the "last_batch_" prefix if the key is within the "Last batch info" block
-                    if "last_batch_info" in key:
-                        insideLastBatch = True
-                    if "integration_task_time" in key:
-                        insideIntegrationTime = True
-
-                    if insideLastBatch:
-                        key = "last_batch_" + key
-
-                    if value != "{":
-                        try:
-                            # Convert numeric values to integers
-                            value = int(value)
-                        except ValueError:
-                            pass
-                        try:
-                            # Convert datetime to datetime
-                            value = datetime.datetime.fromisoformat(str(value))
-                        except ValueError:
-                            pass
-                        data[current_table][key] = value
+    for record in df.to_dict('records'):
+        data[(record.get(SOURCE_FILE_COLUMN), record['source_table_name'])] = record
 
     print("TRUNCATE TABLE process_queue_wait_times;")
 
     # Define the set of valid columns based on your DDL
     valid_columns = { 'batch_queue_id', 'wait_milliseconds', 'source_table_name', 'total_batches_created', 'partition_pruned_batches', 'last_successful_merge_time', 'total_batches_ignored', 'max_integration_time_in_ms', 'avg_in_mem_compaction_time_in_ms', 'avg_batch_size_in_bytes', 'no_of_updates', 'no_of_inserts', 'total_events_merged', 'no_of_ddls', 'no_of_deletes', 'no_of_pkupdates', 'avg_event_count_per_batch', 'min_integration_time_in_ms', 'mapped_source_table', 'total_batches_queued',
-                      'avg_compaction_time_in_ms', 'avg_waiting_time_in_queue_in_ms', 'avg_integration_time_in_ms', 'total_batches_uploaded', 'avg_merge_time_in_ms', 'last_batch_no_of_updates', 'last_batch_event_count', 'last_batch_no_of_inserts', 'last_batch_max_record_size', 'last_batch_total_events_merged', 'last_batch_no_of_ddls', 'last_batch_sequence_number', 'last_batch_size_in_bytes', 'last_batch_compaction_time_in_ms', 'last_batch_stage_resources_management_time_in_ms', 'last_batch_upload_time_in_ms', 'last_batch_merge_time_in_ms', 'last_batch_in_memory_compaction_time_in_ms', 'last_batch_pk_update_time_in_ms', 'last_batch_ddl_execution_time_in_ms', 'last_batch_total_integration_time_in_ms', 'last_batch_no_of_deletes', 'last_batch_no_of_pkupdates', 'last_batch_accumulation_time_in_ms', 'avg_stage_resources_management_time_in_ms', 'avg_upload_time_in_ms', 'last_batch_batch_event_count', 'last_batch_max_record_size_in_batch', 'last_batch_batch_sequence_number', 'last_batch_batch_size_in_bytes', 'last_batch_batch_accumulation_time_in_ms' }
+                      'avg_compaction_time_in_ms', 'avg_waiting_time_in_queue_in_ms', 'avg_integration_time_in_ms', 'total_batches_uploaded', 'avg_merge_time_in_ms', 'last_batch_no_of_updates', 'last_batch_event_count', 'last_batch_no_of_inserts', 'last_batch_max_record_size', 'last_batch_total_events_merged', 'last_batch_no_of_ddls', 'last_batch_sequence_number', 'last_batch_size_in_bytes', 'last_batch_compaction_time_in_ms', 'last_batch_stage_resources_management_time_in_ms', 'last_batch_upload_time_in_ms', 'last_batch_merge_time_in_ms', 'last_batch_in_memory_compaction_time_in_ms', 'last_batch_pk_update_time_in_ms', 'last_batch_ddl_execution_time_in_ms', 'last_batch_total_integration_time_in_ms', 'last_batch_no_of_deletes', 'last_batch_no_of_pkupdates', 'last_batch_accumulation_time_in_ms', 'avg_stage_resources_management_time_in_ms', 'avg_upload_time_in_ms', 'last_batch_batch_event_count', 'last_batch_max_record_size_in_batch', 'last_batch_batch_sequence_number', 'last_batch_batch_size_in_bytes', 'last_batch_batch_accumulation_time_in_ms', *TAG_COLUMNS }
 
     # Generate INSERT statements for each table
     insert_statements = []
-    for table_name, table_data in data.items():
-        filtered_data = {k: v for k, v in table_data.items() if k in valid_columns}
+    for table_data in data.values():
+        filtered_data = {k: v for k, v in table_data.items() if k in valid_columns and not pd.isna(v)}
 
         columns = ', '.join(filtered_data.keys())
         values = ', '.join([f"'{v}'" if isinstance(v, str) else str(v) for v in filtered_data.values()])
@@ -86,6 +93,177 @@ def generate_insert_statements(file_path):
         print(insert_statement)
 
 
-# usage:
-file_path = '/Users/danielferrara/Downloads/mon_integra_cdc.txt'
-generate_insert_statements(file_path)
+def export_files(file_paths, export_format, output=None, workers=1, node_pattern=None, tag=True,
+                 row_group_rows=EXPORT_ROW_GROUP_ROWS, batch_rows=None):
+    """Parses (or with batch_rows, streams) the files and writes the filtered records as Parquet, Arrow IPC or CSV (to output, or stdout)."""
+    df = parse_input(file_paths, workers, node_pattern, tag, batch_rows)
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(df, export_format, row_group_rows):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+def load_into_postgres(file_paths, workers=1, dsn=None, node_pattern=None, tag=True, merge=False, delete_missing=False,
+                       batch_rows=None):
+    """
+    Parses the files and loads them straight into Postgres, reporting the load rate on stderr.
+    With merge=True only new and changed tables are written (see pg_loader.merge_rows()).
+    With batch_rows the files are streamed into the COPY batch by batch.
+    """
+    df = parse_input(file_paths, workers, node_pattern, tag, batch_rows)
+    result = load_dataframe(df, dsn=dsn, merge=merge, delete_missing=delete_missing)
+    print(f"Loaded {result['rows']} rows in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s), "
+          f"skipped {result['rows_skipped']} rows without '{FILTER_COLUMN}'", file=sys.stderr)
+    if merge:
+        print(f"Merged: {result['inserted']} inserted, {result['updated']} updated, {result['unchanged']} unchanged, "
+              f"{result['deleted']} deleted", file=sys.stderr)
+
+
+def append_history(file_paths, workers=1, load=False, dsn=None, node_pattern=None, tag=True):
+    """
+    Parses timestamped snapshots (files and/or captures) and appends them, with per-table
+    deltas and rates, to the history table: as a SQL script on stdout, or loaded directly.
+    Snapshots already in the table are skipped.
+    """
+    df = build_history(file_paths, workers=workers, node_pattern=node_pattern, tag=tag)
+    if load:
+        columns = history_columns(df)
+        result = load_dataframe(df, dsn=dsn, table=HISTORY_STAGE_TABLE, columns=columns, truncate=False,
+                                setup_sql=history_table_ddl(), finish_sql=history_insert_sql(columns))
+        print(f"Appended {result['finish_rows']} rows to {HISTORY_TABLE_NAME} in {result['seconds']:.2f}s "
+              f"({result['rows_per_second']:.0f} rows/s), {result['rows'] - result['finish_rows']} already there",
+              file=sys.stderr)
+        return
+    for chunk in iter_history_sql(df):
+        sys.stdout.write(chunk)
+
+
+def emit_changed_tables(file_path, checkpoint_path=None, follow=False, interval=FOLLOW_INTERVAL_SECONDS,
+                        csv=False, load=False, dsn=None):
+    """
+    Parses only the output appended to file_path since the last run (see follow.LogFollower) and
+    replaces the rows of the tables that changed: as a SQL script on stdout, or loaded directly.
+    With follow=True, keeps checking the file every `interval` seconds until interrupted.
+    """
+    def emit(changed):
+        if load:
+            result = load_dataframe(changed, dsn=dsn, csv=csv, truncate=False,
+                                    setup_sql=replace_tables_sql(replaced_table_names(changed)))
+            print(f"Replaced {result['rows']} changed tables in {result['seconds']:.2f}s", file=sys.stderr)
+        else:
+            for chunk in iter_changed_sql(changed, csv):
+                sys.stdout.write(chunk)
+            sys.stdout.flush()
+
+    try:
+        follow_log(file_path, emit, checkpoint_path, follow, interval)
+    except KeyboardInterrupt:
+        print("Stopped following.", file=sys.stderr)
+
+
+# usage: python main.py file_path|glob [...] [--workers N] [--format FORMAT] [--batch-size N] [--node-pattern REGEX] [--no-tags] [--load [DSN]] [--history]
+#        python main.py file_path|glob [...] --merge [--delete-missing] [--load [DSN]]
+#        python main.py file_path|glob [...] --export parquet|arrow|csv [--output PATH]
+#        python main.py file_path|glob [...] --stream [--batch-rows N] [--format FORMAT|--merge|--export FORMAT] [--load [DSN]]
+#        python main.py file_path --incremental|--follow [--checkpoint PATH] [--interval SECONDS] [--load [DSN]]
+#        add --log-level DEBUG for the parser's per-line detail (stderr)
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Convert Striim mon output into INSERT statements.")
+    arg_parser.add_argument('file_path', nargs='+',
+                            help="mon output files or glob patterns (quoted, '**' for subdirectories); merged in the order given")
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help="parse files in parallel (or one large file split) across this many processes")
+    arg_parser.add_argument('--format', choices=SQL_FORMATS, dest='sql_format',
+                            help="output format: INSERT per row, batched multi-row INSERT, or COPY FROM STDIN "
+                                 "(default: insert, copy_text with --stream)")
+    arg_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_ROWS,
+                            help="rows per statement for --format multi_insert")
+    arg_parser.add_argument('--node-pattern', metavar='REGEX',
+                            help="regex whose 'node' group (or first group) picks the node out of each path, "
+                                 "e.g. '(?P<node>[^/]+)/[^/]+$' for one directory per node (default: the file name)")
+    arg_parser.add_argument('--no-tags', action='store_true',
+                            help="leave out the source_file/node columns (for tables created before they were added "
+                                 "and not yet migrated with dw_stats_tag_columns.sql)")
+    arg_parser.add_argument('--export', choices=EXPORT_FORMATS,
+                            help="write the parsed records as a typed columnar file instead of SQL")
+    arg_parser.add_argument('--output', metavar='PATH', help="file for --export (default: stdout)")
+    arg_parser.add_argument('--load', nargs='?', const='', metavar='DSN',
+                            help="COPY straight into Postgres instead of printing SQL (DSN defaults to $DATABASE_URL)")
+    arg_parser.add_argument('--merge', action='store_true',
+                            help="upsert only new/changed tables instead of TRUNCATE + reload (same as --format merge "
+                                 "for scripts); needs the unique key migration in dw_stats_merge_key.sql")
+    arg_parser.add_argument('--delete-missing', action='store_true',
+                            help="with --merge, also delete tables that are not in the parsed files")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="parse in bounded memory, one batch of records at a time, for dumps larger than RAM "
+                                 "(single process; SQL, --load and --export only)")
+    arg_parser.add_argument('--batch-rows', type=int, default=STREAM_BATCH_ROWS,
+                            help="records per batch with --stream")
+    arg_parser.add_argument('--history', action='store_true',
+                            help="append timestamped snapshots with per-table deltas/rates to the history table instead of replacing the table")
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help="parse only what was appended since the last run and emit just the changed tables")
+    arg_parser.add_argument('--follow', action='store_true',
+                            help="like --incremental, but keep watching the file for new output")
+    arg_parser.add_argument('--checkpoint', metavar='PATH',
+                            help="checkpoint file for --incremental/--follow (default: <file_path>.checkpoint.json)")
+    arg_parser.add_argument('--interval', type=float, default=FOLLOW_INTERVAL_SECONDS,
+                            help="seconds between checks for new output with --follow")
+    arg_parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                            help="stderr log level (default: $LOG_LEVEL or INFO)")
+    args = arg_parser.parse_args()
+    configure_logging(args.log_level)
+    try:
+        file_paths = expand_inputs(args.file_path)
+    except FileNotFoundError as e:
+        arg_parser.error(str(e))
+    for path in file_paths:
+        if args.follow and not os.path.exists(path):
+            continue # --follow waits for the file to appear
+        if not os.path.exists(path):
+            arg_parser.error(f"{path}: no such file")
+        if not os.path.isfile(path):
+            arg_parser.error(f"{path}: not a file")
+        if not os.access(path, os.R_OK):
+            arg_parser.error(f"{path}: not readable")
+    if args.merge:
+        args.sql_format = SQL_FORMAT_MERGE
+    if args.sql_format is None:
+        args.sql_format = SQL_FORMAT_COPY_TEXT if args.stream else SQL_FORMAT_INSERT
+    if args.stream:
+        if args.history or args.incremental or args.follow:
+            arg_parser.error("--stream can't be combined with --history, --incremental or --follow")
+        if args.sql_format == SQL_FORMAT_INSERT:
+            arg_parser.error("--stream needs a bulk --format (multi_insert, copy_text, copy_csv or merge)")
+        if args.batch_rows < 1:
+            arg_parser.error("--batch-rows must be at least 1")
+    batch_rows = args.batch_rows if args.stream else None
+    if args.delete_missing and args.sql_format != SQL_FORMAT_MERGE:
+        arg_parser.error("--delete-missing only applies to --merge")
+    if args.sql_format == SQL_FORMAT_MERGE and (args.export or args.history or args.incremental or args.follow):
+        arg_parser.error("--merge can't be combined with --export, --history, --incremental or --follow")
+    if args.export and (args.load is not None or args.history or args.incremental or args.follow):
+        arg_parser.error("--export can't be combined with --load, --history, --incremental or --follow")
+    if args.export:
+        export_files(file_paths, args.export, output=args.output, workers=args.workers,
+                     node_pattern=args.node_pattern, tag=not args.no_tags, batch_rows=batch_rows)
+    elif args.incremental or args.follow:
+        if len(file_paths) > 1 or args.history:
+            arg_parser.error("--incremental/--follow take a single file and can't be combined with --history")
+        emit_changed_tables(file_paths[0], checkpoint_path=args.checkpoint, follow=args.follow, interval=args.interval,
+                            csv=args.sql_format == SQL_FORMAT_COPY_CSV, load=args.load is not None, dsn=args.load or None)
+    elif args.history:
+        append_history(file_paths, workers=args.workers, load=args.load is not None, dsn=args.load or None,
+                       node_pattern=args.node_pattern, tag=not args.no_tags)
+    elif args.load is not None:
+        load_into_postgres(file_paths, workers=args.workers, dsn=args.load or None,
+                           node_pattern=args.node_pattern, tag=not args.no_tags,
+                           merge=args.sql_format == SQL_FORMAT_MERGE, delete_missing=args.delete_missing,
+                           batch_rows=batch_rows)
+    else:
+        generate_insert_statements(file_paths, workers=args.workers, sql_format=args.sql_format, batch_size=args.batch_size,
+                                   node_pattern=args.node_pattern, tag=not args.no_tags, delete_missing=args.delete_missing,
+                                   batch_rows=batch_rows)
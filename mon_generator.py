@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import random
+import sys
+from log_parser import KV_START, BOX_EDGE, LAST_BATCH_PREFIX
+from table_schema import TABLE_SCHEMA
+
+# --- Synthetic `mon` output (deterministic for a given seed) ---
+# Mirrors the box-drawing layout the parser reads: a header line per table, key/value lines
+# indented below it, and nested "Last batch info" / "Integration Task Time" blocks.
+LINE_WIDTH = 160
+BOX_TOP = '╭' + '─' * 45 + '┬' + '─' * (LINE_WIDTH - 48) + '╮'
+BOX_BOTTOM = '╰' + '─' * (LINE_WIDTH - 2) + '╯'
+TITLE_LINE = '│ Target Stats' + ' ' * 32 + '│' + ' ' * (LINE_WIDTH - 48) + '│'
+BASE_TIME = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+
+TIMESTAMP_COLUMNS = [col for col, sql_type in TABLE_SCHEMA.items() if sql_type == 'TIMESTAMP']
+# Top-level counters and averages (everything in the DDL that isn't a last-batch key); the
+# min/max/avg integration times sit in a top-level "Integration Task Time" block
+INTEGRATION_TIME_COLUMNS = ['max_integration_time_in_ms', 'min_integration_time_in_ms', 'avg_integration_time_in_ms']
+TABLE_COLUMNS = [col for col, sql_type in TABLE_SCHEMA.items()
+                 if sql_type == 'INT' and not col.startswith(LAST_BATCH_PREFIX) and col not in INTEGRATION_TIME_COLUMNS]
+# Inside "Last batch info"; the *_time_in_ms ones go into its nested "Integration Task Time" block
+LAST_BATCH_COLUMNS = [col[len(LAST_BATCH_PREFIX):] for col in TABLE_SCHEMA if col.startswith(LAST_BATCH_PREFIX)]
+LAST_BATCH_TIME_COLUMNS = [col for col in LAST_BATCH_COLUMNS if col.endswith('_time_in_ms')]
+LAST_BATCH_OTHER_COLUMNS = [col for col in LAST_BATCH_COLUMNS if col not in LAST_BATCH_TIME_COLUMNS]
+LOWERCASE_WORDS = {'in', 'of', 'ms'}
+
+
+def display_key(column):
+    """'avg_batch_size_in_bytes' -> 'Avg Batch Size in Bytes' (normalize_key() maps it back)."""
+    return ' '.join(word if word in LOWERCASE_WORDS else word.capitalize() for word in column.split('_'))
+
+
+def box_line(body):
+    line = KV_START + body
+    return line + ' ' * max(1, LINE_WIDTH - 1 - len(line)) + BOX_EDGE
+
+
+class MonOutputGenerator:
+    """
+    Generates realistic `mon` output for benchmarks and manual testing.
+
+    Ratios are per table: how often a "Last batch info" block (with its nested
+    "Integration Task Time" block) or a top-level "Integration Task Time" block appears,
+    how often a line uses an odd encoding (non-ASCII table names, latin-1 bytes, CRLF
+    endings, hyphenated keys) and how often malformed lines (unquoted keys, truncated
+    lines, misplaced headers, stray text) are mixed in.
+    """
+
+    def __init__(self, tables=1000, seed=0, last_batch_ratio=0.8, integration_time_ratio=0.3,
+                 odd_encoding_ratio=0.02, malformed_ratio=0.02, snapshots=1):
+        self.tables = tables
+        self.seed = seed
+        self.last_batch_ratio = last_batch_ratio
+        self.integration_time_ratio = integration_time_ratio
+        self.odd_encoding_ratio = odd_encoding_ratio
+        self.malformed_ratio = malformed_ratio
+        self.snapshots = snapshots
+
+    def iter_lines(self):
+        """Yields the output as byte lines (with line endings), snapshot after snapshot."""
+        rng = random.Random(self.seed)
+        for snapshot in range(self.snapshots):
+            if self.snapshots > 1: # A timestamp line before each snapshot, as in a scheduled capture
+                yield (BASE_TIME + datetime.timedelta(minutes=snapshot)).strftime('%Y-%m-%dT%H:%M:%SZ\n').encode('ascii')
+            yield (BOX_TOP + '\n').encode('utf-8')
+            yield (TITLE_LINE + '\n').encode('utf-8')
+            for table in range(self.tables):
+                for line in self._table_lines(rng, table, snapshot):
+                    yield line
+            yield (BOX_BOTTOM + '\n').encode('utf-8')
+
+    def write(self, out):
+        """Writes the output to a binary stream. Returns the number of bytes written."""
+        written = 0
+        for line in self.iter_lines():
+            out.write(line)
+            written += len(line)
+        return written
+
+    def generate(self):
+        return b''.join(self.iter_lines())
+
+    def _table_lines(self, rng, table, snapshot):
+        odd = rng.random() < self.odd_encoding_ratio
+        malformed = rng.random() < self.malformed_ratio
+        lines = []
+        name = f"DB.SCHÉMA.TÄBLE_{table}" if odd and rng.random() < 0.5 else f"DB.SCHEMA.TABLE_{table}"
+        lines.append(box_line(f'   "{name}": {{'))
+        scale = (table % 97 + 1) * (snapshot + 1)
+        for col in TABLE_COLUMNS:
+            if rng.random() < 0.9:
+                key = display_key(col)
+                if odd and rng.random() < 0.2:
+                    key = key.replace(' ', '-', 1)
+                lines.append(box_line(f'     "{key}": {rng.randint(0, 1000) * scale},'))
+        for col in TIMESTAMP_COLUMNS:
+            moment = BASE_TIME + datetime.timedelta(minutes=snapshot, milliseconds=rng.randint(0, 3_600_000))
+            lines.append(box_line(f'     "{display_key(col)}": "{moment.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}Z",'))
+        lines.append(box_line(f'     "Mapped Source Table": "SRC.SCHEMA.T{table}",'))
+        if rng.random() < self.integration_time_ratio:
+            lines.append(box_line('     "Integration Task Time": {'))
+            for col in INTEGRATION_TIME_COLUMNS:
+                lines.append(box_line(f'         "{display_key(col)}": {rng.randint(0, 5000)},'))
+            lines.append(box_line('     },'))
+        if rng.random() < self.last_batch_ratio:
+            lines.append(box_line('     "Last batch info": {'))
+            for col in LAST_BATCH_OTHER_COLUMNS:
+                lines.append(box_line(f'       "{display_key(col)}": {rng.randint(0, 100000)},'))
+            lines.append(box_line('       "Integration Task Time": {'))
+            for col in LAST_BATCH_TIME_COLUMNS:
+                lines.append(box_line(f'         "{display_key(col)}": {rng.randint(0, 5000)},'))
+            lines.append(box_line('       }'))
+            lines.append(box_line('     },'))
+        if malformed:
+            lines.insert(rng.randint(2, len(lines)), rng.choice([
+                box_line('     unquoted key: 12,'),
+                box_line('    "Misplaced Header": 3,'),
+                KV_START + '     "Truncated Line": 4',
+                'stray text from another command',
+                '',
+            ]))
+        lines.append(box_line('   },'))
+
+        encoded = [(line + '\n').encode('utf-8') for line in lines]
+        if odd:
+            position = rng.randint(1, len(encoded) - 1)
+            if rng.random() < 0.5:
+                encoded[position] = encoded[position][:-1] + b'\r\n'
+            else: # A latin-1 value the parser must skip without failing
+                encoded.insert(position, (KV_START + '     "Comment": "caf').encode('utf-8') + b'\xe9",\n')
+        return encoded
+
+
+# usage: python mon_generator.py [--tables N] [--seed N] [--snapshots N] > mon_output.txt
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic Striim mon output.")
+    arg_parser.add_argument('--tables', type=int, default=1000)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--snapshots', type=int, default=1, help="snapshots, each after a timestamp line")
+    arg_parser.add_argument('--last-batch-ratio', type=float, default=0.8)
+    arg_parser.add_argument('--integration-time-ratio', type=float, default=0.3)
+    arg_parser.add_argument('--odd-encoding-ratio', type=float, default=0.02)
+    arg_parser.add_argument('--malformed-ratio', type=float, default=0.02)
+    args = arg_parser.parse_args()
+    generator = MonOutputGenerator(args.tables, args.seed, args.last_batch_ratio, args.integration_time_ratio,
+                                   args.odd_encoding_ratio, args.malformed_ratio, args.snapshots)
+    generator.write(sys.stdout.buffer)
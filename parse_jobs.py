@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from log_parser import EXTRA_FIELDS_COLUMN, parse_log_file, iter_record_batches
+from compressed_input import detect_compression, open_log_input
+from result_cache import DiskFrameCache
+from result_views import store_views, store_batches
+from instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# --- Background parse jobs ---
+# A job's status lives in a small JSON file, so any worker process can report on a job
+# started by another one, and the parse itself runs in a separate process.
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_EMPTY = 'empty' # Parsed fine, but no table data was found
+JOB_FAILED = 'failed'
+JOB_FINISHED_STATES = (JOB_DONE, JOB_EMPTY, JOB_FAILED)
+PROGRESS_INTERVAL_SECONDS = 0.5 # Minimum time between progress writes
+
+
+class JobStore:
+    """Job status records as JSON files under `directory`."""
+
+    def __init__(self, directory, max_age=3600):
+        self.directory = directory
+        self.max_age = max_age # Finished jobs older than this are removed by create()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        if not job_id or not job_id.isalnum():
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.directory, job_id + '.json')
+
+    def create(self, source, bytes_total, cache_key):
+        self._remove_old_jobs()
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {
+            'id': job_id, 'status': JOB_QUEUED, 'source': source, 'cache_key': cache_key,
+            'bytes_total': bytes_total, 'bytes_done': 0, 'lines': 0, 'tables': 0, 'records': None,
+            'error': None, 'created': time.time(), 'started': None, 'finished': None,
+        })
+        return job_id
+
+    def get(self, job_id):
+        """The job's status record (with `elapsed` seconds), or None if unknown."""
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as job_file:
+                job = json.load(job_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if job['started'] is not None:
+            job['elapsed'] = (job['finished'] or time.time()) - job['started']
+        else:
+            job['elapsed'] = 0.0
+        return job
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id) or {}
+        job.pop('elapsed', None)
+        job.update(fields)
+        self._write(job_id, job)
+        return job
+
+    def _write(self, job_id, job):
+        # Write-then-rename so pollers never read a half-written file
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, prefix='.tmp-', suffix='.json',
+                                         delete=False, encoding='utf-8') as tmp_file:
+            json.dump(job, tmp_file)
+        os.replace(tmp_file.name, self._path(job_id))
+
+    def _remove_old_jobs(self):
+        cutoff = time.time() - self.max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.json') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def run_parse_job(jobs_dir, cache_settings, job_id, spool_path, workers=1, max_decompressed_bytes=None):
+    """
+    Runs in a background process: parses the spooled input, stores the DataFrame in the
+    result cache under the job's cache key and records the outcome. Removes spool_path.
+    cache_settings is (directory, max_bytes, timeout) for a DiskFrameCache.
+    Compressed input is decompressed as it is parsed, up to max_decompressed_bytes.
+    With one worker the records and their views are written to the cache batch by batch as
+    they are parsed (result_views.store_batches()), so the job never holds the whole result.
+    """
+    configure_logging() # No-op when forked from a configured process
+    store = JobStore(jobs_dir)
+    cache_directory, cache_max_bytes, cache_timeout = cache_settings
+    cache = DiskFrameCache(cache_directory, max_bytes=cache_max_bytes, default_timeout=cache_timeout, memory_entries=0)
+    latest = {'bytes_done': 0, 'lines': 0, 'tables': 0}
+    last_write = [0.0]
+
+    def progress(bytes_done, lines, tables):
+        latest.update(bytes_done=bytes_done, lines=lines, tables=tables)
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_INTERVAL_SECONDS:
+            last_write[0] = now
+            store.update(job_id, **latest)
+
+    try:
+        job = store.update(job_id, status=JOB_RUNNING, started=time.time())
+        logger.info("Job %s: parsing %s (%d bytes, %d workers)", job_id, job['source'], job['bytes_total'], workers)
+        if workers > 1:
+            parsed_df = parse_log_file(spool_path, workers=workers, progress=progress,
+                                       max_decompressed_bytes=max_decompressed_bytes)
+            rows = len(parsed_df)
+            if rows:
+                cache.set(job['cache_key'], parsed_df, timeout=cache_timeout)
+                store_views(cache, job['cache_key'], parsed_df, timeout=cache_timeout) # Filtered/display/SQL views, computed once
+        else:
+            with open_log_input(spool_path, max_bytes=max_decompressed_bytes) as log_stream:
+                batch_progress = progress
+                if detect_compression(spool_path): # Report compressed bytes, comparable with the upload size
+                    compressed_position = log_stream.raw.compressed_position
+                    batch_progress = lambda _, lines, tables: progress(compressed_position(), lines, tables)
+                # The result and its views are written batch by batch, never held as a whole
+                rows = store_batches(cache, job['cache_key'], iter_record_batches(log_stream, progress=batch_progress),
+                                     timeout=cache_timeout, json_columns=[EXTRA_FIELDS_COLUMN])
+        if not rows:
+            store.update(job_id, status=JOB_EMPTY, records=0, lines=latest['lines'],
+                         bytes_done=job['bytes_total'], finished=time.time())
+            return job_id
+        store.update(job_id, status=JOB_DONE, records=rows, tables=rows, lines=latest['lines'],
+                     bytes_done=job['bytes_total'], finished=time.time())
+        logger.info("Job %s: stored %d records under %s", job_id, rows, job['cache_key'])
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        store.update(job_id, status=JOB_FAILED, error=str(e), finished=time.time())
+    finally:
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
+    return job_id
@@ -0,0 +1,473 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+import tempfile
+import time
+import numpy as np
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process lock, each call still writes atomically
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- On-disk result cache (Arrow IPC files, shared by every worker process) ---
+FRAME_SUFFIX = '.arrow'
+STATS_FILE = 'stats.json'
+LOCK_FILE = '.lock'
+JSON_COLUMNS_KEY = b'json_columns' # Schema metadata: object columns stored as JSON text
+TIMEOUT_KEY = b'timeout' # Schema metadata: seconds the entry may go unused
+VERSION_KEY = b'version' # Schema metadata: unique per write, identifies the converted frame in memory
+DROP_EMPTY_KEY = b'drop_empty' # Schema metadata: columns left out on read when no row has a value
+STAT_NAMES = ('hits', 'misses', 'evictions', 'expirations', 'content_hits', 'content_misses')
+CONTENT_KEY_PREFIX = 'content-'
+CONTENT_HASH_CHUNK = 1 << 20 # Bytes hashed per read
+STATS_FLUSH_SECONDS = 5 # Counts are kept per process and added to stats.json at most this often
+_DATETIME_TAG = '$datetime' # JSON cells: {'$datetime': ISO string} for a datetime value
+
+
+class DiskFrameCache:
+    """
+    Stores DataFrames as uncompressed Arrow IPC files under `directory` and reads them
+    back through a memory map, so any worker process can serve any key.
+
+    The files' modification time is the LRU clock: get() touches the file, and set()
+    evicts least recently used files until the total size is under max_bytes.
+    Entries unused for longer than their timeout are treated as misses and removed.
+    Hit/miss/eviction counters live in stats.json next to the files and are shared
+    across processes. Each process counts in memory and adds its counts to the file
+    under the lock it already takes to evict, or after STATS_FLUSH_SECONDS, so a hit
+    doesn't lock and rewrite the file.
+
+    Each process also keeps the last `memory_entries` converted DataFrames, so paging
+    through one result only re-opens the file's schema instead of converting it again.
+
+    The directory is created private (0700). One owned by another user is refused, since
+    whoever can write to it decides what every worker reads back.
+    """
+
+    def __init__(self, directory, max_bytes, default_timeout=3600, memory_entries=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self.memory_entries = memory_entries
+        self._frames = OrderedDict() # key -> (version, DataFrame), most recently used last
+        self._counts = {} # Not yet in stats.json
+        self._counts_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        make_private_dir(directory)
+
+    # --- Files and locking ---
+    def _path(self, key):
+        if not key or os.sep in key or (os.altsep and os.altsep in key) or key.startswith('.'):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return os.path.join(self.directory, key + FRAME_SUFFIX)
+
+    def _lock(self):
+        return _FileLock(os.path.join(self.directory, LOCK_FILE))
+
+    def _entries(self):
+        """(mtime, size, path) for every cached frame, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(FRAME_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError: # Removed by another worker meanwhile
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        entries.sort()
+        return entries
+
+    # --- Counters ---
+    def count(self, name, amount=1):
+        """Adds to a shared counter reported by stats() (e.g. 'content_hits')."""
+        with self._counts_lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+        if time.monotonic() - self._flushed >= STATS_FLUSH_SECONDS:
+            self.flush_counts()
+
+    def flush_counts(self):
+        """Adds this process's counts to stats.json."""
+        with self._lock():
+            self._flush_counts()
+
+    def _flush_counts(self):
+        """flush_counts() for a caller holding the lock."""
+        with self._counts_lock:
+            counts, self._counts = self._counts, {}
+            self._flushed = time.monotonic()
+        if not counts:
+            return
+        stats = self._read_stats()
+        for name, amount in counts.items():
+            stats[name] = stats.get(name, 0) + amount
+        _write_atomic(os.path.join(self.directory, STATS_FILE), json.dumps(stats).encode('utf-8'), self.directory)
+
+    def _read_stats(self):
+        try:
+            with open(os.path.join(self.directory, STATS_FILE), 'r', encoding='utf-8') as stats_file:
+                return json.load(stats_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def stats(self):
+        """
+        Counters plus the current number of entries and bytes on disk. Other processes' counts
+        are up to STATS_FLUSH_SECONDS behind (or until their next set()).
+        """
+        self.flush_counts()
+        stats = {name: 0 for name in STAT_NAMES}
+        stats.update(self._read_stats())
+        entries = self._entries()
+        stats['entries'] = len(entries)
+        stats['bytes'] = sum(size for _, size, _ in entries)
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    # --- cachelib-style API ---
+    def get(self, key, columns=None):
+        """
+        Returns the cached DataFrame for key, or None if it is missing or expired.
+        With columns, only those (of the ones cached) are converted.
+        """
+        path = self._path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+            table = read_table(path)
+        except (FileNotFoundError, pa.ArrowInvalid) as e: # Missing, evicted mid-read, or a partial file
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Could not read cached frame %s: %s", path, e)
+            self.count('misses')
+            return None
+        timeout = int((table.schema.metadata or {}).get(TIMEOUT_KEY, self.default_timeout))
+        if timeout and time.time() - mtime > timeout:
+            self._remove(path)
+            self.count('expirations')
+            self.count('misses')
+            return None
+        try:
+            os.utime(path) # LRU: mark as recently used
+        except FileNotFoundError:
+            pass
+        self.count('hits')
+        if columns is not None:
+            return table_to_frame(table.select([col for col in columns if col in table.column_names]))
+        return self._to_frame(key, table)
+
+    def set(self, key, df, timeout=None):
+        """Writes df for key (atomically), then evicts LRU entries above max_bytes."""
+        path = self._path(key)
+        timeout = self.default_timeout if timeout is None else timeout
+        self._frames.pop(key, None)
+        write_frame(df, path, {TIMEOUT_KEY: str(timeout).encode('ascii'),
+                               VERSION_KEY: uuid.uuid4().hex.encode('ascii')}, self.directory)
+        self._evict(keep=path)
+        return True
+
+    def set_batches(self, key, frames, timeout=None, json_columns=(), drop_empty=False):
+        """
+        Like set(), but for an iterable of DataFrame batches with the same columns, written to
+        the entry's file one by one as they come (see FrameFileWriter). Returns the rows
+        written; nothing is stored without a batch.
+        """
+        with self.batch_writer(key, timeout, json_columns, drop_empty) as writer:
+            for df in frames:
+                writer.write(df)
+        return writer.rows
+
+    def batch_writer(self, key, timeout=None, json_columns=(), drop_empty=False):
+        """
+        A FrameFileWriter for key: batches written to it are stored (and LRU entries evicted)
+        when it is committed, or when its with-block ends without an exception.
+        """
+        path = self._path(key)
+        timeout = self.default_timeout if timeout is None else timeout
+        self._frames.pop(key, None)
+        return FrameFileWriter(path, {TIMEOUT_KEY: str(timeout).encode('ascii'),
+                                      VERSION_KEY: uuid.uuid4().hex.encode('ascii')},
+                               self.directory, json_columns, drop_empty, on_commit=lambda: self._evict(keep=path))
+
+    def delete(self, key):
+        self._frames.pop(key, None)
+        return self._remove(self._path(key))
+
+    def has(self, key):
+        return os.path.exists(self._path(key))
+
+    def clear(self):
+        self._frames.clear()
+        with self._lock():
+            for _, _, path in self._entries():
+                self._remove(path)
+        return True
+
+    # --- Internals ---
+    def _to_frame(self, key, table):
+        version = (table.schema.metadata or {}).get(VERSION_KEY)
+        cached = self._frames.get(key)
+        if cached is not None and version is not None and cached[0] == version:
+            self._frames.move_to_end(key)
+            return cached[1]
+        df = table_to_frame(table)
+        if self.memory_entries > 0:
+            self._frames[key] = (version, df)
+            while len(self._frames) > self.memory_entries:
+                self._frames.popitem(last=False)
+        return df
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e: # Windows refuses to delete a file that is still memory-mapped
+            logger.warning("Could not remove cached frame %s: %s", path, e)
+            return False
+
+    def _evict(self, keep=None):
+        evicted = 0
+        with self._lock():
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep: # Never evict the entry just written, even if it alone is over the cap
+                    continue
+                if self._remove(path):
+                    total -= size
+                    evicted += 1
+                    logger.debug("Evicted cached frame %s (%d bytes)", os.path.basename(path), size)
+            if evicted:
+                with self._counts_lock:
+                    self._counts['evictions'] = self._counts.get('evictions', 0) + evicted
+            self._flush_counts()
+
+
+def make_private_dir(directory):
+    """
+    Creates directory with mode 0700, or makes an existing one of ours private.
+    Raises RuntimeError if it belongs to another user (e.g. planted in a shared temp dir).
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'): # Windows: no owner uid, rely on the directory's ACL
+        return
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise RuntimeError(f"Cache directory {directory} is owned by uid {info.st_uid}, not by this user; "
+                           "remove it or set RESULT_CACHE_DIR to a directory of your own.")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        logger.info("Restricting cache directory %s to its owner", directory)
+        os.chmod(directory, 0o700)
+
+
+def new_content_hash(namespace=b''):
+    """
+    BLAKE2b hasher for content-addressed keys. `namespace` is hashed first so results from
+    a different parser/schema version never share a key with today's.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(namespace)
+    return hasher
+
+
+def content_key(hasher):
+    """Cache key for the content fed to a new_content_hash() hasher."""
+    return CONTENT_KEY_PREFIX + hasher.hexdigest()
+
+
+class _FileLock:
+    """Exclusive flock on a lock file; a no-op where fcntl is unavailable."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.handle = open(self.path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+
+def _write_atomic(path, data, directory):
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-', delete=False) as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_file.name, path)
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime): # Also pd.Timestamp
+        return {_DATETIME_TAG: value.isoformat()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} values can't be cached as JSON")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and _DATETIME_TAG in obj:
+        return datetime.datetime.fromisoformat(obj[_DATETIME_TAG])
+    return obj
+
+
+def encode_cell(value):
+    return None if value is None else json.dumps(value, default=_json_default)
+
+
+def decode_cell(text):
+    return None if text is None else json.loads(text, object_hook=_json_object_hook)
+
+
+def frame_table(df, json_columns=None, preserve_index=True):
+    """
+    df as an Arrow table plus the columns stored as JSON text: object columns Arrow can't
+    type (e.g. the extra_fields dicts), or exactly json_columns if given. Datetimes inside
+    them come back as datetimes; other values must be JSON types.
+    """
+    df = df.copy(deep=False)
+    if json_columns is None:
+        json_columns = [col for col in df.columns if df[col].dtype == object
+                        and not df[col].map(lambda x: x is None or isinstance(x, str)).all()]
+    for col in json_columns:
+        df[col] = df[col].map(encode_cell)
+    return pa.Table.from_pandas(df, preserve_index=preserve_index), list(json_columns)
+
+
+def write_frame(df, path, metadata=None, directory=None):
+    """
+    Writes df as an uncompressed Arrow IPC file via a temporary file and rename, so readers
+    in other processes never see a partial file. Object columns Arrow can't type (e.g. the
+    extra_fields dicts) are stored as JSON text and decoded again by read_frame().
+    """
+    table, json_columns = frame_table(df)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata.update(metadata or {})
+    schema_metadata[JSON_COLUMNS_KEY] = json.dumps(json_columns).encode('utf-8')
+    table = table.replace_schema_metadata(schema_metadata)
+
+    with tempfile.NamedTemporaryFile(dir=directory or os.path.dirname(path), prefix='.tmp-', delete=False) as tmp_file:
+        with pa.ipc.new_file(tmp_file, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file.name, path)
+
+
+class FrameFileWriter:
+    """
+    Writes DataFrame batches with the same columns to one Arrow IPC file as they come, so only
+    one batch is in memory at a time; read back with read_frame() as one frame (fresh index).
+    The first batch (even an empty one) fixes the schema; later batches are cast to it.
+    json_columns are stored as JSON text in every batch, other object columns as plain text.
+
+    With drop_empty=True, columns no row has a value for are left out when the file is read,
+    so batches can carry every column a frame might have (see log_parser.iter_record_batches()).
+    Atomic like write_frame(): commit() renames the finished file into place, abort() (or an
+    exception in the with-block) removes it. Nothing is stored if no batch was written.
+    """
+
+    def __init__(self, path, metadata=None, directory=None, json_columns=(), drop_empty=False, on_commit=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self.json_columns = list(json_columns)
+        self.drop_empty = drop_empty
+        self.on_commit = on_commit
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+        self._file = tempfile.NamedTemporaryFile(dir=directory or os.path.dirname(path), prefix='.tmp-', delete=False)
+
+    def write(self, df):
+        table, _ = frame_table(df, self.json_columns, preserve_index=False)
+        if self._writer is None:
+            # Columns missing from the whole first batch come out untyped
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                for field in table.schema])
+            schema_metadata = dict(table.schema.metadata or {}) # pandas metadata: restores Int64 etc.
+            schema_metadata.update(self.metadata)
+            schema_metadata[JSON_COLUMNS_KEY] = json.dumps(self.json_columns).encode('utf-8')
+            if self.drop_empty:
+                schema_metadata[DROP_EMPTY_KEY] = b'1'
+            self._schema = schema.with_metadata(schema_metadata)
+            self._writer = pa.ipc.new_file(self._file, self._schema)
+        if len(df):
+            self._writer.write_table(table.cast(self._schema))
+            self.rows += len(df)
+
+    def commit(self):
+        """Stores the file if a batch was written. Returns the rows written."""
+        if self._writer is None:
+            self.abort()
+            return 0
+        self._writer.close()
+        self._file.close()
+        os.replace(self._file.name, self.path)
+        if self.on_commit is not None:
+            self.on_commit()
+        return self.rows
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def write_frames(frames, path, metadata=None, directory=None, json_columns=(), drop_empty=False):
+    """Writes DataFrame batches to one Arrow IPC file with a FrameFileWriter. Returns the rows written."""
+    with FrameFileWriter(path, metadata, directory, json_columns, drop_empty) as writer:
+        for df in frames:
+            writer.write(df)
+    return writer.rows
+
+
+def read_table(path):
+    """Opens a file written by write_frame() through a memory map (no copy of the column data)."""
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def table_to_frame(table):
+    """Converts a table from read_table() back to the DataFrame given to write_frame()."""
+    metadata = table.schema.metadata or {}
+    json_columns = json.loads(metadata.get(JSON_COLUMNS_KEY, b'[]'))
+    if metadata.get(DROP_EMPTY_KEY) and table.num_rows:
+        # null_count comes with each batch, so nothing is scanned
+        table = table.drop_columns([name for name in table.column_names if table[name].null_count == table.num_rows])
+    df = table.to_pandas()
+    json_columns = [col for col in json_columns if col in df.columns] # Also after a projection
+    for col in json_columns:
+        df[col] = df[col].map(decode_cell).astype(object)
+    return df
+
+
+def read_frame(path):
+    return table_to_frame(read_table(path))
@@ -0,0 +1,259 @@
+import ast
+import hashlib
+import logging
+import re
+import numpy as np
+import pandas as pd
+from sql_output import VALID_COLUMNS
+from table_schema import TABLE_SCHEMA
+from instrumentation import STAGE_FILTER, span
+from hotspots import SUMMARY_INPUT_COLUMNS, summary_frame
+
+logger = logging.getLogger(__name__)
+
+# --- Derived views of a parsed result, cached next to the raw frame ---
+# Computed once when the result is stored (and again only if evicted), so page views, SQL
+# downloads and exports read a ready-made frame instead of filtering and converting each time.
+VIEW_FILTERED = 'filtered' # Rows matching the results filter, typed (sorting, export)
+VIEW_DISPLAY = 'display'   # The same rows with timestamps and nested values as text (search, page JSON)
+VIEW_SQL = 'sql'           # All rows, only the columns SQL output uses (no extra_fields to decode)
+VIEW_SUMMARY = 'summary'   # Hotspot rollups of the filtered rows, as JSON text (see hotspots.py)
+VIEWS = (VIEW_FILTERED, VIEW_DISPLAY, VIEW_SQL, VIEW_SUMMARY)
+
+RESULTS_FILTER_COLUMN = 'total_batches_created' # Rows missing this value are not shown by default
+DEFAULT_RESULTS_QUERY = f"{RESULTS_FILTER_COLUMN}.notna()"
+MAX_QUERY_LENGTH = 1000
+MAX_PATTERN_LENGTH = 200
+
+
+# --- Results filter (a pandas expression over the columns) ---
+class InvalidQueryError(ValueError):
+    """The results filter is not a supported expression."""
+
+
+# Methods a filter may call on a column, e.g. source_table_name.str.contains('ORDERS')
+_QUERY_METHODS = {'isna', 'notna', 'isnull', 'notnull', 'between', 'isin'}
+_QUERY_STR_METHODS = {'contains', 'startswith', 'endswith', 'match', 'fullmatch'}
+_QUERY_PATTERN_METHODS = {'contains', 'match', 'fullmatch'} # Their pattern is a regex
+# Repeated groups and backreferences are what let a regex backtrack for minutes on one value
+_RISKY_PATTERN = re.compile(r'(?<!\\)\)[*+?{]|\\[1-9]')
+_QUERY_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Invert, ast.USub,
+                ast.BinOp, ast.BitAnd, ast.BitOr, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+                ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+                ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple, ast.Call, ast.Attribute, ast.keyword)
+
+
+def validate_query(expression, columns):
+    """
+    Checks that expression only compares columns with literals and calls the column methods in
+    _QUERY_METHODS / _QUERY_STR_METHODS, so a filter typed into the UI can't reach anything else.
+    Returns the parsed expression. Raises InvalidQueryError.
+    """
+    if len(expression) > MAX_QUERY_LENGTH:
+        raise InvalidQueryError(f"Filter is longer than {MAX_QUERY_LENGTH} characters.")
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise InvalidQueryError(f"Filter is not a valid expression: {e.msg}") from None
+    columns = set(columns)
+    for node in ast.walk(tree):
+        if not isinstance(node, _QUERY_NODES):
+            raise InvalidQueryError(f"'{type(node).__name__}' is not allowed in a filter.")
+        if isinstance(node, ast.Name) and node.id not in columns and node.id not in ('True', 'False'):
+            raise InvalidQueryError(f"Unknown column '{node.id}'.")
+        if isinstance(node, ast.Attribute):
+            if node.attr == 'str' and isinstance(node.value, ast.Name):
+                continue
+            if node.attr in _QUERY_STR_METHODS and isinstance(node.value, ast.Attribute) and node.value.attr == 'str':
+                continue
+            if node.attr in _QUERY_METHODS and isinstance(node.value, ast.Name):
+                continue
+            raise InvalidQueryError(f"'.{node.attr}' is not allowed in a filter.")
+        if isinstance(node, ast.Call) and not isinstance(node.func, ast.Attribute):
+            raise InvalidQueryError("Only column methods can be called in a filter.")
+        if isinstance(node, ast.Call) and node.func.attr in _QUERY_PATTERN_METHODS:
+            _check_pattern(node)
+    return tree
+
+
+def _check_pattern(call):
+    """The regex of a .str.contains/match/fullmatch call: a short literal without repeated groups or backreferences."""
+    keywords = {keyword.arg: keyword.value for keyword in call.keywords}
+    regex = keywords.get('regex')
+    if isinstance(regex, ast.Constant) and regex.value is False:
+        return
+    pattern = call.args[0] if call.args else keywords.get('pat')
+    if not (isinstance(pattern, ast.Constant) and isinstance(pattern.value, str)):
+        raise InvalidQueryError(f"'.str.{call.func.attr}' needs a quoted pattern.")
+    if len(pattern.value) > MAX_PATTERN_LENGTH:
+        raise InvalidQueryError(f"Pattern is longer than {MAX_PATTERN_LENGTH} characters.")
+    if _RISKY_PATTERN.search(pattern.value):
+        raise InvalidQueryError("Repeated groups and backreferences are not allowed in a pattern.")
+    try:
+        re.compile(pattern.value)
+    except re.error as e:
+        raise InvalidQueryError(f"Pattern is not a valid regex: {e}") from None
+
+
+def _missing_never_match(tree):
+    """The expression with na=False added to the string method calls, so rows without text give False, not None."""
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and node.func.attr in _QUERY_STR_METHODS
+                and isinstance(node.func.value, ast.Attribute) and not any(keyword.arg == 'na' for keyword in node.keywords)):
+            node.keywords.append(ast.keyword(arg='na', value=ast.Constant(False)))
+    return ast.unparse(tree)
+
+
+def query_mask(df, expression):
+    """Boolean mask of the rows matching expression, evaluated column-wise (missing values don't match)."""
+    tree = validate_query(expression, df.columns)
+    try:
+        mask = df.eval(_missing_never_match(tree), engine='python')
+    except Exception as e: # Type errors, e.g. comparing a number column with text
+        raise InvalidQueryError(f"Filter could not be applied: {e}") from None
+    if not isinstance(mask, pd.Series) or not (pd.api.types.is_bool_dtype(mask.dtype)):
+        raise InvalidQueryError("Filter must be a condition (True/False per row).")
+    return mask.fillna(False).to_numpy(dtype=bool)
+
+
+def filter_results(df, expression=DEFAULT_RESULTS_QUERY):
+    """Rows of df matching the results filter (all rows for an empty one); a view, not a copy, when nothing is dropped."""
+    if not expression or df.empty:
+        return df
+    if expression == DEFAULT_RESULTS_QUERY and RESULTS_FILTER_COLUMN not in df.columns:
+        logger.debug("Filter column '%s' not found, skipping filter.", RESULTS_FILTER_COLUMN)
+        return df
+    with span(STAGE_FILTER):
+        mask = query_mask(df, expression)
+        filtered = df if mask.all() else df[mask]
+    logger.debug("Filter %r removed %d of %d rows.", expression, len(df) - len(filtered), len(df))
+    return filtered
+
+
+# --- Display text ---
+def column_text(values):
+    """Text of a column as shown in the table (None where missing), vectorized per dtype."""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        tz = getattr(values.dtype, 'tz', None)
+        if tz is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        # numpy formats the whole column in C; str(Timestamp) per cell is ~5x slower
+        text = pd.Series(np.datetime_as_string(values.to_numpy(), unit='us'), index=values.index).str.replace('T', ' ', regex=False)
+        if tz is not None:
+            text = text + '+00:00'
+    elif values.dtype == object:
+        text = values.map(lambda x: x if x is None or isinstance(x, str) else str(x))
+    else:
+        text = values.astype(str)
+    return text.where(values.notna(), None)
+
+
+def display_frame(df):
+    """Converts rows to JSON-friendly columns: timestamps and nested values become text."""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col].dtype) or df[col].dtype == object:
+            df[col] = column_text(df[col])
+    return df
+
+
+def sql_frame(df):
+    """The columns any SQL format writes (VALID_COLUMNS or the table's), all rows, in frame order."""
+    return df[[col for col in df.columns if col in VALID_COLUMNS or col in TABLE_SCHEMA]]
+
+
+# --- Cached views ---
+def view_key(cache_key, view, expression=DEFAULT_RESULTS_QUERY):
+    """Cache key of a view; filtered/display views of a non-default filter get a key of their own."""
+    if view == VIEW_SQL or expression == DEFAULT_RESULTS_QUERY:
+        return f"{cache_key}.{view}"
+    digest = hashlib.blake2b(expression.encode('utf-8'), digest_size=8).hexdigest()
+    return f"{cache_key}.{view}-{digest}"
+
+
+def compute_view(df, view, expression=DEFAULT_RESULTS_QUERY):
+    if view == VIEW_SQL:
+        return sql_frame(df)
+    filtered = filter_results(df, expression)
+    if view == VIEW_FILTERED:
+        return filtered
+    return derive_view(filtered, view)
+
+
+def derive_view(filtered, view):
+    """The display or summary view computed from the filtered view."""
+    if view == VIEW_SUMMARY:
+        return summary_frame(filtered)
+    return display_frame(filtered)
+
+
+def store_views(cache, cache_key, df, timeout=None):
+    """Computes the default views of a freshly parsed frame and caches them next to it."""
+    filtered = filter_results(df)
+    cache.set(view_key(cache_key, VIEW_FILTERED), filtered, timeout=timeout)
+    for view in (VIEW_DISPLAY, VIEW_SUMMARY):
+        cache.set(view_key(cache_key, view), derive_view(filtered, view), timeout=timeout)
+    cache.set(view_key(cache_key, VIEW_SQL), sql_frame(df), timeout=timeout)
+
+
+def store_batches(cache, cache_key, frames, timeout=None, json_columns=()):
+    """
+    Streaming counterpart of caching a frame and store_views(): writes the batches (see
+    log_parser.iter_record_batches()) and the filtered, display and SQL views of each batch to
+    their cache entries as they come, so the result is never in memory as a whole. Columns
+    no row of an entry has are left out when it is read. The summary is computed at the end
+    from the columns it needs, read back from the filtered view.
+    Returns the rows stored; nothing is stored without any.
+    """
+    writers = [cache.batch_writer(cache_key, timeout, json_columns, drop_empty=True),
+               cache.batch_writer(view_key(cache_key, VIEW_FILTERED), timeout, json_columns, drop_empty=True),
+               cache.batch_writer(view_key(cache_key, VIEW_DISPLAY), timeout, drop_empty=True),
+               cache.batch_writer(view_key(cache_key, VIEW_SQL), timeout, drop_empty=True)]
+    raw, filtered_view, display_view, sql_view = writers
+    try:
+        for df in frames:
+            if df.empty:
+                continue
+            raw.write(df)
+            filtered = filter_results(df)
+            filtered_view.write(filtered)
+            display_view.write(display_frame(filtered))
+            sql_view.write(sql_frame(df))
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    if not raw.rows:
+        for writer in writers:
+            writer.abort()
+        return 0
+    for writer in reversed(writers): # The raw frame last: once it is there, the result counts as stored
+        writer.commit()
+    summary_input = cache.get(view_key(cache_key, VIEW_FILTERED), columns=SUMMARY_INPUT_COLUMNS)
+    if summary_input is not None:
+        cache.set(view_key(cache_key, VIEW_SUMMARY), summary_frame(summary_input), timeout=timeout)
+    return raw.rows
+
+
+def get_view(cache, cache_key, view, expression=DEFAULT_RESULTS_QUERY):
+    """
+    The cached view of the result under cache_key, computed (and cached) from the raw frame if
+    it is missing, e.g. for a new filter or after eviction. None if the raw frame is gone too.
+    Raises InvalidQueryError for a bad filter.
+    """
+    key = view_key(cache_key, view, expression)
+    df = cache.get(key)
+    if df is not None:
+        return df
+    if view in (VIEW_DISPLAY, VIEW_SUMMARY): # Derived from the filtered view, which is likely still cached
+        filtered = get_view(cache, cache_key, VIEW_FILTERED, expression)
+        if filtered is None:
+            return None
+        df = derive_view(filtered, view)
+    else:
+        raw = cache.get(cache_key)
+        if raw is None:
+            return None
+        df = compute_view(raw, view, expression)
+    cache.set(key, df)
+    return df
@@ -0,0 +1,294 @@
+import datetime
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from log_parser import parse_file_ranges
+from compressed_input import detect_compression, open_log_input
+from sql_output import SQL_BLOCK_ROWS, FILTER_COLUMN, copy_statement, iter_copy_rows
+from table_schema import TABLE_NAME, TABLE_SCHEMA, SOURCE_FILE_COLUMN, NODE_COLUMN, TAG_COLUMNS
+from batch_ingest import node_name
+
+logger = logging.getLogger(__name__)
+
+# --- Snapshot history (append-only time series of mon snapshots) ---
+SNAPSHOT_TS_COLUMN = 'snapshot_ts'
+TABLE_KEY_COLUMN = 'source_table_name'
+INTERVAL_COLUMN = 'interval_seconds'
+HISTORY_TABLE_NAME = TABLE_NAME + '_history'
+HISTORY_STAGE_TABLE = 'process_queue_wait_times_history_stage' # Temporary, dropped at commit
+_HISTORY_BARE_NAME = HISTORY_TABLE_NAME.rsplit('.', 1)[-1] # Constraint and index names are not schema-qualified
+HISTORY_KEY_INDEX = _HISTORY_BARE_NAME + '_snapshot_key'
+# One row per table, node and snapshot; a missing node (untagged loads) counts as ''
+HISTORY_KEY_SQL = f"{TABLE_KEY_COLUMN}, (COALESCE({NODE_COLUMN}, '')), {SNAPSHOT_TS_COLUMN}"
+
+# Cumulative counters: their deltas between snapshots give rates
+COUNTER_COLUMNS = [
+    'total_batches_created', 'total_batches_queued', 'total_batches_uploaded', 'total_batches_ignored',
+    'partition_pruned_batches', 'total_events_merged', 'no_of_inserts', 'no_of_updates', 'no_of_deletes',
+    'no_of_pkupdates', 'no_of_ddls',
+]
+DELTA_SUFFIX = '_delta'
+RATE_SUFFIX = '_per_sec'
+
+# A capture of several snapshots in one file puts a timestamp line before each one, e.g.
+#   while true; do date -u +%Y-%m-%dT%H:%M:%SZ; <mon command>; sleep 60; done >> capture.txt
+_SNAPSHOT_TS_RE = re.compile(
+    rb'^[ \t]*(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?(?:Z|[+-]\d{2}:?\d{2})?)[ \t\r]*$',
+    re.MULTILINE)
+# Timestamp in a file name, e.g. mon_2024-04-13T12-01-02.txt or mon_20240413_120102.txt
+_FILENAME_TS_RE = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})[T_ -]?(\d{2})[:\-]?(\d{2})[:\-]?(\d{2})')
+
+
+def parse_snapshot_ts(text):
+    """Parses an ISO-8601 timestamp; naive times are taken as UTC."""
+    value = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def file_snapshot_ts(path):
+    """Snapshot time of a single-snapshot file: a timestamp in its name, else its modification time."""
+    match = _FILENAME_TS_RE.search(os.path.basename(path))
+    if match:
+        try:
+            return datetime.datetime(*map(int, match.groups()), tzinfo=datetime.timezone.utc)
+        except ValueError:
+            pass
+    logger.warning("No timestamp line or file name timestamp in %s; using its modification time.", path)
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path), tz=datetime.timezone.utc)
+
+
+def find_snapshots(buffer):
+    """
+    Splits a capture at its timestamp lines. Returns [(timestamp or None, start, end)];
+    the range before the first timestamp line (if any) has no timestamp.
+    """
+    snapshots = []
+    position = 0
+    timestamp = None
+    for match in _SNAPSHOT_TS_RE.finditer(buffer):
+        if match.start() > position or timestamp is not None:
+            snapshots.append((timestamp, position, match.start()))
+        timestamp = parse_snapshot_ts(match.group(1).decode('ascii'))
+        position = match.start()
+    if len(buffer) > position or timestamp is not None:
+        snapshots.append((timestamp, position, len(buffer)))
+    return snapshots
+
+
+def parse_snapshot_file(path, workers=1, ts_path=None):
+    """
+    Parses a file holding one snapshot or a capture of many, in parallel across snapshots.
+    Returns the records with a SNAPSHOT_TS_COLUMN in front. Snapshots without a timestamp
+    line take theirs from ts_path (default: path), see file_snapshot_ts().
+    Compressed captures are decompressed to a temporary file first, as snapshots are split by offset.
+    """
+    if detect_compression(path):
+        with open_log_input(path) as log_stream, tempfile.NamedTemporaryFile(suffix='.log') as plain_file:
+            shutil.copyfileobj(log_stream, plain_file)
+            plain_file.flush()
+            return parse_snapshot_file(plain_file.name, workers, ts_path=ts_path or path)
+    with open(path, 'rb') as log_file:
+        if os.fstat(log_file.fileno()).st_size == 0:
+            return pd.DataFrame()
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            snapshots = find_snapshots(buffer)
+    logger.info("%s: %d snapshot(s)", path, len(snapshots))
+    builders = parse_file_ranges(path, [(start, end) for _, start, end in snapshots], workers)
+
+    timestamps = []
+    row_counts = []
+    for (timestamp, _, _), range_builder in zip(snapshots, builders):
+        if range_builder.row_count:
+            timestamps.append(timestamp or file_snapshot_ts(ts_path or path))
+            row_counts.append(range_builder.row_count)
+    if not row_counts:
+        return pd.DataFrame()
+    builder = builders[0]
+    for other in builders[1:]:
+        builder.merge(other)
+    df = builder.to_dataframe()
+    snapshot_ts = pd.DatetimeIndex(timestamps).as_unit('us').repeat(row_counts)
+    df.insert(0, SNAPSHOT_TS_COLUMN, snapshot_ts)
+    return df
+
+
+def compute_deltas(df):
+    """
+    Sorts the records by (source_table_name, snapshot_ts) and adds INTERVAL_COLUMN plus a
+    <counter>_delta and <counter>_per_sec column per cumulative counter, between each table's
+    consecutive snapshots. Vectorized: one lexsort, then NumPy diffs masked at table boundaries.
+    With a NODE_COLUMN, each node's tables are series of their own.
+    Duplicate (snapshot_ts, source_table_name, node) records keep the last one. A counter that
+    went down (the component restarted) counts up from zero again. The first snapshot of each
+    table has no delta (history_insert_sql() takes it against the last stored row).
+    """
+    if df.empty:
+        return df
+    if NODE_COLUMN in df.columns:
+        table_codes = df.groupby([NODE_COLUMN, TABLE_KEY_COLUMN], sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        table_codes, _ = pd.factorize(df[TABLE_KEY_COLUMN])
+    ts = df[SNAPSHOT_TS_COLUMN].dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[us]').astype(np.int64)
+    order = np.lexsort((np.arange(len(df)), ts, table_codes)) # Stable: later duplicates sort last
+    table_codes = table_codes[order]
+    ts = ts[order]
+
+    # Keep the last record of each (table, snapshot_ts)
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = (table_codes[1:] != table_codes[:-1]) | (ts[1:] != ts[:-1])
+    if not keep.all():
+        logger.info("Dropping %d duplicate (snapshot_ts, source_table_name, node) records", int((~keep).sum()))
+        order, table_codes, ts = order[keep], table_codes[keep], ts[keep]
+    df = df.take(order).reset_index(drop=True)
+
+    same_table = np.zeros(len(df), dtype=bool)
+    same_table[1:] = table_codes[1:] == table_codes[:-1]
+    interval = np.full(len(df), np.nan)
+    interval[1:] = (ts[1:] - ts[:-1]) / 1e6
+    interval[~same_table] = np.nan
+    df[INTERVAL_COLUMN] = interval
+
+    for col in COUNTER_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col].array
+        missing = np.asarray(values.isna())
+        current = values.to_numpy(dtype=np.int64, na_value=0)
+        delta = np.zeros(len(df), dtype=np.int64)
+        delta[1:] = current[1:] - current[:-1]
+        valid = same_table.copy()
+        valid[1:] &= ~missing[1:] & ~missing[:-1]
+        reset = valid & (delta < 0)
+        delta[reset] = current[reset]
+        rate_valid = valid & (interval > 0)
+        rate = np.divide(delta, interval, out=np.zeros(len(df)), where=rate_valid)
+        # Added one by one so the frame is never copied as a whole
+        df[col + DELTA_SUFFIX] = pd.arrays.IntegerArray(delta, ~valid)
+        df[col + RATE_SUFFIX] = pd.arrays.FloatingArray(rate, ~rate_valid)
+    return df
+
+
+def build_history(paths, workers=1, node_pattern=None, tag=True):
+    """
+    Parses snapshot files/captures into one history frame with deltas and rates.
+    With tag=True, records carry their file and node (see batch_ingest.node_name()), so
+    dumps of several nodes taken at the same time are kept apart. Untagged, such records
+    would overwrite each other, so the same table at the same time in two files is an error.
+    """
+    frames = []
+    for path in paths:
+        frame = parse_snapshot_file(path, workers)
+        if frame.empty:
+            continue
+        if tag:
+            frame[SOURCE_FILE_COLUMN] = path
+            frame[NODE_COLUMN] = node_name(path, node_pattern)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    if not tag and len(frames) > 1:
+        keys = pd.concat([frame[[SNAPSHOT_TS_COLUMN, TABLE_KEY_COLUMN]].drop_duplicates() for frame in frames])
+        if keys.duplicated().any():
+            raise ValueError("Several files hold the same table at the same snapshot time (e.g. one dump per node); "
+                             "load them with their node tags instead of --no-tags.")
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return compute_deltas(df)
+
+
+# --- History table output ---
+HISTORY_SQL_TYPES = {'VARCHAR': 'TEXT', 'TEXT': 'TEXT', 'INT': 'INT', 'INTEGER': 'INT', 'BIGINT': 'BIGINT', 'TIMESTAMP': 'TIMESTAMP'}
+
+
+def history_schema():
+    """{column: SQL type} of the history table, in column order."""
+    schema = {SNAPSHOT_TS_COLUMN: 'TIMESTAMP'}
+    schema.update((col, HISTORY_SQL_TYPES.get(sql_type, 'TEXT')) for col, sql_type in TABLE_SCHEMA.items())
+    schema[INTERVAL_COLUMN] = 'DOUBLE PRECISION'
+    for col in COUNTER_COLUMNS:
+        if col in TABLE_SCHEMA:
+            schema[col + DELTA_SUFFIX] = 'BIGINT'
+            schema[col + RATE_SUFFIX] = 'DOUBLE PRECISION'
+    return schema
+
+
+def history_table_ddl():
+    """
+    CREATE TABLE IF NOT EXISTS for the append-only history table and its key, plus the
+    temporary staging table a load is copied into first (see history_insert_sql()).
+    Tables created before the node tags get the tag columns, and their primary key on
+    (snapshot_ts, source_table_name) is replaced by the key that includes the node.
+    """
+    schema = history_schema()
+    columns = ",\n".join(f"    {col} {sql_type}" for col, sql_type in schema.items())
+    added = ", ".join(f"ADD COLUMN IF NOT EXISTS {col} {schema[col]}" for col in TAG_COLUMNS if col in schema)
+    return (f"CREATE TABLE IF NOT EXISTS {HISTORY_TABLE_NAME} (\n{columns}\n);\n"
+            f"ALTER TABLE {HISTORY_TABLE_NAME} {added};\n"
+            f"ALTER TABLE {HISTORY_TABLE_NAME} DROP CONSTRAINT IF EXISTS {_HISTORY_BARE_NAME}_pkey;\n"
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {HISTORY_KEY_INDEX} ON {HISTORY_TABLE_NAME} ({HISTORY_KEY_SQL});\n"
+            f"CREATE TEMPORARY TABLE {HISTORY_STAGE_TABLE} (LIKE {HISTORY_TABLE_NAME}) ON COMMIT DROP;")
+
+
+def history_insert_sql(columns):
+    """
+    Moves the staged rows into the history table, skipping snapshots it already has, so
+    loading the same files again adds nothing. The first staged snapshot of each table and
+    node has no interval in the batch; its interval, deltas and rates are computed against
+    the last row stored before it, with the same counter-reset rule as compute_deltas().
+    """
+    counters = [col for col in COUNTER_COLUMNS if col in columns]
+    seeded = {} # Delta/rate column -> its value for a table's first staged snapshot
+    for col in counters:
+        delta = f"CASE WHEN stage.{col} < previous.{col} THEN stage.{col} ELSE stage.{col} - previous.{col} END"
+        seeded[col + DELTA_SUFFIX] = delta
+        seeded[col + RATE_SUFFIX] = f"CASE WHEN previous.{INTERVAL_COLUMN} > 0 THEN ({delta}) / previous.{INTERVAL_COLUMN} END"
+    seeded[INTERVAL_COLUMN] = f"previous.{INTERVAL_COLUMN}"
+    values = [f"CASE WHEN stage.{INTERVAL_COLUMN} IS NOT NULL THEN stage.{col} ELSE {seeded[col]} END"
+              if col in seeded else f"stage.{col}" for col in columns]
+    stored_counters = "".join(f", stored.{col}" for col in counters)
+    values_sql = ",\n       ".join(values)
+    return (f"INSERT INTO {HISTORY_TABLE_NAME} ({', '.join(columns)})\n"
+            f"SELECT {values_sql}\n"
+            f"FROM {HISTORY_STAGE_TABLE} AS stage\n"
+            f"LEFT JOIN LATERAL (\n"
+            f"    SELECT EXTRACT(EPOCH FROM stage.{SNAPSHOT_TS_COLUMN} - stored.{SNAPSHOT_TS_COLUMN})::DOUBLE PRECISION "
+            f"AS {INTERVAL_COLUMN}{stored_counters}\n"
+            f"    FROM {HISTORY_TABLE_NAME} AS stored\n"
+            f"    WHERE stage.{INTERVAL_COLUMN} IS NULL AND stored.{TABLE_KEY_COLUMN} = stage.{TABLE_KEY_COLUMN}\n"
+            f"      AND COALESCE(stored.{NODE_COLUMN}, '') = COALESCE(stage.{NODE_COLUMN}, '')\n"
+            f"      AND stored.{SNAPSHOT_TS_COLUMN} < stage.{SNAPSHOT_TS_COLUMN}\n"
+            f"    ORDER BY stored.{SNAPSHOT_TS_COLUMN} DESC LIMIT 1\n"
+            f") AS previous ON TRUE\n"
+            f"ON CONFLICT DO NOTHING;")
+
+
+def history_columns(df):
+    """Columns of df that exist in the history table, in table order."""
+    return [col for col in history_schema() if col in df.columns]
+
+
+def iter_history_sql(df, block_size=SQL_BLOCK_ROWS):
+    """
+    Yields a script that appends df to HISTORY_TABLE_NAME (created if needed) in one
+    transaction: COPY ... FROM STDIN into the staging table, then history_insert_sql().
+    Nothing is truncated, and snapshots already in the table are skipped.
+    """
+    if df is None or df.empty:
+        yield "-- No snapshot data to append."
+        return
+    columns = history_columns(df)
+    yield f"BEGIN;\n{history_table_ddl()}\n{copy_statement(columns, table=HISTORY_STAGE_TABLE)};\n"
+    rows_skipped = 0
+    for data, _, skipped in iter_copy_rows(df, columns, block_size=block_size):
+        rows_skipped += skipped
+        if data:
+            yield data
+    yield f"\\.\n{history_insert_sql(columns)}\nCOMMIT;\n"
+    if rows_skipped:
+        yield f"-- Note: Skipped {rows_skipped} rows where '{FILTER_COLUMN}' was missing.\n"
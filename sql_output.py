@@ -0,0 +1,349 @@
+import itertools
+import logging
+import pandas as pd
+from table_schema import TABLE_NAME, TABLE_SCHEMA, NODE_COLUMN
+from instrumentation import STAGE_SQL_FORMAT, timed_chunks
+
+logger = logging.getLogger(__name__)
+
+# --- VALID_COLUMNS definition (ensure it matches original script's intent) ---
+VALID_COLUMNS = {
+    # Copied directly from original script for consistency
+    'batch_queue_id', 'wait_milliseconds', 'source_table_name', 'total_batches_created',
+    'partition_pruned_batches', 'last_successful_merge_time', 'total_batches_ignored',
+    'max_integration_time_in_ms', 'avg_in_mem_compaction_time_in_ms',
+    'avg_batch_size_in_bytes', 'no_of_updates', 'no_of_inserts', 'total_events_merged',
+    'no_of_ddls', 'no_of_deletes', 'no_of_pkupdates', 'avg_event_count_per_batch',
+    'min_integration_time_in_ms', 'mapped_source_table', 'total_batches_queued',
+    'avg_compaction_time_in_ms', 'avg_waiting_time_in_queue_in_ms',
+    'avg_integration_time_in_ms', 'total_batches_uploaded', 'avg_merge_time_in_ms',
+    # Note: Original script prefixes keys *within* the loop, so VALID_COLUMNS
+    # should contain the *prefixed* keys expected from last_batch_info block
+    'last_batch_no_of_updates', 'last_batch_event_count', 'last_batch_no_of_inserts',
+    'last_batch_max_record_size', 'last_batch_total_events_merged', 'last_batch_no_of_ddls',
+    'last_batch_sequence_number', 'last_batch_size_in_bytes', 'last_batch_compaction_time_in_ms',
+    'last_batch_stage_resources_management_time_in_ms', 'last_batch_upload_time_in_ms',
+    'last_batch_merge_time_in_ms', 'last_batch_in_memory_compaction_time_in_ms',
+    'last_batch_pk_update_time_in_ms', 'last_batch_ddl_execution_time_in_ms',
+    'last_batch_total_integration_time_in_ms', 'last_batch_no_of_deletes',
+    'last_batch_no_of_pkupdates', 'last_batch_accumulation_time_in_ms',
+    # Add other possible prefixed keys if the original logic could generate them
+    'last_batch_avg_stage_resources_management_time_in_ms', # From previous flask attempt
+    'last_batch_avg_upload_time_in_ms', # From previous flask attempt
+    'last_batch_batch_event_count', # From previous flask attempt
+    'last_batch_max_record_size_in_batch',# From previous flask attempt
+    'last_batch_batch_sequence_number',# From previous flask attempt
+    'last_batch_batch_size_in_bytes',# From previous flask attempt
+    'last_batch_batch_accumulation_time_in_ms', # From previous flask attempt
+    'last_batch_avg_compaction_time_in_ms', # From previous flask attempt
+    'last_batch_avg_merge_time_in_ms', # From previous flask attempt
+    # IMPORTANT: Also include the marker keys if the original logic stored them
+    'last_batch_last_batch_info',
+    'last_batch_integration_task_time'
+}
+
+
+# --- SQL Generation (streamed in fixed-size row blocks) ---
+SQL_BLOCK_ROWS = 1000 # Rows formatted per chunk of streamed SQL
+
+
+def format_sql_column(values):
+    """
+    Formats one column of a row block with the original script's value logic:
+    strings are wrapped in quotes (no escaping), everything else goes through str().
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.astype(str).tolist() # Same text as str() per value ('<NA>' for missing)
+    return [f"'{value}'" if isinstance(value, str) else str(value) for value in values.tolist()]
+
+
+def iter_sql_inserts(df, block_size=SQL_BLOCK_ROWS):
+    """
+    Yields PostgreSQL INSERT statements from a Pandas DataFrame in chunks of text,
+    mimicking the original script's formatting logic BUT skipping rows
+    where 'total_batches_created' is NaN/None.
+    The chunks concatenate to the full script; memory stays flat regardless of row count.
+    WARNING: Still uses original script's potentially unsafe value formatting.
+    """
+    if df is None or df.empty:
+        yield "-- No data to generate INSERT statements for."
+        return
+
+    valid_columns = VALID_COLUMNS
+    valid_df_columns = [col for col in df.columns if col in valid_columns]
+
+    if not valid_df_columns:
+         logger.warning("No columns in DataFrame matched VALID_COLUMNS. DataFrame columns: %s", df.columns.tolist())
+         yield "-- No valid columns found in the parsed data matching VALID_COLUMNS."
+         return
+
+    logger.debug("Columns considered for SQL generation: %s", valid_df_columns)
+
+    # TRUNCATE statement first
+    yield "TRUNCATE TABLE public.process_queue_wait_times;"
+
+    # Every statement shares the same column list (no quotes on columns)
+    statement_start = f"INSERT INTO public.process_queue_wait_times ({', '.join(valid_df_columns)}) VALUES ("
+
+    # Define the specific column to check for NaN
+    nan_check_column = 'total_batches_created'
+    check_nan = nan_check_column in valid_df_columns
+    rows_skipped = 0
+
+    for start in range(0, len(df), block_size):
+        block = df.iloc[start:start + block_size]
+        if check_nan:
+            missing = block[nan_check_column].isna()
+            if missing.any():
+                rows_skipped += int(missing.sum())
+                block = block[~missing]
+        if block.empty:
+            continue
+        formatted_columns = [format_sql_column(block[col]) for col in valid_df_columns]
+        yield "".join(f"\n{statement_start}{', '.join(values)});" for values in zip(*formatted_columns))
+
+    if rows_skipped > 0:
+        logger.info("Skipped generating SQL for %d rows due to NaN in '%s'.", rows_skipped, nan_check_column)
+        # Optionally add a comment to the SQL output
+        yield f"\n-- Note: Skipped {rows_skipped} rows where '{nan_check_column}' was missing."
+
+
+# --- Bulk-load formats (standard NULLs, escaped values, DDL column order) ---
+SQL_FORMAT_INSERT = 'insert'             # legacy one-statement-per-row script (above)
+SQL_FORMAT_MULTI_INSERT = 'multi_insert' # INSERT ... VALUES (...), (...), ... in batches
+SQL_FORMAT_COPY_TEXT = 'copy_text'       # COPY ... FROM STDIN (tab-separated text format)
+SQL_FORMAT_COPY_CSV = 'copy_csv'         # COPY ... FROM STDIN WITH (FORMAT csv)
+SQL_FORMAT_MERGE = 'merge'               # COPY into a staging table, then upsert only the changed rows
+SQL_FORMATS = (SQL_FORMAT_INSERT, SQL_FORMAT_MULTI_INSERT, SQL_FORMAT_COPY_TEXT, SQL_FORMAT_COPY_CSV, SQL_FORMAT_MERGE)
+DEFAULT_BATCH_ROWS = 500 # Rows per multi-row INSERT statement
+
+FILTER_COLUMN = 'total_batches_created' # Rows missing this value are skipped, as in the legacy script
+COPY_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def table_columns(df):
+    """Columns of df that exist in the target table, in DDL order."""
+    return [col for col in TABLE_SCHEMA if col in df.columns]
+
+
+def split_frames(data):
+    """
+    (first frame, frames) of a DataFrame or an iterable of DataFrame batches with the same
+    columns (log_parser.iter_record_batches()), so the columns can be checked before the
+    batches are consumed. The first frame is None when there is no data.
+    """
+    if data is None or isinstance(data, pd.DataFrame):
+        return (None, []) if data is None or data.empty else (data, [data])
+    frames = iter(data)
+    for first in frames:
+        if not first.empty:
+            return first, itertools.chain([first], frames)
+    return None, []
+
+
+def iter_row_blocks(df, block_size=SQL_BLOCK_ROWS):
+    """Yields (block, rows skipped) slices of df (or of each batch) without rows missing FILTER_COLUMN."""
+    for frame in ([df] if isinstance(df, pd.DataFrame) else df):
+        check = FILTER_COLUMN in frame.columns
+        for start in range(0, len(frame), block_size):
+            block = frame.iloc[start:start + block_size]
+            skipped = 0
+            if check:
+                missing = block[FILTER_COLUMN].isna()
+                skipped = int(missing.sum())
+                if skipped:
+                    block = block[~missing]
+            yield block, skipped
+
+
+def quote_sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def quote_csv_string(value):
+    # Quote anything that could be confused with a delimiter, a line break or NULL (empty)
+    if value == '' or any(ch in value for ch in ',"\n\r') or value == '\\.':
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def format_column(values, null, quote=None):
+    """
+    Formats one column of a row block as text values for SQL/COPY output.
+    Missing values become `null`; strings and timestamps are passed through `quote`.
+    """
+    dtype = values.dtype
+    if pd.api.types.is_numeric_dtype(dtype):
+        text = values.astype(str).to_numpy(dtype=object)
+        text[values.isna().to_numpy()] = null
+        return text.tolist()
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        if getattr(dtype, 'tz', None) is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None) # TIMESTAMP columns hold UTC
+        text = values.dt.strftime('%Y-%m-%d %H:%M:%S.%f').tolist()
+    else:
+        text = values.tolist()
+    quote = quote or str
+    return [null if value is None or (not isinstance(value, str) and pd.isna(value))
+            else quote(value if isinstance(value, str) else str(value))
+            for value in text]
+
+
+def iter_multi_row_inserts(df, batch_size=DEFAULT_BATCH_ROWS):
+    """Yields a TRUNCATE plus batched multi-row INSERT statements, with proper NULLs and quoting."""
+    first, frames = split_frames(df)
+    if first is None or not table_columns(first):
+        yield "-- No data to generate INSERT statements for."
+        return
+    columns = table_columns(first)
+    yield f"TRUNCATE TABLE {TABLE_NAME};"
+    statement_start = f"\nINSERT INTO {TABLE_NAME} ({', '.join(columns)}) VALUES\n"
+    rows_skipped = 0
+    for block, skipped in iter_row_blocks(frames, batch_size):
+        rows_skipped += skipped
+        if block.empty:
+            continue
+        formatted_columns = [format_column(block[col], 'NULL', quote_sql_string) for col in columns]
+        rows = ",\n".join(f"({', '.join(values)})" for values in zip(*formatted_columns))
+        yield f"{statement_start}{rows};"
+    if rows_skipped:
+        yield f"\n-- Note: Skipped {rows_skipped} rows where '{FILTER_COLUMN}' was missing."
+
+
+def copy_statement(columns, csv=False, table=TABLE_NAME):
+    """The COPY ... FROM STDIN statement matching iter_copy_rows() output."""
+    options = " WITH (FORMAT csv)" if csv else ""
+    return f"COPY {table} ({', '.join(columns)}) FROM STDIN{options}"
+
+
+def iter_copy_rows(df, columns, csv=False, block_size=SQL_BLOCK_ROWS):
+    """Yields (COPY data text, rows written, rows skipped) per row block of df (or of each batch)."""
+    if csv:
+        null, quote, delimiter = '', quote_csv_string, ','
+    else:
+        null, quote, delimiter = '\\N', (lambda value: value.translate(COPY_TEXT_ESCAPES)), '\t'
+    for block, skipped in iter_row_blocks(df, block_size):
+        if block.empty:
+            yield "", 0, skipped
+            continue
+        formatted_columns = [format_column(block[col], null, quote) for col in columns]
+        yield "".join(delimiter.join(values) + "\n" for values in zip(*formatted_columns)), len(block), skipped
+
+
+def iter_copy(df, csv=False, block_size=SQL_BLOCK_ROWS):
+    """Yields a TRUNCATE plus a COPY ... FROM STDIN block (text or CSV format) for psql."""
+    first, frames = split_frames(df)
+    if first is None or not table_columns(first):
+        yield "-- No data to generate COPY data for."
+        return
+    columns = table_columns(first)
+    yield f"TRUNCATE TABLE {TABLE_NAME};\n{copy_statement(columns, csv)};\n"
+    rows_skipped = 0
+    for data, _, skipped in iter_copy_rows(frames, columns, csv, block_size):
+        rows_skipped += skipped
+        if data:
+            yield data
+    yield "\\.\n"
+    if rows_skipped:
+        yield f"-- Note: Skipped {rows_skipped} rows where '{FILTER_COLUMN}' was missing.\n"
+
+
+# --- Merge (upsert) output ---
+# Needs the unique key added by dw_stats_merge_key.sql: one row per table and node, so
+# several nodes' dumps merge side by side. A missing node (untagged loads) counts as ''.
+MERGE_KEY_COLUMN = 'source_table_name'
+MERGE_NODE_COLUMN = NODE_COLUMN
+MERGE_KEY_SQL = f"{MERGE_KEY_COLUMN}, (COALESCE({MERGE_NODE_COLUMN}, ''))" # The unique index's expressions
+MERGE_STAGE_TABLE = 'process_queue_wait_times_stage'
+_STAGE_ROW_COLUMN = 'stage_row' # Input order, so the last record of a duplicated table wins
+
+
+def merge_stage_sql():
+    """Creates the staging table (dropped at commit) that the new snapshot is COPY'd into."""
+    return (f"CREATE TEMP TABLE {MERGE_STAGE_TABLE} (LIKE {TABLE_NAME}) ON COMMIT DROP;\n"
+            f"ALTER TABLE {MERGE_STAGE_TABLE} ADD COLUMN {_STAGE_ROW_COLUMN} BIGSERIAL;")
+
+
+def merge_upsert_sql(columns, returning=False):
+    """
+    INSERT ... ON CONFLICT from the staging table into TABLE_NAME: new tables are inserted,
+    existing ones updated only where a value changed. A table listed twice for the same node
+    keeps its last record. With returning=True each written row returns whether it was
+    inserted (True) or updated (False).
+    """
+    column_list = ', '.join(columns)
+    updates = [col for col in columns if col not in (MERGE_KEY_COLUMN, MERGE_NODE_COLUMN)]
+    sql = (f"INSERT INTO {TABLE_NAME} AS target ({column_list})\n"
+           f"SELECT DISTINCT ON ({MERGE_KEY_SQL}) {column_list} FROM {MERGE_STAGE_TABLE}\n"
+           f"ORDER BY {MERGE_KEY_SQL}, {_STAGE_ROW_COLUMN} DESC\n"
+           f"ON CONFLICT ({MERGE_KEY_SQL}) DO ")
+    if not updates:
+        sql += "NOTHING"
+    else:
+        sql += (f"UPDATE SET {', '.join(f'{col} = EXCLUDED.{col}' for col in updates)}\n"
+                f"WHERE ({', '.join(f'target.{col}' for col in updates)}) IS DISTINCT FROM "
+                f"({', '.join(f'EXCLUDED.{col}' for col in updates)})")
+    if returning:
+        sql += "\nRETURNING (xmax = 0) AS inserted" # xmax is 0 on freshly inserted row versions
+    return sql
+
+
+def merge_delete_sql():
+    """Deletes the rows of TABLE_NAME (table and node) that are not in the staged snapshot."""
+    return (f"DELETE FROM {TABLE_NAME} AS target WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {MERGE_STAGE_TABLE} AS stage WHERE stage.{MERGE_KEY_COLUMN} = target.{MERGE_KEY_COLUMN} "
+            f"AND COALESCE(stage.{MERGE_NODE_COLUMN}, '') = COALESCE(target.{MERGE_NODE_COLUMN}, ''))")
+
+
+def iter_merge(df, csv=False, delete_missing=False, block_size=SQL_BLOCK_ROWS):
+    """
+    Yields a psql script that merges df into TABLE_NAME in one transaction: COPY into a
+    staging table, then upsert the changed rows (and, with delete_missing, delete the tables
+    missing from df) instead of truncating and reloading everything.
+    """
+    first, frames = split_frames(df)
+    if first is None or not table_columns(first):
+        yield "-- No data to generate a merge script for."
+        return
+    columns = table_columns(first)
+    if MERGE_KEY_COLUMN not in columns:
+        yield f"-- No '{MERGE_KEY_COLUMN}' column to merge on."
+        return
+    yield f"BEGIN;\n{merge_stage_sql()}\n{copy_statement(columns, csv, MERGE_STAGE_TABLE)};\n"
+    rows_skipped = 0
+    for data, _, skipped in iter_copy_rows(frames, columns, csv, block_size):
+        rows_skipped += skipped
+        if data:
+            yield data
+    yield f"\\.\n{merge_upsert_sql(columns)};\n"
+    if delete_missing:
+        yield f"{merge_delete_sql()};\n"
+    yield "COMMIT;\n"
+    if rows_skipped:
+        yield f"-- Note: Skipped {rows_skipped} rows where '{FILTER_COLUMN}' was missing.\n"
+
+
+def iter_sql(df, sql_format=SQL_FORMAT_INSERT, batch_size=DEFAULT_BATCH_ROWS, delete_missing=False):
+    """
+    Yields the load script for df in the requested SQL_FORMATS format (timed as the sql_format stage).
+    delete_missing only applies to the merge format. The bulk formats also take an iterable of
+    DataFrame batches instead of df (streaming, see log_parser.iter_record_batches()).
+    """
+    if sql_format == SQL_FORMAT_INSERT:
+        if df is not None and not isinstance(df, pd.DataFrame):
+            raise ValueError(f"The '{SQL_FORMAT_INSERT}' format needs the whole DataFrame; use a bulk format for batches.")
+        return timed_chunks(STAGE_SQL_FORMAT, iter_sql_inserts(df))
+    if sql_format == SQL_FORMAT_MULTI_INSERT:
+        return timed_chunks(STAGE_SQL_FORMAT, iter_multi_row_inserts(df, batch_size))
+    if sql_format == SQL_FORMAT_COPY_TEXT:
+        return timed_chunks(STAGE_SQL_FORMAT, iter_copy(df))
+    if sql_format == SQL_FORMAT_COPY_CSV:
+        return timed_chunks(STAGE_SQL_FORMAT, iter_copy(df, csv=True))
+    if sql_format == SQL_FORMAT_MERGE:
+        return timed_chunks(STAGE_SQL_FORMAT, iter_merge(df, delete_missing=delete_missing))
+    raise ValueError(f"Unknown SQL format '{sql_format}'. Expected one of: {', '.join(SQL_FORMATS)}")
+
+
+def generate_sql_inserts(df, sql_format=SQL_FORMAT_INSERT, batch_size=DEFAULT_BATCH_ROWS, delete_missing=False):
+    """Returns the whole script from iter_sql() as one string."""
+    return "".join(iter_sql(df, sql_format, batch_size, delete_missing))
@@ -0,0 +1,34 @@
+import os
+import re
+
+# --- Target table definition (parsed from the DDL shipped next to the app) ---
+DDL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dw_stats_table.sql')
+
+# Up to the statement's closing ');', so migrations further down the file are not read as columns
+_TABLE_RE = re.compile(r'CREATE\s+TABLE\s+([\w.]+)\s*\((.*?)\)\s*;', re.IGNORECASE | re.DOTALL)
+_COLUMN_RE = re.compile(r'^\s*(?!(?:CONSTRAINT|PRIMARY|UNIQUE|FOREIGN|CHECK|EXCLUDE)\b)(\w+)\s+([A-Za-z]+)',
+                        re.MULTILINE | re.IGNORECASE)
+_COMMENT_RE = re.compile(r'--[^\n]*')
+
+
+def load_table_schema(path=DDL_PATH):
+    """
+    Reads the CREATE TABLE statement from the DDL file.
+    Returns (table name, {column name: SQL type}) with columns in DDL order.
+    """
+    with open(path, 'r', encoding='utf-8') as ddl_file:
+        ddl = _COMMENT_RE.sub('', ddl_file.read())
+    match = _TABLE_RE.search(ddl)
+    if not match:
+        raise ValueError(f"No CREATE TABLE statement found in {path}")
+    columns = {name: sql_type.upper() for name, sql_type in _COLUMN_RE.findall(match.group(2))}
+    return match.group(1), columns
+
+
+TABLE_NAME, TABLE_SCHEMA = load_table_schema()
+
+# Columns saying where a record came from, filled by batch_ingest when parsing several files.
+# Tables created before they were added need dw_stats_tag_columns.sql.
+SOURCE_FILE_COLUMN = 'source_file'
+NODE_COLUMN = 'node'
+TAG_COLUMNS = [SOURCE_FILE_COLUMN, NODE_COLUMN]
@@ -0,0 +1,69 @@
+import os
+import sys
+import uuid
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# --- Scratch Postgres database ---
+# Database tests run in a throwaway database created on the server in TEST_DATABASE_URL (or
+# DATABASE_URL) and dropped afterwards. They are skipped when neither is set, psycopg2 is
+# missing, or the server can't be reached or won't create databases.
+TEST_DSN = os.environ.get('TEST_DATABASE_URL') or os.environ.get('DATABASE_URL', '')
+
+
+@pytest.fixture(scope='session')
+def scratch_database():
+    """DSN of an empty database that lives for the test session."""
+    psycopg2 = pytest.importorskip('psycopg2')
+    from psycopg2 import extensions as pg_extensions
+    if not TEST_DSN:
+        pytest.skip("TEST_DATABASE_URL / DATABASE_URL not set")
+    try:
+        admin = psycopg2.connect(TEST_DSN)
+    except psycopg2.Error as e:
+        pytest.skip(f"Postgres not reachable: {e}")
+    admin.autocommit = True
+    name = f"mon_test_{uuid.uuid4().hex[:12]}"
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE {name}")
+    except psycopg2.Error as e:
+        admin.close()
+        pytest.skip(f"Can't create a scratch database: {e}")
+    try:
+        yield pg_extensions.make_dsn(TEST_DSN, dbname=name)
+    finally:
+        from pg_loader import close_pools
+        close_pools()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        admin.close()
+
+
+def execute_sql(dsn, *statements):
+    """Runs statements in one transaction."""
+    import psycopg2
+    with psycopg2.connect(dsn) as connection, connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    connection.close()
+
+
+def run_sql_files(dsn, *names):
+    """Runs SQL files shipped with the app (e.g. the DDL and its migrations) in one transaction."""
+    statements = []
+    for name in names:
+        with open(os.path.join(REPO_DIR, name), 'r', encoding='utf-8') as sql_file:
+            statements.append(sql_file.read())
+    execute_sql(dsn, *statements)
+
+
+def fetch_all(dsn, query):
+    import psycopg2
+    with psycopg2.connect(dsn) as connection, connection.cursor() as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    connection.close()
+    return rows
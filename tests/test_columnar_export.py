@@ -0,0 +1,107 @@
+import io
+import json
+import pandas as pd
+import pytest
+from log_parser import EXTRA_FIELDS_COLUMN, iter_record_batches, parse_log_stream
+from mon_generator import MonOutputGenerator
+from table_schema import TABLE_SCHEMA
+
+pa = pytest.importorskip('pyarrow')
+from columnar_export import DICTIONARY_COLUMNS, EXPORT_ARROW, EXPORT_CSV, EXPORT_PARQUET, iter_export # noqa: E402
+import pyarrow.feather as feather # noqa: E402
+import pyarrow.parquet as pq # noqa: E402
+
+DATA = MonOutputGenerator(60, seed=11, malformed_ratio=0.2).generate()
+EXTRA_FIELDS = [{'comment': 'say "hi", twice\n'}, {'total_batches_created': 99999999999999999999}, None]
+
+
+def with_extra_fields(df, first_row=0):
+    """Sets extra_fields by row position (from first_row), so batches get the same values as the whole frame."""
+    df[EXTRA_FIELDS_COLUMN] = [EXTRA_FIELDS[row % len(EXTRA_FIELDS)] for row in range(first_row, first_row + len(df))]
+    return df
+
+
+@pytest.fixture(scope='module')
+def frame():
+    df = with_extra_fields(parse_log_stream(io.BytesIO(DATA)))
+    df['source_file'] = 'node-a/mon.txt'
+    df['node'] = ['node-a' if row % 3 else 'node-b' for row in range(len(df))]
+    assert df['total_batches_created'].isna().any()
+    return df
+
+
+def expected_rows(df):
+    """What every format holds: rows with total_batches_created, table columns in DDL order, then extra_fields."""
+    df = df[df['total_batches_created'].notna()].reset_index(drop=True)
+    return df[[col for col in TABLE_SCHEMA if col in df.columns] + [EXTRA_FIELDS_COLUMN]]
+
+
+def export_bytes(data, export_format, **kwargs):
+    return b''.join(iter_export(data, export_format, row_group_rows=7, **kwargs))
+
+
+def assert_round_trip(read, expected):
+    """read: the exported rows as a DataFrame, dictionary columns as categoricals and extra_fields as JSON text."""
+    assert list(read.columns) == list(expected.columns)
+    for col in DICTIONARY_COLUMNS & set(read.columns):
+        assert isinstance(read[col].dtype, pd.CategoricalDtype)
+        read[col] = read[col].astype(object)
+    read[EXTRA_FIELDS_COLUMN] = [None if text is None else json.loads(text) for text in read[EXTRA_FIELDS_COLUMN]]
+    pd.testing.assert_frame_equal(read, expected, check_dtype=False)
+    for col in expected.columns:
+        if str(expected[col].dtype) == 'Int64':
+            assert str(read[col].dtype) == 'Int64', col
+
+
+# --- Round trips ---
+def test_parquet_round_trip(frame):
+    data = export_bytes(frame, EXPORT_PARQUET)
+    parquet_file = pq.ParquetFile(io.BytesIO(data))
+    assert parquet_file.metadata.num_row_groups == -(-len(expected_rows(frame)) // 7)
+    assert pa.types.is_dictionary(parquet_file.schema_arrow.field('source_table_name').type)
+    assert parquet_file.schema_arrow.field('last_successful_merge_time').type == pa.timestamp('us', tz='UTC')
+    assert_round_trip(pd.read_parquet(io.BytesIO(data)), expected_rows(frame))
+
+
+def test_arrow_round_trip(frame):
+    table = feather.read_table(io.BytesIO(export_bytes(frame, EXPORT_ARROW)))
+    assert pa.types.is_dictionary(table.schema.field('node').type)
+    assert_round_trip(table.to_pandas(), expected_rows(frame))
+
+
+def test_csv_round_trip(frame):
+    read = pd.read_csv(io.BytesIO(export_bytes(frame, EXPORT_CSV)), dtype=str, keep_default_na=False)
+    expected = expected_rows(frame)
+    assert list(read.columns) == list(expected.columns)
+    assert read['source_table_name'].tolist() == expected['source_table_name'].tolist()
+    assert read['node'].tolist() == expected['node'].tolist()
+    assert read['total_batches_created'].astype(int).tolist() == expected['total_batches_created'].tolist()
+    assert [json.loads(text) if text else None for text in read[EXTRA_FIELDS_COLUMN]] == \
+        expected[EXTRA_FIELDS_COLUMN].tolist()
+
+
+def test_unfiltered_export_keeps_every_row(frame):
+    read = pd.read_parquet(io.BytesIO(export_bytes(frame, EXPORT_PARQUET, filter_rows=False)))
+    assert len(read) == len(frame)
+
+
+# --- Streamed batches ---
+@pytest.mark.parametrize('export_format', [EXPORT_PARQUET, EXPORT_ARROW])
+def test_streamed_batches_export_the_same_rows(frame, export_format):
+    batches, rows = [], 0
+    for batch in iter_record_batches(io.BytesIO(DATA), batch_rows=5):
+        batches.append(with_extra_fields(batch.assign(source_file='node-a/mon.txt', node='node-a'), rows))
+        rows += len(batch)
+    data = export_bytes(batches, export_format)
+    if export_format == EXPORT_PARQUET:
+        table = pq.read_table(io.BytesIO(data))
+        assert table.schema.field('source_table_name').type == pa.dictionary(pa.int32(), pa.string())
+    else:
+        table = feather.read_table(io.BytesIO(data))
+        assert table.schema.field('source_table_name').type == pa.string() # One dictionary per IPC file
+    read = table.to_pandas()
+    expected = expected_rows(frame.assign(node='node-a'))
+    assert read['source_table_name'].astype(object).tolist() == expected['source_table_name'].tolist()
+    assert read['total_batches_created'].tolist() == expected['total_batches_created'].tolist()
+    assert [None if text is None else json.loads(text) for text in read[EXTRA_FIELDS_COLUMN]] == \
+        expected[EXTRA_FIELDS_COLUMN].tolist()
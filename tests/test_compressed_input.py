@@ -0,0 +1,114 @@
+import bz2
+import gzip
+import io
+import zipfile
+import pytest
+from compressed_input import (COMPRESSION_BZ2, COMPRESSION_GZIP, COMPRESSION_ZIP, COMPRESSION_ZSTD, ZIP_MEMBERS_FIRST,
+                              DecompressedSizeError, detect_compression, open_log_input)
+from log_parser import parse_log_stream
+from mon_generator import MonOutputGenerator
+
+DATA = MonOutputGenerator(20, seed=3).generate()
+
+
+def zstd_compress(data):
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def zip_archive(*members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def read_all(source, **kwargs):
+    with open_log_input(source, **kwargs) as stream:
+        return stream.read()
+
+
+# --- Magic bytes ---
+@pytest.mark.parametrize('compress, compression', [
+    (gzip.compress, COMPRESSION_GZIP),
+    (bz2.compress, COMPRESSION_BZ2),
+    (zstd_compress, COMPRESSION_ZSTD),
+    (lambda data: zip_archive(('mon.txt', data)), COMPRESSION_ZIP),
+    (lambda data: zip_archive(), COMPRESSION_ZIP),
+    (lambda data: data, None),
+])
+def test_detection_by_magic_bytes(tmp_path, compress, compression):
+    compressed = compress(DATA)
+    assert detect_compression(compressed) == compression
+    path = tmp_path / 'input.bin' # The name doesn't matter
+    path.write_bytes(compressed)
+    assert detect_compression(str(path)) == compression
+    stream = io.BytesIO(compressed)
+    assert detect_compression(stream) == compression
+    assert stream.tell() == 0 # Position kept for the reader
+
+
+def test_short_and_empty_input_is_plain():
+    assert detect_compression(b'') is None
+    assert detect_compression(b'PK') is None
+    assert detect_compression(b'\x1f') is None
+
+
+# --- Decompression as a stream ---
+@pytest.mark.parametrize('compress', [gzip.compress, bz2.compress, zstd_compress,
+                                      lambda data: zip_archive(('mon.txt', data))])
+def test_decompressed_stream_matches_plain_input(tmp_path, compress):
+    path = tmp_path / 'input'
+    path.write_bytes(compress(DATA))
+    assert read_all(str(path)) == DATA
+    assert read_all(io.BytesIO(compress(DATA))) == DATA
+    with open_log_input(str(path)) as stream:
+        parsed = parse_log_stream(stream)
+    assert parsed.equals(parse_log_stream(io.BytesIO(DATA)))
+
+
+def test_plain_input_comes_back_as_is(tmp_path):
+    path = tmp_path / 'input.txt'
+    path.write_bytes(DATA)
+    assert read_all(str(path)) == DATA
+    stream = io.BytesIO(DATA)
+    assert open_log_input(stream) is stream
+
+
+def test_concatenated_gzip_members_and_zstd_frames_are_read_through():
+    assert read_all(io.BytesIO(gzip.compress(DATA[:1000]) + gzip.compress(DATA[1000:]))) == DATA
+    assert read_all(io.BytesIO(zstd_compress(DATA[:1000]) + zstd_compress(DATA[1000:]))) == DATA
+
+
+# --- Zip archives ---
+def test_zip_members_are_read_back_to_back():
+    first, second = MonOutputGenerator(3, seed=1).generate(), MonOutputGenerator(4, seed=2).generate()
+    archive = zip_archive(('a/first.txt', first.rstrip(b'\n')), ('a/', b''), ('b/second.txt', second))
+    assert read_all(io.BytesIO(archive)) == first + second # The missing newline is added, directories skipped
+    assert read_all(io.BytesIO(archive), zip_members=ZIP_MEMBERS_FIRST) == first.rstrip(b'\n')
+    with open_log_input(io.BytesIO(archive)) as stream:
+        assert len(parse_log_stream(stream)) == 7
+
+
+def test_empty_zip_reads_nothing():
+    assert read_all(io.BytesIO(zip_archive())) == b''
+
+
+# --- Size cap ---
+@pytest.mark.parametrize('compress', [gzip.compress, bz2.compress, zstd_compress,
+                                      lambda data: zip_archive(('mon.txt', data))])
+def test_decompressed_size_cap(compress):
+    compressed = compress(DATA)
+    with pytest.raises(DecompressedSizeError):
+        read_all(io.BytesIO(compressed), max_bytes=len(DATA) - 1)
+    assert read_all(io.BytesIO(compressed), max_bytes=len(DATA)) == DATA
+
+
+def test_size_cap_stops_a_bomb_early():
+    bomb = gzip.compress(b'\n' * (64 << 20))
+    with open_log_input(io.BytesIO(bomb), max_bytes=1 << 20) as stream:
+        with pytest.raises(DecompressedSizeError):
+            while stream.read(1 << 16):
+                pass
+        assert stream.raw.compressed_position() < len(bomb)
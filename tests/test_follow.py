@@ -0,0 +1,82 @@
+import io
+import random
+import pandas as pd
+import pytest
+from mon_generator import MonOutputGenerator, box_line
+from log_parser import parse_log_records
+from follow import LogFollower, iter_changed_sql, record_fingerprint, replaced_table_names
+
+# --- Incremental parsing of a capture that grows while it is followed ---
+def poll_fingerprints(follower):
+    """Polls and commits; returns the fingerprints of the tables emitted."""
+    before = dict(follower.checkpoint['fingerprints'])
+    changed = follower.poll()
+    emitted = {name: fingerprint for name, fingerprint in follower._pending['fingerprints'].items()
+               if before.get(name) != fingerprint}
+    assert sorted(changed['source_table_name'] if not changed.empty else []) == sorted(emitted)
+    follower.commit()
+    return emitted
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_only_finished_tables_are_emitted(tmp_path, seed):
+    data = MonOutputGenerator(20, seed=seed, snapshots=3).generate()
+    finished = {record_fingerprint(record) for record in parse_log_records(io.BytesIO(data))}
+    path = tmp_path / 'capture.txt'
+    path.write_bytes(b'')
+    follower = LogFollower(str(path))
+
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(data)), 40)) + [len(data)]
+    written = 0
+    last_emitted = {}
+    for cut in cuts: # Appends end anywhere, also mid-line and mid-table
+        with open(path, 'ab') as capture:
+            capture.write(data[written:cut])
+        written = cut
+        emitted = poll_fingerprints(follower)
+        assert set(emitted.values()) <= finished # Never a table cut short by the end of the file
+        last_emitted.update(emitted)
+
+    # The capture ends with a box-bottom line, so every table's last record went out
+    latest = {record['source_table_name']: record_fingerprint(record) for record in parse_log_records(io.BytesIO(data))}
+    assert last_emitted == latest
+
+
+def test_open_table_waits_for_the_box_bottom(tmp_path):
+    path = tmp_path / 'capture.txt'
+    lines = [box_line('   "DB.S.A": {'), box_line('     "Total Batches Created": 5,'), box_line('   },'),
+             box_line('   "DB.S.B": {'), box_line('     "Total Batches Created": 7,')]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    follower = LogFollower(str(path))
+    assert follower.poll()['source_table_name'].tolist() == ['DB.S.A']
+    follower.commit()
+
+    with open(path, 'a', encoding='utf-8') as capture:
+        capture.write(box_line('     "Avg Batch Size In Bytes": 100,') + '\n' + box_line('   },') + '\n')
+    assert LogFollower(str(path)).poll().empty # Still open: the next header or box bottom may add keys
+
+    with open(path, 'a', encoding='utf-8') as capture:
+        capture.write('╰' + '─' * 40 + '\n')
+    follower = LogFollower(str(path))
+    changed = follower.poll()
+    assert changed['source_table_name'].tolist() == ['DB.S.B']
+    assert changed['avg_batch_size_in_bytes'].tolist() == [100]
+    follower.commit()
+
+    with open(path, 'a', encoding='utf-8') as capture: # The next snapshot's header: B is not emitted again
+        capture.write('2024-05-01T00:01:00Z\n' + box_line('   "DB.S.C": {') + '\n')
+    assert LogFollower(str(path)).poll().empty
+
+
+def test_tables_without_the_filter_column_are_not_deleted():
+    df = pd.DataFrame({'source_table_name': ['DB.S.A', 'DB.S.B'],
+                       'total_batches_created': pd.array([1, None], dtype='Int64')})
+    assert replaced_table_names(df) == ['DB.S.A']
+    script = ''.join(iter_changed_sql(df))
+    assert "WHERE source_table_name IN ('DB.S.A');" in script
+    assert 'DB.S.B' not in script
+
+    script = ''.join(iter_changed_sql(df.iloc[1:]))
+    assert 'DELETE' not in script
+    assert script.startswith('BEGIN;\nCOPY ') and 'COMMIT;' in script
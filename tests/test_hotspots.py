@@ -0,0 +1,136 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from hotspots import (STAGE_COLUMNS, STAGE_TOTAL_COLUMN, SUMMARY_COLUMN, percentile_summary, stage_shares,
+                      summary_frame, summary_json, top_rows)
+
+
+def reference_top_rows(values, n):
+    """Every non-missing row sorted by value (largest first, then input order), cut at n."""
+    rows = sorted((row for row in range(len(values)) if not np.isnan(values[row])), key=lambda row: (-values[row], row))
+    return rows[:max(n, 0)]
+
+
+def load_summary(frame):
+    def no_nan(constant):
+        raise ValueError(f"{constant} in the summary JSON")
+    return json.loads(summary_json(frame), parse_constant=no_nan)
+
+
+# --- top_rows ---
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('n', [0, 1, 5, 20, 500])
+def test_top_rows_matches_a_full_sort(seed, n):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 30, 300).astype('float64') # Plenty of ties, also at the cut-off
+    values[rng.random(300) < 0.2] = np.nan
+    assert top_rows(values, n).tolist() == reference_top_rows(values, n)
+
+
+def test_top_rows_ties_keep_input_order():
+    values = np.array([5, 3, 5, np.nan, 3, 3, 1], dtype='float64')
+    assert top_rows(values, 3).tolist() == [0, 2, 1]
+    assert top_rows(values, 4).tolist() == [0, 2, 1, 4]
+    assert top_rows(values, 10).tolist() == [0, 2, 1, 4, 5, 6]
+
+
+def test_top_rows_of_missing_values():
+    assert top_rows(np.full(4, np.nan), 2).tolist() == []
+    assert top_rows(np.array([], dtype='float64'), 2).tolist() == []
+
+
+# --- Percentiles ---
+def test_percentile_summary():
+    values = np.array([np.nan, *range(1, 101)], dtype='float64')
+    summary = percentile_summary(values)
+    assert summary == {'count': 100, 'mean': 50.5, 'p50': 50.5, 'p95': 95.05, 'p99': 99.01, 'max': 100}
+
+
+def test_percentile_summary_of_missing_values():
+    assert percentile_summary(np.full(3, np.nan)) == {'count': 0, 'mean': None, 'p50': None, 'p95': None,
+                                                      'p99': None, 'max': None}
+
+
+# --- Stage shares ---
+def stage_frame(total, compaction, upload, merge, ddl):
+    columns = dict(zip(STAGE_COLUMNS.values(), (compaction, upload, merge, ddl)))
+    return pd.DataFrame({column: pd.array(values, dtype='Int64')
+                         for column, values in {STAGE_TOTAL_COLUMN: total, **columns}.items()})
+
+
+def test_stage_shares():
+    df = stage_frame(total=[100, 300, 0, None], compaction=[10, 30, 5, 5], upload=[50, 0, 5, 5],
+                     merge=[20, None, 5, 5], ddl=[0, 0, 0, 0])
+    shares = stage_shares(df) # Tables without a positive total don't count
+    assert shares['tables'] == 2
+    by_stage = {stage['stage']: stage for stage in shares['stages']}
+    assert by_stage['compaction'] == {'stage': 'compaction', 'column': STAGE_COLUMNS['compaction'],
+                                      'share': 0.1, 'p50': 0.1, 'p95': 0.1}
+    assert by_stage['upload']['share'] == 0.125 and by_stage['upload']['p50'] == 0.25
+    assert by_stage['merge']['share'] == 0.05 # A missing stage time counts as 0
+    assert by_stage['ddl']['share'] == 0
+    assert shares['other'] == pytest.approx(0.725)
+
+
+def test_overlapping_stages_leave_no_other():
+    shares = stage_shares(stage_frame(total=[100], compaction=[80], upload=[80], merge=[0], ddl=[0]))
+    assert shares['other'] == 0
+
+
+def test_stage_shares_of_missing_columns():
+    assert stage_shares(pd.DataFrame({'source_table_name': ['DB.A']})) == {'tables': 0, 'stages': [], 'other': None}
+    shares = stage_shares(stage_frame(total=[None, None], compaction=[None, None], upload=[None, None],
+                                      merge=[None, None], ddl=[None, None]))
+    assert shares['tables'] == 0 and shares['other'] is None
+    assert all(stage['share'] is None and stage['p50'] is None for stage in shares['stages'])
+
+
+# --- The cached summary ---
+@pytest.fixture
+def tables():
+    return pd.DataFrame({
+        'source_table_name': ['DB.A', 'DB.B', 'DB.C', 'DB.D', 'DB.E'],
+        'mapped_source_table': ['SRC.X', 'SRC.Y', 'SRC.X', None, 'SRC.Y'],
+        'avg_waiting_time_in_queue_in_ms': pd.array([10, 40, 40, None, 5], dtype='Int64'),
+        'max_integration_time_in_ms': pd.array([None] * 5, dtype='Int64'),
+        'last_successful_merge_time': pd.to_datetime(['2024-05-01 00:00:00', '2024-05-01 00:01:00', None,
+                                                      '2024-05-01 00:00:30', '2024-05-01 00:01:00']),
+    })
+
+
+def test_summary_frame_top_tables_and_percentiles(tables):
+    frame = summary_frame(tables, n=2)
+    assert list(frame.columns) == [SUMMARY_COLUMN] and len(frame) == 1
+    summary = load_summary(frame)
+    assert (summary['tables'], summary['top_n'], summary['reference_time']) == (5, 2, '2024-05-01T00:01:00Z')
+    waiting = summary['metrics']['avg_waiting_time_in_queue_in_ms']
+    assert waiting['top'] == [{'source_table_name': 'DB.B', 'mapped_source_table': 'SRC.Y', 'value': 40},
+                              {'source_table_name': 'DB.C', 'mapped_source_table': 'SRC.X', 'value': 40}]
+    assert (waiting['unit'], waiting['count'], waiting['mean'], waiting['max']) == ('ms', 4, 23.75, 40)
+    staleness = summary['metrics']['merge_staleness_seconds']
+    assert [row['source_table_name'] for row in staleness['top']] == ['DB.A', 'DB.D']
+    assert (staleness['unit'], staleness['count'], staleness['max']) == ('s', 4, 60)
+
+
+def test_summary_frame_with_an_all_missing_column(tables):
+    summary = load_summary(summary_frame(tables))
+    integration = summary['metrics']['max_integration_time_in_ms']
+    assert integration == {'unit': 'ms', 'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None,
+                           'max': None, 'top': []}
+    assert 'last_batch_merge_time_in_ms' not in summary['metrics'] # Missing columns are left out
+
+
+def test_summary_frame_mapped_breakdown(tables):
+    breakdown = load_summary(summary_frame(tables))['by_mapped_source_table']
+    assert breakdown['groups'] == 2 # Tables without a mapped source table aren't a group
+    # Both groups' worst table waits 40ms: the tie keeps the order the groups first appear in
+    assert [(row['mapped_source_table'], row['tables'], row['avg_waiting_time_in_queue_in_ms_max'],
+             row['avg_waiting_time_in_queue_in_ms_mean'], row['max_integration_time_in_ms_max'])
+            for row in breakdown['rows']] == [('SRC.X', 2, 40, 25, None), ('SRC.Y', 2, 40, 22.5, None)]
+
+
+def test_summary_frame_of_a_frame_without_metrics():
+    summary = load_summary(summary_frame(pd.DataFrame({'source_table_name': ['DB.A']})))
+    assert summary['metrics'] == {} and summary['reference_time'] is None
+    assert summary['by_mapped_source_table'] == {'groups': 0, 'rows': []}
@@ -0,0 +1,241 @@
+import io
+import random
+import pandas as pd
+import pytest
+from mon_generator import MonOutputGenerator, box_line
+import log_parser
+from log_parser import (KV_START, ColumnarLogParser, TypedColumnBuilder, build_dataframe, find_split_points,
+                        iter_record_batches, parse_log_file, parse_log_records, parse_log_stream,
+                        parse_log_stream_reference)
+
+# --- Differential checks: the state-machine parser against the original per-line logic ---
+ODD_LINES = [
+    b'\n',
+    b'   \t \r\n',
+    box_line('').encode('utf-8') + b'\n',
+    b'\xff\xfe not utf-8 \xe9\n',
+    (KV_START + '     "Comment": "caf').encode('utf-8') + b'\xe9",\n',
+    box_line('     "Value With: Colon": "a: b",').encode('utf-8') + b'\n',
+    box_line('     "Negative Value": -5,').encode('utf-8') + b'\n',
+    box_line('     "Float Value": 1.5,').encode('utf-8') + b'\n',
+    box_line('     "Null Value": null,').encode('utf-8') + b'\n',
+    box_line('     "Total Batches Created": 7,').encode('utf-8') + b'\n', # A duplicate key
+    box_line('   "DB.INJECTED.TABLE": {').encode('utf-8') + b'\n',     # A header in the middle of a table
+    box_line('     "Last batch info": {').encode('utf-8') + b'\n',     # A block that is never closed
+    box_line('       "Integration Task Time": {').encode('utf-8') + b'\n',
+    box_line('     },').encode('utf-8') + b'\n',
+    box_line('   }').encode('utf-8') + b'\n',
+    box_line('     unquoted key: 12,').encode('utf-8') + b'\n',
+    (KV_START + '     "Truncated Line": 4').encode('utf-8') + b'\n',
+    b'stray text from another command\n',
+    ('x' * 5000).encode('ascii') + b'\n',
+]
+
+
+def generated(seed, tables=300, **ratios):
+    return MonOutputGenerator(tables, seed=seed, **ratios).generate()
+
+
+def inject_odd_lines(data, seed, ratio=0.05):
+    rng = random.Random(seed)
+    lines = data.splitlines(keepends=True)
+    out = []
+    for line in lines:
+        out.append(line)
+        if rng.random() < ratio:
+            out.append(rng.choice(ODD_LINES))
+    return b''.join(out)
+
+
+def assert_same_records(data):
+    expected = parse_log_stream_reference(io.BytesIO(data))
+    assert parse_log_records(io.BytesIO(data)) == expected
+    return expected
+
+
+class SmallReads(io.BytesIO):
+    """A stream handing out a few bytes per read(), so blocks end mid-line and mid-character."""
+
+    def read(self, size=-1):
+        return super().read(7 if size < 0 else min(size, 7))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_generated_output_matches_reference(seed):
+    records = assert_same_records(generated(seed))
+    assert len(records) >= 300
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_odd_and_malformed_output_matches_reference(seed):
+    data = generated(seed, odd_encoding_ratio=0.3, malformed_ratio=0.3)
+    assert_same_records(inject_odd_lines(data, seed))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_truncated_output_matches_reference(seed):
+    data = inject_odd_lines(generated(seed, tables=50, odd_encoding_ratio=0.3), seed)
+    cut = random.Random(seed).randrange(1, len(data))
+    assert_same_records(data[:cut]) # Ends mid-line, possibly mid-character, without a newline
+
+
+def test_snapshots_and_crlf_match_reference():
+    data = MonOutputGenerator(100, seed=5, snapshots=3).generate().replace(b'\n', b'\r\n')
+    assert_same_records(data)
+
+
+def test_block_boundaries_do_not_change_records():
+    data = inject_odd_lines(generated(7, tables=40, odd_encoding_ratio=0.3, malformed_ratio=0.3), 7)
+    assert parse_log_records(SmallReads(data)) == parse_log_stream_reference(io.BytesIO(data))
+
+
+def test_typed_frame_matches_reference_records():
+    data = inject_odd_lines(generated(8, odd_encoding_ratio=0.3, malformed_ratio=0.3), 8)
+    expected = build_dataframe(parse_log_stream_reference(io.BytesIO(data)))
+    pd.testing.assert_frame_equal(parse_log_stream(io.BytesIO(data)), expected)
+
+
+def test_empty_and_headerless_input():
+    for data in (b'', b'\n\n', b'no tables here\n', box_line('     "Orphan Key": 1,').encode('utf-8') + b'\n'):
+        assert_same_records(data)
+
+
+# --- The columnar parser (parse_log_stream) against the reference records ---
+# Small blocks put whole tables, and table boundaries, in many blocks of the test data
+EDGE_TABLE = [
+    '   "DB.EDGE.TABLE": {',
+    '     "Batch Queue Id": 123456789012345,',            # 15 digits: converted in bulk
+    '     "Wait Milliseconds": 1234567890123456,',        # 16 digits: exact path
+    '     "Total Batches Created": 99999999999999999999,', # Over int64: an extra field
+    '     "Partition Pruned Batches": 12,',
+    '     "Partition Pruned Batches": 13,',                # Duplicate plain line: the last wins
+    '     "Total Batches Ignored": 5,',
+    '     "Total Batches Ignored": "6",',                  # A text value after a plain one
+    '     "Last Successful Merge Time": "2024-02-29T23:59:59.999Z",',
+    '     "Last Successful Merge Time": "2023-02-29T00:00:00.000Z",', # No such day: text
+    '     "Mapped Source Table": "SRC.EDGE",',
+    '     "Key: With Colon": 1,',
+    '     "": 2,',
+    '     "Trailing Text": 3 x,',
+    '     "No Comma": 4',
+    '     "Integration Task Time": 7,',                    # A marker key with a value
+    '     "Last batch info": {',
+    '       "Event Count": 8,',
+    '       "Last batch info": "text",',
+    '       "Integration Task Time": {',
+    '         "Max Integration Time in ms": 2024-05-01T00:00:00Z,',
+    '         "Min Integration Time in ms": "2024-05-01T24:00:00.000Z",',
+    '       }',
+    '       "No Of Updates": 9,',
+    '     },',
+    '     }',
+    '     }',
+    '     "Event Count": 10,',
+    '   },',
+]
+
+
+def edge_table_lines():
+    lines = [(box_line(body) + '\n').encode('utf-8') for body in EDGE_TABLE]
+    lines.insert(5, box_line('     "Total Batches Ignored": 11,').encode('utf-8') + b'\r\n')
+    lines.insert(9, box_line('     "Comment": "caf').encode('utf-8') + b'\xe9",\n')
+    lines.append(box_line('   "DB.T\xc4BLE": {').encode('utf-8').replace(b'\xc3\x84', b'\xc4') + b'\n') # Not UTF-8
+    lines.append(box_line('     "Event Count": 1,').encode('utf-8') + b'\n')
+    return lines
+
+
+def with_edge_tables(data, seed, ratio=0.1):
+    rng = random.Random(seed)
+    out = []
+    for line in data.splitlines(keepends=True):
+        if line.startswith(KV_START.encode('utf-8') + b'   "') and rng.random() < ratio:
+            out.extend(edge_table_lines())
+        out.append(line)
+    return b''.join(out)
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(ColumnarLogParser, 'block_size', 32768)
+
+
+def assert_same_frame(data):
+    expected = build_dataframe(parse_log_stream_reference(io.BytesIO(data)))
+    pd.testing.assert_frame_equal(parse_log_stream(io.BytesIO(data)), expected)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_columnar_frame_matches_reference(small_blocks, seed):
+    data = inject_odd_lines(generated(seed, odd_encoding_ratio=0.3, malformed_ratio=0.3), seed, ratio=0.02)
+    assert_same_frame(with_edge_tables(data, seed))
+
+
+def test_columnar_frame_matches_reference_in_large_blocks():
+    assert_same_frame(with_edge_tables(generated(9, tables=2000, odd_encoding_ratio=0.1, malformed_ratio=0.1), 9))
+
+
+class UnevenReads(io.BytesIO):
+    """A stream handing out at most 4093 bytes per read(), so most reads end mid-line."""
+
+    def read(self, size=-1):
+        return super().read(4093 if size < 0 else min(size, 4093))
+
+
+def test_uneven_reads_match_reference(small_blocks):
+    data = with_edge_tables(generated(4, tables=100, odd_encoding_ratio=0.3, malformed_ratio=0.3), 4)
+    expected = build_dataframe(parse_log_stream_reference(io.BytesIO(data)))
+    pd.testing.assert_frame_equal(parse_log_stream(UnevenReads(data)), expected)
+
+
+def test_edge_table_values(small_blocks):
+    data = generated(1, tables=3) + b''.join(edge_table_lines()) + generated(2, tables=3)
+    assert_same_frame(data)
+    edge = parse_log_stream(io.BytesIO(data)).set_index('source_table_name').loc['DB.EDGE.TABLE']
+    assert edge['batch_queue_id'] == 123456789012345
+    assert edge['wait_milliseconds'] == 1234567890123456
+    assert edge['partition_pruned_batches'] == 13
+    assert edge['total_batches_ignored'] == 6
+    assert pd.isna(edge['last_successful_merge_time'])
+    assert edge['extra_fields']['total_batches_created'] == 99999999999999999999
+
+
+def test_streamed_batches_match_reference(small_blocks):
+    data = with_edge_tables(inject_odd_lines(generated(3, odd_encoding_ratio=0.3, malformed_ratio=0.3), 3), 3)
+    builder = TypedColumnBuilder()
+    for record in parse_log_stream_reference(io.BytesIO(data)):
+        builder.append_record(record)
+    batches = list(iter_record_batches(io.BytesIO(data), batch_rows=7))
+    assert len(batches) > 10
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), builder.to_dataframe(all_columns=True))
+
+
+# --- Parallel parsing of a file on disk ---
+def test_parallel_parse_matches_serial_parse(tmp_path):
+    data = with_edge_tables(MonOutputGenerator(200, seed=6, snapshots=3, odd_encoding_ratio=0.2,
+                                               malformed_ratio=0.2).generate(), 6)
+    path = tmp_path / 'mon.txt'
+    path.write_bytes(data)
+    parts = 4 * log_parser.PARALLEL_CHUNKS_PER_WORKER
+    points = find_split_points(data, parts)
+    assert len(points) == parts + 1
+    for part, point in enumerate(points[1:-1], 1):
+        assert point > len(data) * part // parts # The even cut fell mid-table and moved to the next header
+        assert data[point:].startswith(KV_START.encode('utf-8') + b'   "')
+    progress = []
+    parallel = parse_log_file(str(path), workers=4, progress=lambda *totals: progress.append(totals))
+    serial = parse_log_stream(io.BytesIO(data))
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert progress[-1][0] == len(data) and progress[-1][2] == len(serial)
+
+
+def test_splits_inside_one_long_table_collapse(tmp_path):
+    body = [(box_line(line) + '\n').encode('utf-8') for line in EDGE_TABLE[1:-1]]
+    long_table = (box_line(EDGE_TABLE[0]) + '\n').encode('utf-8') + b''.join(body * 500)
+    data = generated(1, tables=2) + long_table + generated(2, tables=2)
+    start = data.index(long_table)
+    points = find_split_points(data, 16)
+    assert len(points) < 10 # Cuts landing in the long table all move to the header after it
+    assert not any(start < point < start + len(long_table) for point in points)
+    path = tmp_path / 'mon.txt'
+    path.write_bytes(data)
+    pd.testing.assert_frame_equal(parse_log_file(str(path), workers=4), parse_log_stream(io.BytesIO(data)))
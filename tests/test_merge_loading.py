@@ -0,0 +1,108 @@
+import pandas as pd
+import pytest
+from conftest import execute_sql, fetch_all, run_sql_files
+from pg_loader import load_dataframe
+from sql_output import merge_upsert_sql, merge_delete_sql
+from table_schema import TABLE_NAME
+
+
+def snapshot(node, batches, tables=('DB.S.A', 'DB.S.B', 'DB.S.C')):
+    """One node's parsed records: a table per row, total_batches_created from batches."""
+    frame = pd.DataFrame({
+        'source_table_name': list(tables),
+        'total_batches_created': pd.array(batches, dtype='Int64'),
+    })
+    if node is not None:
+        frame['source_file'] = f"{node}/mon.txt"
+        frame['node'] = node
+    return frame
+
+
+def rows(dsn):
+    return fetch_all(dsn, f"SELECT source_table_name, node, total_batches_created FROM {TABLE_NAME} "
+                          "ORDER BY source_table_name, node NULLS FIRST")
+
+
+@pytest.fixture
+def warehouse(scratch_database):
+    """A fresh process_queue_wait_times with the merge key."""
+    run_sql_files(scratch_database, 'dw_stats_table.sql', 'dw_stats_merge_key.sql')
+    yield scratch_database
+    execute_sql(scratch_database, f"DROP TABLE {TABLE_NAME}")
+
+
+def test_merge_sql_keys_on_table_and_node():
+    sql = merge_upsert_sql(['source_table_name', 'node', 'total_batches_created'])
+    assert "ON CONFLICT (source_table_name, (COALESCE(node, '')))" in sql
+    assert "node = EXCLUDED.node" not in sql
+    assert "COALESCE(stage.node, '') = COALESCE(target.node, '')" in merge_delete_sql()
+
+
+def test_merge_keeps_one_row_per_node(warehouse):
+    df = pd.concat([snapshot('n1', [1, 2, 3]), snapshot('n2', [10, 20, 30])], ignore_index=True)
+    result = load_dataframe(df, dsn=warehouse, merge=True)
+    assert (result['inserted'], result['updated'], result['unchanged']) == (6, 0, 0)
+    assert rows(warehouse) == [('DB.S.A', 'n1', 1), ('DB.S.A', 'n2', 10), ('DB.S.B', 'n1', 2),
+                               ('DB.S.B', 'n2', 20), ('DB.S.C', 'n1', 3), ('DB.S.C', 'n2', 30)]
+
+    result = load_dataframe(df, dsn=warehouse, merge=True)
+    assert (result['inserted'], result['updated'], result['unchanged']) == (0, 0, 6)
+
+    changed = pd.concat([snapshot('n1', [1, 2, 4]), snapshot('n2', [10, 20, 30])], ignore_index=True)
+    result = load_dataframe(changed, dsn=warehouse, merge=True)
+    assert (result['inserted'], result['updated'], result['unchanged']) == (0, 1, 5)
+    assert ('DB.S.C', 'n1', 4) in rows(warehouse)
+
+
+def test_merge_last_record_of_a_node_wins(warehouse):
+    df = pd.concat([snapshot('n1', [1, 2, 3]), snapshot('n1', [5, 6, 7])], ignore_index=True)
+    result = load_dataframe(df, dsn=warehouse, merge=True)
+    assert result['inserted'] == 3
+    assert [row[2] for row in rows(warehouse)] == [5, 6, 7]
+
+
+def test_merge_delete_missing_only_removes_missing_rows(warehouse):
+    df = pd.concat([snapshot('n1', [1, 2, 3]), snapshot('n2', [10, 20, 30])], ignore_index=True)
+    load_dataframe(df, dsn=warehouse, merge=True)
+    smaller = pd.concat([snapshot('n1', [1, 2, 3]), snapshot('n2', [10, 20], tables=('DB.S.A', 'DB.S.B'))],
+                        ignore_index=True)
+    result = load_dataframe(smaller, dsn=warehouse, merge=True, delete_missing=True)
+    assert result['deleted'] == 1
+    assert ('DB.S.C', 'n2', 30) not in rows(warehouse)
+    assert ('DB.S.C', 'n1', 3) in rows(warehouse)
+
+
+def test_merge_untagged_rows_share_one_key(warehouse):
+    load_dataframe(snapshot(None, [1, 2, 3]), dsn=warehouse, merge=True)
+    result = load_dataframe(snapshot(None, [1, 2, 9]), dsn=warehouse, merge=True)
+    assert (result['inserted'], result['updated'], result['unchanged']) == (0, 1, 2)
+    assert rows(warehouse) == [('DB.S.A', None, 1), ('DB.S.B', None, 2), ('DB.S.C', None, 9)]
+
+
+def test_truncate_load_of_several_nodes_works_with_the_key(warehouse):
+    df = pd.concat([snapshot('n1', [1, 2, 3]), snapshot('n2', [10, 20, 30])], ignore_index=True)
+    result = load_dataframe(df, dsn=warehouse)
+    assert result['rows'] == 6
+    assert len(rows(warehouse)) == 6
+
+
+def test_merge_without_the_key_points_to_the_migration(scratch_database):
+    run_sql_files(scratch_database, 'dw_stats_table.sql')
+    try:
+        with pytest.raises(ValueError, match='dw_stats_merge_key.sql'):
+            load_dataframe(snapshot('n1', [1, 2, 3]), dsn=scratch_database, merge=True)
+    finally:
+        execute_sql(scratch_database, f"DROP TABLE {TABLE_NAME}")
+
+
+def test_tag_column_migration_upgrades_an_old_table(scratch_database):
+    # The table as created before the source_file/node columns were added
+    run_sql_files(scratch_database, 'dw_stats_table.sql')
+    execute_sql(scratch_database, f"ALTER TABLE {TABLE_NAME} DROP COLUMN source_file, DROP COLUMN node")
+    try:
+        run_sql_files(scratch_database, 'dw_stats_tag_columns.sql', 'dw_stats_tag_columns.sql') # Safe to re-run
+        result = load_dataframe(snapshot('n1', [1, 2, 3]), dsn=scratch_database)
+        assert result['rows'] == 3
+        assert [row[1] for row in rows(scratch_database)] == ['n1', 'n1', 'n1']
+    finally:
+        execute_sql(scratch_database, f"DROP TABLE {TABLE_NAME}")
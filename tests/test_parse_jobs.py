@@ -0,0 +1,89 @@
+import os
+import tempfile
+import time
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+
+pytest.importorskip('flask')
+os.environ.setdefault('RESULT_CACHE_DIR', tempfile.mkdtemp(prefix='mon_test_cache_'))
+import app as web_app
+from mon_generator import MonOutputGenerator
+
+
+def die(*args):
+    os._exit(1) # Like a worker killed by the OOM killer: the pool breaks
+
+
+@pytest.fixture
+def spooled():
+    def spool(data=b''):
+        with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as spool_file:
+            spool_file.write(data)
+        job_id = web_app.jobs.create('test input', len(data), f"test-{os.path.basename(spool_file.name)}")
+        return job_id, spool_file.name
+    return spool
+
+
+def broken_executor():
+    executor = ProcessPoolExecutor(max_workers=1)
+    with pytest.raises(Exception):
+        executor.submit(die).result()
+    return executor
+
+
+def run_job(job_id, spool_path):
+    future = web_app.submit_parse_job(job_id, spool_path, 1)
+    try:
+        future.result(timeout=60)
+    except Exception:
+        pass
+    for _ in range(100): # Done callbacks run just after the result is set
+        job = web_app.jobs.get(job_id)
+        if job['status'] in web_app.JOB_FINISHED_STATES:
+            return job
+        time.sleep(0.05)
+    return job
+
+
+def test_dead_worker_fails_the_job_and_replaces_the_pool(monkeypatch, spooled):
+    monkeypatch.setattr(web_app, 'run_parse_job', die)
+    job_id, spool_path = spooled(b'anything')
+    executor = web_app.get_job_executor()
+    job = run_job(job_id, spool_path)
+    assert job['status'] == web_app.JOB_FAILED
+    assert 'died' in job['error']
+    assert not os.path.exists(spool_path)
+    assert web_app.get_job_executor() is not executor
+
+    monkeypatch.undo() # The next job runs on the new pool
+    job_id, spool_path = spooled(MonOutputGenerator(5, seed=1).generate())
+    assert run_job(job_id, spool_path)['status'] == web_app.JOB_DONE
+
+
+def test_submit_to_a_broken_pool_starts_a_new_one(monkeypatch, spooled):
+    monkeypatch.setattr(web_app, '_job_executor', broken_executor())
+    job_id, spool_path = spooled(MonOutputGenerator(5, seed=2).generate())
+    assert run_job(job_id, spool_path)['status'] == web_app.JOB_DONE
+
+
+def parsed_tables_metric(client):
+    from prometheus_client.parser import text_string_to_metric_families
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    for family in text_string_to_metric_families(response.get_data(as_text=True)):
+        for sample in family.samples:
+            if sample.name == 'mon_parsed_tables_total':
+                return sample.value
+    return 0
+
+
+def test_metrics_pool_samples_from_job_processes(spooled):
+    pytest.importorskip('prometheus_client')
+    import instrumentation
+    client = web_app.app.test_client()
+    before = parsed_tables_metric(client)
+    assert instrumentation.METRICS_DIR == os.environ['PROMETHEUS_MULTIPROC_DIR'] # Set up before the first metric
+    job_id, spool_path = spooled(MonOutputGenerator(7, seed=2).generate())
+    assert run_job(job_id, spool_path)['status'] == web_app.JOB_DONE
+    # Only the job process parsed the tables: its samples reach /metrics through the shared directory
+    assert parsed_tables_metric(client) - before == 7
@@ -0,0 +1,178 @@
+import pandas as pd
+import pytest
+import pg_loader
+from sql_output import iter_copy_rows, table_columns
+from table_schema import TABLE_NAME
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+# --- Fake pool/connection/cursor: what load_dataframe() sends, without a server ---
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.log.append(('execute', sql))
+
+    def copy_expert(self, sql, stream, size=8192):
+        chunks = []
+        while True:
+            data = stream.read(size)
+            if not data:
+                break
+            chunks.append(data)
+        self.connection.log.append(('copy', sql, ''.join(chunks)))
+        if self.connection.fail_copy is not None:
+            error, self.connection.closed = self.connection.fail_copy
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail_copy=None):
+        self.log = []
+        self.closed = 0
+        self.fail_copy = fail_copy # (exception, closed state afterwards)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback): # Like psycopg2: commit on success, else roll back
+        self.log.append(('commit',) if exc_type is None else ('rollback',))
+
+
+class FakePool:
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self.handed_out = []
+        self.returned = []
+
+    def getconn(self):
+        connection = self.connections.pop(0)
+        self.handed_out.append(connection)
+        return connection
+
+    def putconn(self, connection, close=False):
+        self.returned.append((connection, close))
+
+
+class LostConnection(psycopg2.OperationalError):
+    pass # No SQLSTATE, like libpq's "server closed the connection unexpectedly"
+
+
+class SerializationFailure(psycopg2.OperationalError):
+    pgcode = '40001'
+
+
+class BadPassword(psycopg2.OperationalError):
+    pgcode = '28P01'
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'source_table_name': ['DB.S.A', 'DB.S.B', 'DB.S.C'],
+        'total_batches_created': pd.array([1, None, 3], dtype='Int64'),
+        'wait_milliseconds': pd.array([10, 20, None], dtype='Int64'),
+    })
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pg_loader.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def use_pool(monkeypatch, *connections):
+    pool = FakePool(connections)
+    monkeypatch.setattr(pg_loader, 'get_pool', lambda dsn: pool)
+    return pool
+
+
+def test_copy_payload_and_truncate_in_one_transaction(monkeypatch, frame):
+    pool = use_pool(monkeypatch, FakeConnection())
+    result = pg_loader.load_dataframe(frame, dsn='fake')
+
+    log = pool.handed_out[0].log
+    assert [entry[0] for entry in log] == ['execute', 'copy', 'commit'] # One transaction, committed once
+    assert log[0][1] == f"TRUNCATE TABLE {TABLE_NAME}"
+    columns = table_columns(frame)
+    assert log[1][1].startswith(f"COPY {TABLE_NAME} ({', '.join(columns)}) FROM STDIN")
+    # The row without total_batches_created is skipped; missing values are \N
+    assert log[1][2] == '10\tDB.S.A\t1\n\\N\tDB.S.C\t3\n'
+    assert log[1][2] == ''.join(data for data, _, _ in iter_copy_rows(frame, columns))
+    assert (result['rows'], result['rows_skipped'], result['attempts']) == (2, 1, 1)
+    assert pool.returned == [(pool.handed_out[0], False)]
+
+
+@pytest.mark.parametrize('error', [LostConnection('server closed the connection unexpectedly'),
+                                   SerializationFailure('could not serialize access')])
+def test_transient_error_rolls_back_and_retries(monkeypatch, frame, no_backoff, error):
+    closed = 2 if isinstance(error, LostConnection) else 0
+    first, second = FakeConnection(fail_copy=(error, closed)), FakeConnection()
+    pool = use_pool(monkeypatch, first, second)
+    result = pg_loader.load_dataframe(frame, dsn='fake')
+
+    assert result['attempts'] == 2
+    assert first.log[-1] == ('rollback',)
+    assert second.log[-1] == ('commit',)
+    assert no_backoff == [pg_loader.RETRY_BACKOFF_SECONDS]
+    # The failed connection is discarded, the good one goes back to the pool
+    assert pool.returned == [(first, True), (second, False)]
+
+
+def test_non_transient_error_is_not_retried(monkeypatch, frame, no_backoff):
+    connection = FakeConnection(fail_copy=(BadPassword('password authentication failed'), 0))
+    pool = use_pool(monkeypatch, connection, FakeConnection())
+    with pytest.raises(BadPassword):
+        pg_loader.load_dataframe(frame, dsn='fake')
+    assert len(pool.handed_out) == 1
+    assert connection.log[-1] == ('rollback',)
+    assert no_backoff == []
+    assert pool.returned == [(connection, False)]
+
+
+def test_connection_returned_after_last_failed_attempt(monkeypatch, frame, no_backoff):
+    connections = [FakeConnection(fail_copy=(LostConnection('connection lost'), 2)) for _ in range(pg_loader.LOAD_RETRIES)]
+    pool = use_pool(monkeypatch, *connections)
+    with pytest.raises(LostConnection):
+        pg_loader.load_dataframe(frame, dsn='fake')
+    assert pool.returned == [(connection, True) for connection in connections]
+    assert len(no_backoff) == pg_loader.LOAD_RETRIES - 1
+
+
+def test_connection_returned_after_other_exceptions(monkeypatch, frame):
+    connection = FakeConnection(fail_copy=(RuntimeError('bug'), 0))
+    pool = use_pool(monkeypatch, connection)
+    with pytest.raises(RuntimeError):
+        pg_loader.load_dataframe(frame, dsn='fake')
+    assert pool.returned == [(connection, False)]
+
+
+def test_batches_are_loaded_once_without_retry(monkeypatch, frame, no_backoff):
+    connection = FakeConnection(fail_copy=(LostConnection('connection lost'), 2))
+    pool = use_pool(monkeypatch, connection, FakeConnection())
+    with pytest.raises(LostConnection):
+        pg_loader.load_dataframe(iter([frame.iloc[:2], frame.iloc[2:]]), dsn='fake')
+    assert len(pool.handed_out) == 1
+    assert connection.log[1][2] == '10\tDB.S.A\t1\n\\N\tDB.S.C\t3\n'
+
+
+def test_is_transient():
+    assert pg_loader.is_transient(SerializationFailure('x'))
+    assert not pg_loader.is_transient(BadPassword('x'))
+    assert not pg_loader.is_transient(LostConnection('x')) # No connection known to be lost
+    lost = FakeConnection()
+    lost.closed = 2
+    assert pg_loader.is_transient(LostConnection('x'), lost)
+    assert not pg_loader.is_transient(ValueError('x'), lost)
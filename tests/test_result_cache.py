@@ -0,0 +1,106 @@
+import datetime
+import os
+import stat
+import pandas as pd
+import pyarrow as pa
+import pytest
+import result_cache
+from result_cache import JSON_COLUMNS_KEY, DiskFrameCache, read_table
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'source_table_name': ['DB.S.A', 'DB.S.B', 'DB.S.C'],
+        'total_batches_created': pd.array([1, None, 3], dtype='Int64'),
+        'extra_fields': [{'odd_key': 'x', 'when': datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)},
+                         None, {'count': 7, 'nested': {'a': [1, 2]}}],
+    })
+
+
+def assert_extra_fields_equal(df, frame):
+    assert df['extra_fields'].tolist() == frame['extra_fields'].tolist()
+    assert isinstance(df['extra_fields'][0]['when'], datetime.datetime)
+
+
+def test_object_columns_are_stored_as_json_text(tmp_path, frame):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+    cache.set('result', frame)
+    table = read_table(os.path.join(cache.directory, 'result.arrow'))
+    assert table.schema.field('extra_fields').type == pa.string()
+    assert table.schema.metadata[JSON_COLUMNS_KEY] == b'["extra_fields"]'
+
+    df = DiskFrameCache(cache.directory, max_bytes=1 << 30).get('result') # A fresh worker: nothing in memory
+    pd.testing.assert_frame_equal(df.drop(columns='extra_fields'), frame.drop(columns='extra_fields'))
+    assert_extra_fields_equal(df, frame)
+
+
+def test_batches_store_json_columns(tmp_path, frame):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+    assert cache.set_batches('result', [frame.iloc[:1], frame.iloc[1:]], json_columns=['extra_fields']) == 3
+    assert_extra_fields_equal(cache.get('result'), frame)
+    assert cache.get('result', columns=['extra_fields'])['extra_fields'].tolist() == frame['extra_fields'].tolist()
+
+
+def test_values_json_can_not_hold_are_refused(tmp_path):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+    with pytest.raises(TypeError):
+        cache.set('result', pd.DataFrame({'extra_fields': [{'key': object()}]}))
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="needs POSIX owners and modes")
+def test_cache_directory_is_private(tmp_path):
+    directory = tmp_path / 'new'
+    DiskFrameCache(str(directory), max_bytes=1 << 30)
+    assert stat.S_IMODE(directory.stat().st_mode) == 0o700
+
+    shared = tmp_path / 'shared'
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    DiskFrameCache(str(shared), max_bytes=1 << 30)
+    assert stat.S_IMODE(shared.stat().st_mode) == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="needs POSIX owners and modes")
+def test_cache_directory_of_another_user_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache.os, 'getuid', lambda: os.stat(tmp_path).st_uid + 1)
+    with pytest.raises(RuntimeError, match='owned by uid'):
+        DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+
+
+def test_hits_are_counted_without_writing_stats(tmp_path, frame):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+    cache.set('result', frame)
+    stats_path = tmp_path / 'cache' / result_cache.STATS_FILE
+    written = stats_path.stat().st_mtime_ns if stats_path.exists() else None
+    for _ in range(5):
+        cache.get('result')
+    cache.get('missing')
+    assert (stats_path.stat().st_mtime_ns if stats_path.exists() else None) == written
+
+    other = DiskFrameCache(cache.directory, max_bytes=1 << 30) # Another worker process
+    assert other.stats()['hits'] == 0
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (5, 1)
+    assert other.stats()['hits'] == 5
+
+
+def test_counts_are_flushed_after_a_while_and_on_set(tmp_path, frame, monkeypatch):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1 << 30)
+    other = DiskFrameCache(cache.directory, max_bytes=1 << 30)
+    cache.count('content_hits')
+    cache.set('result', frame) # Takes the lock to evict: the counts go along
+    assert other.stats()['content_hits'] == 1
+
+    monkeypatch.setattr(result_cache, 'STATS_FLUSH_SECONDS', 0)
+    cache.get('result')
+    assert other.stats()['hits'] == 1
+
+
+def test_evictions_are_counted(tmp_path, frame):
+    cache = DiskFrameCache(str(tmp_path / 'cache'), max_bytes=1)
+    cache.set('first', frame)
+    cache.set('second', frame)
+    assert not cache.has('first')
+    stats = DiskFrameCache(cache.directory, max_bytes=1).stats()
+    assert (stats['evictions'], stats['entries']) == (1, 1)
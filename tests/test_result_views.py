@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+from result_views import InvalidQueryError, query_mask, validate_query
+
+COLUMNS = ['source_table_name', 'total_batches_created', 'wait_milliseconds']
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'source_table_name': ['DB.ORDERS', 'DB.ITEMS', None, 'DB.ORDER_LINES'],
+        'total_batches_created': pd.array([1, 5, None, 10], dtype='Int64'),
+        'wait_milliseconds': pd.array([100, None, 3, 4], dtype='Int64'),
+    })
+
+
+# --- What a filter can't reach ---
+@pytest.mark.parametrize('expression', [
+    "__import__('os').system('true')",
+    "total_batches_created.__class__",
+    "source_table_name.str.__class__.__name__ == 'x'",
+    "len(source_table_name) > 1",
+    "print('x')",
+    "unknown_column > 1",
+    "total_batches_created.to_csv('/tmp/out.csv')",
+    "[x for x in source_table_name]",
+    "lambda: 1",
+    "total_batches_created if True else 1",
+    "source_table_name.str.contains(source_table_name)",
+    "source_table_name.str.contains('(a+)+$')",
+    "source_table_name.str.match('(\\\\w|\\\\d)*x')",
+    "source_table_name.str.fullmatch('(a)\\\\1')",
+    "source_table_name.str.contains('[')",
+    "source_table_name.str.contains('" + 'a' * 201 + "')",
+    "total_batches_created >",
+    "x" * 1001,
+])
+def test_rejected_expressions(expression):
+    with pytest.raises(InvalidQueryError):
+        validate_query(expression, COLUMNS)
+
+
+@pytest.mark.parametrize('expression', ["1", "True", "total_batches_created + 1", "source_table_name"])
+def test_non_boolean_results_are_rejected(frame, expression):
+    with pytest.raises(InvalidQueryError, match="condition"):
+        query_mask(frame, expression)
+
+
+def test_type_errors_are_rejected(frame):
+    with pytest.raises(InvalidQueryError, match="could not be applied"):
+        query_mask(frame, "source_table_name > 5")
+
+
+def test_literal_patterns_skip_the_regex_checks():
+    validate_query("source_table_name.str.contains('(a+)+', regex=False)", COLUMNS)
+
+
+# --- What a filter can do ---
+@pytest.mark.parametrize('expression, expected', [
+    ("total_batches_created.notna()", [True, True, False, True]),
+    ("source_table_name.str.contains('ORDER')", [True, False, False, True]),
+    ("source_table_name.str.contains('order', case=False)", [True, False, False, True]),
+    ("~source_table_name.str.contains('ITEM')", [True, False, True, True]),
+    ("source_table_name.str.startswith('DB.I')", [False, True, False, False]),
+    ("source_table_name.str.fullmatch('DB\\\\.[A-Z]+')", [True, True, False, False]),
+    ("source_table_name.isin(['DB.ITEMS', 'DB.ORDERS'])", [True, True, False, False]),
+    ("total_batches_created.between(2, 10)", [False, True, False, True]),
+    ("(total_batches_created > 1) & source_table_name.str.startswith('DB.O')", [False, False, False, True]),
+    ("(total_batches_created > 5) | (wait_milliseconds < 50)", [False, False, True, True]),
+    ("total_batches_created > 1 and source_table_name.str.contains('ORDER')", [False, False, False, True]),
+    ("total_batches_created * 2 >= wait_milliseconds", [False, False, False, True]),
+])
+def test_accepted_expressions(frame, expression, expected):
+    assert query_mask(frame, expression).tolist() == expected
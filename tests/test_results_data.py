@@ -0,0 +1,96 @@
+import os
+import tempfile
+import uuid
+import pandas as pd
+import pytest
+
+pytest.importorskip('flask')
+os.environ.setdefault('RESULT_CACHE_DIR', tempfile.mkdtemp(prefix='mon_test_cache_'))
+import app as web_app
+from result_views import store_views
+
+COLUMNS = ['source_table_name', 'total_batches_created', 'wait_milliseconds', 'last_successful_merge_time']
+
+
+@pytest.fixture
+def client():
+    """A test client whose session points at a cached result of six tables (one without total_batches_created)."""
+    df = pd.DataFrame({
+        'source_table_name': ['DB.ORDERS', 'DB.ITEMS', 'DB.SKIPPED', 'DB.ORDER_LINES', 'DB.USERS', 'DB.ORDERS_OLD'],
+        'total_batches_created': pd.array([5, 3, None, 8, 3, 1], dtype='Int64'),
+        'wait_milliseconds': pd.array([100, None, 7, 40, 2500, 100], dtype='Int64'),
+        'last_successful_merge_time': pd.to_datetime(['2024-05-01 10:00:00', None, None, '2024-05-01 09:00:00',
+                                                      '2024-05-02 00:00:00', '2024-04-30 00:00:00'], utc=True),
+    })
+    cache_key = f"test-{uuid.uuid4().hex}"
+    web_app.cache.set(cache_key, df)
+    store_views(web_app.cache, cache_key, df)
+    test_client = web_app.app.test_client()
+    with test_client.session_transaction() as session:
+        session['parsed_data_key'] = cache_key
+    return test_client
+
+
+def page(client, **params):
+    query = {'draw': 3, 'start': 0, 'length': 10, 'search[value]': ''}
+    query.update(params)
+    response = client.get('/results/data', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def names(result):
+    return [row[0] for row in result['data']]
+
+
+def test_first_page(client):
+    result = page(client)
+    assert (result['draw'], result['recordsTotal'], result['recordsFiltered']) == (3, 5, 5)
+    assert names(result) == ['DB.ORDERS', 'DB.ITEMS', 'DB.ORDER_LINES', 'DB.USERS', 'DB.ORDERS_OLD']
+    assert result['data'][0] == ['DB.ORDERS', 5, 100, '2024-05-01 10:00:00.000000+00:00']
+    assert result['data'][1][2:] == [None, None] # Missing values are null
+
+
+def test_paging(client):
+    result = page(client, start=2, length=2)
+    assert names(result) == ['DB.ORDER_LINES', 'DB.USERS']
+    assert (result['recordsTotal'], result['recordsFiltered']) == (5, 5)
+    assert names(page(client, start=4, length=2)) == ['DB.ORDERS_OLD']
+    assert names(page(client, start=10, length=2)) == []
+    assert len(page(client, start=1, length=-1)['data']) == 4 # -1: every row from start
+
+
+def test_search_counts_filtered_records(client):
+    result = page(client, **{'search[value]': 'order'}) # Case-insensitive substring of any column
+    assert names(result) == ['DB.ORDERS', 'DB.ORDER_LINES', 'DB.ORDERS_OLD']
+    assert (result['recordsTotal'], result['recordsFiltered']) == (5, 3)
+    assert names(page(client, **{'search[value]': '2500'})) == ['DB.USERS'] # Numbers are searched as text
+    assert names(page(client, **{'search[value]': '2024-05-01'})) == ['DB.ORDERS', 'DB.ORDER_LINES']
+    result = page(client, start=1, length=1, **{'search[value]': 'order'})
+    assert names(result) == ['DB.ORDER_LINES'] and result['recordsFiltered'] == 3
+    result = page(client, **{'search[value]': 'order', 'columns[0][searchable]': 'false'})
+    assert (names(result), result['recordsFiltered']) == ([], 0)
+
+
+def test_ordering(client):
+    by_wait = page(client, **{'order[0][column]': COLUMNS.index('wait_milliseconds'), 'order[0][dir]': 'desc'})
+    assert names(by_wait) == ['DB.USERS', 'DB.ORDERS', 'DB.ORDERS_OLD', 'DB.ORDER_LINES', 'DB.ITEMS'] # Missing last
+    by_batches_then_name = page(client, **{'order[0][column]': COLUMNS.index('total_batches_created'),
+                                           'order[0][dir]': 'asc', 'order[1][column]': 0, 'order[1][dir]': 'desc'})
+    assert names(by_batches_then_name) == ['DB.ORDERS_OLD', 'DB.USERS', 'DB.ITEMS', 'DB.ORDERS', 'DB.ORDER_LINES']
+    by_time = page(client, start=1, length=2, **{'order[0][column]': COLUMNS.index('last_successful_merge_time')})
+    assert names(by_time) == ['DB.ORDER_LINES', 'DB.ORDERS'] # Sorted on the timestamps, not their text
+
+
+def test_search_and_order_together(client):
+    result = page(client, **{'search[value]': 'order', 'order[0][column]': 0, 'order[0][dir]': 'asc'})
+    assert names(result) == ['DB.ORDERS', 'DB.ORDERS_OLD', 'DB.ORDER_LINES']
+    assert result['recordsFiltered'] == 3
+
+
+def test_expired_result(client):
+    with client.session_transaction() as session:
+        session['parsed_data_key'] = 'test-missing'
+    result = page(client)
+    assert (result['draw'], result['recordsTotal'], result['recordsFiltered'], result['data']) == (3, 0, 0, [])
+    assert 'expired' in result['error']
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+from conftest import execute_sql, fetch_all
+from mon_generator import box_line
+from pg_loader import load_dataframe
+from snapshots import (HISTORY_STAGE_TABLE, HISTORY_TABLE_NAME, NODE_COLUMN, TAG_COLUMNS, build_history,
+                       history_columns, history_insert_sql, history_schema, history_table_ddl)
+
+
+def write_capture(path, snapshots):
+    """A capture of timestamped snapshots: [(timestamp, {table: total_batches_created})]."""
+    lines = []
+    for timestamp, tables in snapshots:
+        lines.append(timestamp)
+        for table, batches in tables.items():
+            lines += [box_line(f'   "{table}": {{'), box_line(f'     "Total Batches Created": {batches},'), box_line('   },')]
+        lines.append('╰' + '─' * 40)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def append(df, dsn):
+    columns = history_columns(df)
+    return load_dataframe(df, dsn=dsn, table=HISTORY_STAGE_TABLE, columns=columns, truncate=False,
+                          setup_sql=history_table_ddl(), finish_sql=history_insert_sql(columns))
+
+
+def history_rows(dsn):
+    return fetch_all(dsn, f"SELECT node, source_table_name, to_char(snapshot_ts, 'HH24:MI'), total_batches_created, "
+                          "interval_seconds, total_batches_created_delta, total_batches_created_per_sec "
+                          f"FROM {HISTORY_TABLE_NAME} ORDER BY node, source_table_name, snapshot_ts")
+
+
+@pytest.fixture
+def history(scratch_database):
+    yield scratch_database
+    execute_sql(scratch_database, f"DROP TABLE IF EXISTS {HISTORY_TABLE_NAME}")
+
+
+def test_nodes_with_the_same_snapshot_time_are_kept_apart(tmp_path):
+    paths = [write_capture(tmp_path / node / 'mon.txt', [('2024-05-01T10:00:00Z', {'DB.S.A': batches}),
+                                                         ('2024-05-01T10:01:00Z', {'DB.S.A': batches + 6})])
+             for node, batches in (('n1', 10), ('n2', 100))]
+    df = build_history(paths, node_pattern=r'([^/]+)/mon\.txt$')
+    assert df[NODE_COLUMN].tolist() == ['n1', 'n1', 'n2', 'n2']
+    assert df['total_batches_created_delta'].tolist() == [pd.NA, 6, pd.NA, 6]
+
+    with pytest.raises(ValueError, match='--no-tags'):
+        build_history(paths, tag=False)
+
+
+def test_reloading_the_same_snapshots_adds_nothing(tmp_path, history):
+    path = write_capture(tmp_path / 'n1.txt', [('2024-05-01T10:00:00Z', {'DB.S.A': 1, 'DB.S.B': 5}),
+                                               ('2024-05-01T10:01:00Z', {'DB.S.A': 4, 'DB.S.B': 5})])
+    df = build_history([path])
+    assert append(df, history)['finish_rows'] == 4
+    before = history_rows(history)
+    result = append(df, history)
+    assert (result['rows'], result['finish_rows']) == (4, 0)
+    assert history_rows(history) == before
+
+
+def test_first_delta_is_taken_against_the_last_stored_row(tmp_path, history):
+    first = write_capture(tmp_path / 'n1_1000.txt', [('2024-05-01T10:00:00Z', {'DB.S.A': 10}),
+                                                     ('2024-05-01T10:01:00Z', {'DB.S.A': 40})])
+    append(build_history([first], node_pattern='(n1)'), history)
+    later = write_capture(tmp_path / 'n1_1002.txt', [('2024-05-01T10:03:00Z', {'DB.S.A': 100}),
+                                                     ('2024-05-01T10:04:00Z', {'DB.S.A': 7})]) # Restarted
+    append(build_history([later], node_pattern='(n1)'), history)
+    append(build_history([write_capture(tmp_path / 'n2.txt', [('2024-05-01T10:05:00Z', {'DB.S.A': 1})])]), history)
+
+    assert history_rows(history) == [
+        ('n1', 'DB.S.A', '10:00', 10, None, None, None),
+        ('n1', 'DB.S.A', '10:01', 40, 60.0, 30, 0.5),
+        ('n1', 'DB.S.A', '10:03', 100, 120.0, 60, 0.5), # Seeded from the 10:01 row
+        ('n1', 'DB.S.A', '10:04', 7, 60.0, 7, 7 / 60),
+        ('n2', 'DB.S.A', '10:05', 1, None, None, None), # Another node: no earlier row
+    ]
+
+
+def test_old_history_table_gets_the_node_key(tmp_path, history):
+    # As created before the node tags: no tag columns, primary key on (snapshot_ts, source_table_name)
+    columns = ",\n".join(f"{col} {sql_type}" for col, sql_type in history_schema().items() if col not in TAG_COLUMNS)
+    execute_sql(history, f"CREATE TABLE {HISTORY_TABLE_NAME} ({columns}, PRIMARY KEY (snapshot_ts, source_table_name))")
+    paths = [write_capture(tmp_path / f'{node}.txt', [('2024-05-01T10:00:00Z', {'DB.S.A': 1})]) for node in ('n1', 'n2')]
+    assert append(build_history(paths), history)['finish_rows'] == 2
+    assert [row[:2] for row in history_rows(history)] == [('n1', 'DB.S.A'), ('n2', 'DB.S.A')]
@@ -0,0 +1,85 @@
+import csv
+import io
+import pandas as pd
+import pytest
+from conftest import execute_sql, fetch_all, run_sql_files
+from sql_output import SQL_FORMAT_COPY_CSV, SQL_FORMAT_MULTI_INSERT, generate_sql_inserts, iter_copy_rows
+from table_schema import TABLE_NAME
+
+# Names that trip up the CSV format: NULL vs empty, quotes, delimiters, line breaks, end-of-data
+CSV_NAMES = [None, '', 'DB.PLAIN', 'say "hi"', '"', 'a,b', 'line\nbreak', 'cr\rlf\r\n', ' padded ', '\\.', '\\N']
+
+
+def names_frame(names):
+    return pd.DataFrame({
+        'source_table_name': pd.array(names, dtype=object),
+        'total_batches_created': pd.array(range(len(names)), dtype='Int64'),
+    })
+
+
+def copy_data(df, columns, csv=False):
+    return "".join(data for data, _, _ in iter_copy_rows(df, columns, csv))
+
+
+# --- copy_csv ---
+def test_csv_null_and_empty_string_differ():
+    data = copy_data(names_frame([None, '']), ['source_table_name', 'total_batches_created'], csv=True)
+    assert data == ',0\n"",1\n' # COPY's CSV format reads an unquoted empty value as NULL
+
+
+def test_csv_quoting():
+    columns = ['source_table_name']
+    assert copy_data(names_frame(['say "hi"', 'a,b', 'line\nbreak', 'cr\r', '\\.', 'DB.PLAIN']), columns, csv=True) == (
+        '"say ""hi"""\n"a,b"\n"line\nbreak"\n"cr\r"\n"\\."\nDB.PLAIN\n')
+
+
+def test_csv_round_trips_through_a_csv_reader():
+    data = copy_data(names_frame(CSV_NAMES), ['source_table_name', 'total_batches_created'], csv=True)
+    rows = list(csv.reader(io.StringIO(data, newline='')))
+    assert [row[0] for row in rows] == ['' if name is None else name for name in CSV_NAMES]
+    assert [int(row[1]) for row in rows] == list(range(len(CSV_NAMES)))
+
+
+def test_csv_script_wraps_the_data_in_copy():
+    script = generate_sql_inserts(names_frame(['a,b']), SQL_FORMAT_COPY_CSV)
+    assert script == (f"TRUNCATE TABLE {TABLE_NAME};\n"
+                      f"COPY {TABLE_NAME} (source_table_name, total_batches_created) FROM STDIN WITH (FORMAT csv);\n"
+                      '"a,b",0\n\\.\n')
+
+
+# --- copy_text and multi_insert escaping ---
+ESCAPE_NAMES = [None, 'tab\there', 'new\nline', 'back\\slash', "it's", '\\N', '']
+
+
+def test_copy_text_escapes():
+    data = copy_data(names_frame(ESCAPE_NAMES), ['source_table_name'])
+    assert data.split('\n')[:-1] == ['\\N', 'tab\\there', 'new\\nline', 'back\\\\slash', "it's", '\\\\N', '']
+
+
+def test_multi_insert_escapes():
+    script = generate_sql_inserts(names_frame(ESCAPE_NAMES), SQL_FORMAT_MULTI_INSERT)
+    values = script.split(' VALUES\n', 1)[1]
+    # Standard-conforming strings: only the quote is doubled, everything else is literal
+    assert values == ("(NULL, 0),\n('tab\there', 1),\n('new\nline', 2),\n('back\\slash', 3),\n"
+                      "('it''s', 4),\n('\\N', 5),\n('', 6);")
+
+
+@pytest.fixture
+def stats_table(scratch_database):
+    run_sql_files(scratch_database, 'dw_stats_table.sql')
+    yield scratch_database
+    execute_sql(scratch_database, f"DROP TABLE {TABLE_NAME}")
+
+
+@pytest.mark.parametrize('csv_format', [True, False], ids=['copy_csv', 'copy_text'])
+def test_copy_round_trips_through_postgres(stats_table, csv_format):
+    from pg_loader import load_dataframe
+    load_dataframe(names_frame(CSV_NAMES), dsn=stats_table, csv=csv_format)
+    rows = fetch_all(stats_table, f"SELECT source_table_name FROM {TABLE_NAME} ORDER BY total_batches_created")
+    assert [row[0] for row in rows] == CSV_NAMES
+
+
+def test_multi_insert_round_trips_through_postgres(stats_table):
+    execute_sql(stats_table, generate_sql_inserts(names_frame(ESCAPE_NAMES), SQL_FORMAT_MULTI_INSERT))
+    rows = fetch_all(stats_table, f"SELECT source_table_name FROM {TABLE_NAME} ORDER BY total_batches_created")
+    assert [row[0] for row in rows] == ESCAPE_NAMES
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from conftest import REPO_DIR
+
+try:
+    import resource
+except ImportError: # Windows: no getrusage
+    resource = None
+
+# --- Bounded-memory streaming (main.py --stream, single-worker web parse jobs) ---
+# A fresh interpreter parses generated mon output as it is generated (nothing on disk) and
+# reports its own peak RSS from getrusage. STREAM_TEST_MB=5120 runs the full 5 GB check.
+STREAM_TEST_MB = int(os.environ.get('STREAM_TEST_MB', 200))
+RSS_LIMIT_MB = 512
+BATCH_ROWS = 5000 # Small enough that even the default size goes through several batches
+
+_CHILD = r'''
+import json, os, resource, sys, tempfile
+from mon_generator import MonOutputGenerator
+from log_parser import iter_record_batches, EXTRA_FIELDS_COLUMN
+from sql_output import SQL_FORMAT_COPY_TEXT, iter_sql
+from result_cache import DiskFrameCache
+from result_views import store_batches
+
+target, size_mb, batch_rows = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+size = [0]
+
+def lines():
+    # About 7.5 KB per table; stop once size_mb were generated
+    for line in MonOutputGenerator(tables=10 ** 9, seed=1).iter_lines():
+        size[0] += len(line)
+        yield line
+        if size[0] >= size_mb * 1024 * 1024:
+            break
+
+batches = iter_record_batches(lines(), batch_rows)
+rows = 0
+if target == 'sql':
+    with open(os.devnull, 'w', encoding='utf-8') as sink:
+        for chunk in iter_sql(batches, SQL_FORMAT_COPY_TEXT):
+            sink.write(chunk)
+            rows += chunk.count('\n')
+else:
+    with tempfile.TemporaryDirectory() as directory:
+        rows = store_batches(DiskFrameCache(directory, max_bytes=1 << 40), 'result', batches,
+                             json_columns=[EXTRA_FIELDS_COLUMN])
+print(json.dumps({'bytes': size[0], 'rows': rows, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+'''
+
+
+@pytest.mark.skipif(resource is None or sys.platform == 'darwin', reason="needs getrusage with ru_maxrss in KB")
+@pytest.mark.parametrize('target', ['sql', 'cache'])
+def test_streaming_stays_under_rss_limit(target):
+    completed = subprocess.run([sys.executable, '-c', _CHILD, target, str(STREAM_TEST_MB), str(BATCH_ROWS)],
+                               cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    peak_mb = report['maxrss_kb'] / 1024
+    assert report['bytes'] >= STREAM_TEST_MB * 1024 * 1024
+    assert report['rows'] > 2 * BATCH_ROWS
+    assert peak_mb < RSS_LIMIT_MB, f"peak RSS {peak_mb:.0f} MB streaming {STREAM_TEST_MB} MB to {target}"